@@ -0,0 +1,103 @@
+import math
+import os
+import threading
+import time
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Longest a request waits for a slot before it is shed.
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.25"))
+MAX_RETRY_AFTER = 30
+# Weight of the newest request in the service time average.
+SERVICE_TIME_ALPHA = 0.1
+
+
+class RouteClass:
+    """Bounded concurrency for one class of routes, with a short bounded wait for a slot.
+
+    At most limit requests run at once. Up to max_queue more wait, each for at
+    most queue_timeout; anything beyond that is refused straight away, so a
+    slow backend costs callers a quick 503 instead of a stuck server thread.
+    """
+
+    def __init__(self, name, limit, max_queue=None, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue if max_queue is not None else max(1, limit // 2)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.service_time = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """True once a slot is held; False if the request should be shed."""
+        with self.condition:
+            if self.active < self.limit:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return False
+            deadline = time.monotonic() + self.queue_timeout
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        self.timed_out += 1
+                        return False
+                    self.condition.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed):
+        with self.condition:
+            self.active -= 1
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            self.condition.notify()
+
+    def retry_after(self):
+        """Whole seconds until the backlog ahead of a new request should have cleared."""
+        backlog = (self.active + self.waiting + 1) / self.limit
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(self.service_time * backlog)))
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'timed_out': self.timed_out,
+            'service_ms': round(self.service_time * 1000, 1)
+        }
+
+
+class AdmissionController:
+    """Maps endpoints to route classes.
+
+    Endpoints in exempt, such as health checks and long-lived event streams,
+    are never limited; endpoints not listed in routes share the 'default' class.
+    """
+
+    def __init__(self, classes, routes, exempt=()):
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self.routes = routes
+        self.exempt = frozenset(exempt)
+
+    def classify(self, endpoint):
+        if endpoint is None or endpoint in self.exempt:
+            return None
+        return self.classes.get(self.routes.get(endpoint, 'default'))
+
+    def stats(self):
+        return {name: route_class.stats() for name, route_class in self.classes.items()}
@@ -0,0 +1,249 @@
+import os
+import threading
+from array import array
+
+from clock import sync_clock
+
+
+SKETCH_DEPTH = 4
+USER_SKETCH_WIDTH = int(os.getenv("ANALYTICS_USER_WIDTH", "64"))
+TEAM_SKETCH_WIDTH = int(os.getenv("ANALYTICS_TEAM_WIDTH", "512"))
+TOP_K = int(os.getenv("ANALYTICS_TOP_K", "10"))
+
+DAY = 86400
+# Window name -> number of whole days it covers, today included.
+WINDOWS = {'day': 1, 'week': 7, 'month': 30}
+
+
+class CountMinSketch:
+    """Fixed-size approximate counter; estimates never undercount.
+
+    Sketches of the same shape are linear, so a window can drop a day by
+    subtracting that day's sketch.
+    """
+
+    __slots__ = ('width', 'rows')
+
+    def __init__(self, width, depth=SKETCH_DEPTH, typecode='I'):
+        self.width = width
+        self.rows = [array(typecode, bytes(width * array(typecode).itemsize)) for _ in range(depth)]
+
+    def cells(self, key):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(len(self.rows))]
+
+    def add(self, cells, count=1):
+        for row, cell in zip(self.rows, cells):
+            row[cell] += count
+
+    def estimate(self, cells):
+        return min(row[cell] for row, cell in zip(self.rows, cells))
+
+    def subtract(self, other):
+        for row, other_row in zip(self.rows, other.rows):
+            for cell, count in enumerate(other_row):
+                if count:
+                    row[cell] -= count
+
+    def nbytes(self):
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+
+class WindowedTopK:
+    """Day/week/month counts and top-k for one kind of key (artists or tracks).
+
+    Plays land in a per-day sketch and in one running sketch per window.
+    When days roll over, the days leaving a window are subtracted from it,
+    so neither recording nor reading ever scans history.
+    """
+
+    def __init__(self, width, k=TOP_K, day_typecode='I'):
+        self.width = width
+        self.k = k
+        self.day_typecode = day_typecode
+        self.days = {}
+        self.today = None
+        self.totals = {name: CountMinSketch(width) for name in WINDOWS if name != 'day'}
+        self.top = {name: {} for name in WINDOWS}
+        self.ranked = {}
+
+    def window_sketch(self, name):
+        if name == 'day':
+            return self.days.get(self.today)
+        return self.totals[name]
+
+    def advance(self, day):
+        if self.today is None:
+            self.today = day
+        while self.today < day:
+            self.today += 1
+            for name, span in WINDOWS.items():
+                expired = self.days.get(self.today - span)
+                if expired is not None and name in self.totals:
+                    self.totals[name].subtract(expired)
+                self.refresh(name)
+            self.days.pop(self.today - max(WINDOWS.values()), None)
+            if not self.days:
+                # Nothing left in any window; skip straight to the target day.
+                self.today = day
+
+    def refresh(self, name):
+        sketch = self.window_sketch(name)
+        top = self.top[name]
+        for key in list(top):
+            count = sketch.estimate(sketch.cells(key)) if sketch is not None else 0
+            if count:
+                top[key] = count
+            else:
+                del top[key]
+        self.ranked.pop(name, None)
+
+    def add(self, key, day):
+        self.advance(day)
+        sketch = self.days.get(self.today)
+        if sketch is None:
+            sketch = self.days[self.today] = CountMinSketch(self.width, typecode=self.day_typecode)
+        cells = sketch.cells(key)
+        sketch.add(cells)
+        for total in self.totals.values():
+            total.add(cells)
+
+        for name in WINDOWS:
+            count = self.window_sketch(name).estimate(cells)
+            top = self.top[name]
+            if key in top or len(top) < self.k:
+                top[key] = count
+            else:
+                weakest = min(top, key=top.get)
+                if count <= top[weakest]:
+                    continue
+                del top[weakest]
+                top[key] = count
+            self.ranked.pop(name, None)
+
+    def get(self, name, day):
+        self.advance(day)
+        ranked = self.ranked.get(name)
+        if ranked is None:
+            top = self.top[name]
+            ranked = self.ranked[name] = [
+                {'name': key, 'plays': top[key]} for key in sorted(top, key=top.get, reverse=True)
+            ]
+        return ranked
+
+    def nbytes(self):
+        return sum(s.nbytes() for s in self.days.values()) + sum(s.nbytes() for s in self.totals.values())
+
+
+class ListeningStats:
+    __slots__ = ('artists', 'tracks', 'plays')
+
+    def __init__(self, width, day_typecode):
+        self.artists = WindowedTopK(width, day_typecode=day_typecode)
+        self.tracks = WindowedTopK(width, day_typecode=day_typecode)
+        self.plays = 0
+
+
+class ListeningAnalytics:
+    """Streaming top artists and tracks per user and per Slack team.
+
+    Callers report what is playing as often as they see it; a play is
+    counted once per change of track for a given user and source. Team
+    plays are reported when a track is published to the team's Slack.
+    """
+
+    def __init__(self, clock=sync_clock.time, user_width=USER_SKETCH_WIDTH, team_width=TEAM_SKETCH_WIDTH):
+        self.clock = clock
+        self.user_width = user_width
+        self.team_width = team_width
+        self.users = {}
+        self.teams = {}
+        self.last = {}
+        self.lock = threading.Lock()
+
+    def day(self):
+        return int(self.clock() // DAY)
+
+    def record(self, table, key, width, artist, track, day):
+        stats = table.get(key)
+        if stats is None:
+            # One user plays well under 65536 tracks a day, so their day sketches use 16-bit cells.
+            stats = table[key] = ListeningStats(width, 'H' if table is self.users else 'I')
+        stats.artists.add(artist, day)
+        stats.tracks.add(f"{artist} – {track}", day)
+        stats.plays += 1
+
+    def is_new_play(self, scope, firebase_uid, source, artist, track):
+        play = (artist, track)
+        last = self.last.setdefault(firebase_uid, {})
+        if last.get((scope, source)) == play:
+            return False
+        last[(scope, source)] = play
+        return True
+
+    def record_play(self, firebase_uid, source, artist, track):
+        if not artist or not track:
+            return False
+        with self.lock:
+            if not self.is_new_play('user', firebase_uid, source, artist, track):
+                return False
+            self.record(self.users, firebase_uid, self.user_width, artist, track, self.day())
+            return True
+
+    def record_team_play(self, firebase_uid, team_ids, artist, track):
+        if not artist or not track or not team_ids:
+            return False
+        with self.lock:
+            if not self.is_new_play('team', firebase_uid, None, artist, track):
+                return False
+            day = self.day()
+            for team_id in team_ids:
+                self.record(self.teams, team_id, self.team_width, artist, track, day)
+            return True
+
+    def forget(self, firebase_uid):
+        with self.lock:
+            self.users.pop(firebase_uid, None)
+            self.last.pop(firebase_uid, None)
+
+    def top(self, table, key, window):
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window: {window}")
+        with self.lock:
+            stats = table.get(key)
+            if stats is None:
+                return {'window': window, 'total_plays': 0, 'artists': [], 'tracks': []}
+            day = self.day()
+            return {
+                'window': window,
+                'total_plays': stats.plays,
+                'artists': stats.artists.get(window, day),
+                'tracks': stats.tracks.get(window, day)
+            }
+
+    def user_top(self, firebase_uid, window='week'):
+        return self.top(self.users, firebase_uid, window)
+
+    def team_top(self, team_id, window='week'):
+        return self.top(self.teams, team_id, window)
+
+    def stats(self):
+        with self.lock:
+            user_bytes = sum(s.artists.nbytes() + s.tracks.nbytes() for s in self.users.values())
+            team_bytes = sum(s.artists.nbytes() + s.tracks.nbytes() for s in self.teams.values())
+            return {
+                'users': len(self.users),
+                'teams': len(self.teams),
+                'user_bytes': user_bytes,
+                'team_bytes': team_bytes,
+                'bytes_per_user': user_bytes // len(self.users) if self.users else 0
+            }
+
+
+def team_ids_for_user(user_data):
+    teams = set(user_data.get('slack_workspaces') or {})
+    team_id = (user_data.get('slack') or {}).get('team_id')
+    if team_id:
+        teams.add(team_id)
+    return sorted(teams)
@@ -1,30 +1,68 @@
-from flask import Flask, redirect, request, session, render_template, jsonify, render_template_string
+from flask import Flask, redirect, request, session, render_template, jsonify, render_template_string, g, Response, stream_with_context
 import os
-import requests
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
 import json
+import hashlib
 from flask_cors import CORS
 from datetime import datetime
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 import time
 import threading
+from profiler import SamplingProfiler, profile_workers
+from shutdown import Drainer
+from playback_state import PlaybackState, track_ends_at, staged_track, next_boundary
+from sessions import SessionTable, SyncError, decode_cursor, parse_error_filter
+from sinks import sinks_for_user, fan_out, FanOutError, validate_webhook_url, WEBHOOK_LIMIT
+from providers import SpotifyProvider, ExtensionProvider, PollScheduler, GOVERNOR_WAIT
+from governor import RateGovernor, Throttled
+from leases import LeaseStore, run_heartbeat
+from coalesce import UpdateCoalescer
+from conditional import VersionCounter, conditional, conditional_response
+from snapshots import PlaybackSnapshots, now_playing_json
+from lean_api import fetch_playback, spotify_errors
+from startup import startup, deferred, lazy_import, LAZY_STARTUP
+from user_store import UserStore
+from clock import sync_clock
+from reaper import Reaper, MemoryInspector
+from synclog import setup_logging, flush_logs, get_logger, log_stats, forget_log_budget
+from analytics import ListeningAnalytics, team_ids_for_user, WINDOWS
+from teamboard import BoardLog, TeamBoards, memberships
+from schedule import SyncSchedule, PresenceMonitor, ParkingLot, resume_at, ALL_DAYS
+from trackkey import track_key, cache_stats as track_key_stats
+from outbox import StatusOutbox, OutboxDispatcher
+from admission import AdmissionController, RouteClass, ADMISSION_ENABLED
+import socket
+from zoneinfo import ZoneInfoNotFoundError
+import signal
+import sys
 
 load_dotenv()
 
+setup_logging()
+log = get_logger("app")
+
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
 CORS(app, supports_credentials=True)
 
-cred = credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH"))
-firebase_admin.initialize_app(cred)
-
-db = firestore.client()
+@app.before_request
+def note_first_request():
+    startup.first_request()
+
+# The SDKs and Firebase credentials load on first use under LAZY_STARTUP, and
+# here otherwise; see startup.py. Nearly every route needs Firebase, so it
+# is pre-warmed first.
+firebase_admin = lazy_import("firebase_admin", early=True)
+credentials = lazy_import("firebase_admin.credentials", early=True)
+auth = lazy_import("firebase_admin.auth", early=True)
+firestore = lazy_import("firebase_admin.firestore", early=True)
+requests = lazy_import("requests")
+spotify_oauth = lazy_import("spotipy.oauth2")
+
+firebase_app = deferred("firebase_app", lambda: firebase_admin.initialize_app(
+    credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH"))), early=True)
+db = deferred("firestore_client", lambda: firestore.client(firebase_app.resolve()), early=True)
+user_store = UserStore(db)
 
 SLACK_CLIENT_ID = os.getenv("SLACK_CLIENT_ID")
 SLACK_CLIENT_SECRET = os.getenv("SLACK_CLIENT_SECRET")
@@ -43,14 +81,95 @@ FIREBASE_CONFIG = {
     "appId": os.getenv("FIREBASE_APP_ID")
 }
 
-existing_services = ["youtube", "apple_music", "spotify"]
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+leases = LeaseStore(
+    os.getenv("LEASE_DB_PATH", "leases.db"),
+    REPLICA_ID,
+    ttl=float(os.getenv("LEASE_TTL", "30"))
+)
+
+coalescer = UpdateCoalescer()
+listening = ListeningAnalytics()
+# Boards are served by every replica, so members syncing elsewhere reach them through the lease DB.
+team_boards = TeamBoards(log=BoardLog(os.getenv("LEASE_DB_PATH", "leases.db"), REPLICA_ID))
+presence = PresenceMonitor()
+parking = ParkingLot()
+
+# Versions of the in-memory session state behind the sync status endpoints.
+versions = VersionCounter()
+
+drainer = Drainer(
+    max_workers=int(os.getenv("SHUTDOWN_WORKERS", "16")),
+    rate=float(os.getenv("SHUTDOWN_RATE", "20")),
+    deadline=float(os.getenv("SHUTDOWN_DEADLINE", "30"))
+)
+drainer.register_flush(flush_logs)
+
+
+# Admission control
+
+# Routes that block on Firestore or Firebase Auth get a bounded number of
+# server threads per class; the rest are shed with a 503. Keep the sum of
+# limits and queues below the server's thread count so health checks and
+# event streams, which are never limited, always find a thread.
+ROUTE_CLASSES = {
+    'set_client_status': 'ingest',
+    'set_priority': 'ingest',
+    'get_user_status': 'ingest',
+    'verify_token': 'auth',
+    'extension_login': 'auth',
+    'slack_callback': 'auth',
+    'spotify_callback': 'auth',
+    'start_sync': 'sync',
+    'stop_sync': 'sync',
+    'get_sync_status': 'sync',
+    'list_active_syncs': 'sync',
+    'start_spotify_pull': 'sync',
+    'stop_spotify_pull': 'sync',
+    'spotify_pull_status_route': 'sync',
+}
+ADMISSION_EXEMPT = ['health_check', 'team_board_events', 'admin_drain', 'debug_memory', 'profile_sync_workers', 'static']
+
+admission = AdmissionController([
+    RouteClass('ingest', int(os.getenv("ADMISSION_INGEST_LIMIT", "16"))),
+    RouteClass('auth', int(os.getenv("ADMISSION_AUTH_LIMIT", "8"))),
+    RouteClass('sync', int(os.getenv("ADMISSION_SYNC_LIMIT", "8"))),
+    RouteClass('default', int(os.getenv("ADMISSION_DEFAULT_LIMIT", "8"))),
+], ROUTE_CLASSES, exempt=ADMISSION_EXEMPT)
+
+if ADMISSION_ENABLED:
+    @app.before_request
+    def admit_request():
+        route_class = admission.classify(request.endpoint)
+        if route_class is None:
+            return None
+        if not route_class.acquire():
+            response = jsonify({'error': 'Server is busy, try again shortly', 'success': False})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(route_class.retry_after())
+            return response
+        g.admitted = (route_class, time.monotonic())
+
+    @app.teardown_request
+    def release_request(exc):
+        admitted = g.pop('admitted', None)
+        if admitted is not None:
+            route_class, started = admitted
+            route_class.release(time.monotonic() - started)
 
 def verify_firebase_token(id_token):
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = auth.verify_id_token(id_token, app=firebase_app.resolve())
         return decoded_token
     except Exception as e:
-        print(f"Token verification failed: {e}")
+        log.warning("Token verification failed: %s", e)
         return None
 
 def require_auth(f):
@@ -63,44 +182,73 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def get_user_data(firebase_uid):
+SYNC_SETTINGS_FIELDS = ['priority', 'slack', 'slack_workspaces', 'webhooks', 'schedule']
+PULL_SETTINGS_FIELDS = ['priority', 'spotify.access_token', 'spotify.refresh_token', 'schedule']
+SINK_FIELDS = ['slack', 'slack_workspaces', 'webhooks']
+# Bumped with every write to what the account pages show, so any replica can answer a 304.
+PAGE_VERSION = 'page_version'
+PAGE_FIELDS = [
+    'last_login', 'slack.access_token', 'slack.user_id', 'slack.connected_at',
+    'spotify.access_token', 'spotify.connected_at', PAGE_VERSION
+]
+SETTINGS_REFRESH_SECONDS = 60
+
+def playback_fields():
+    return [f"last_{service}" for service in existing_services]
+
+def get_user_data(firebase_uid, fields=None):
     try:
-        user_ref = db.collection('users').document(firebase_uid)
-        user_doc = user_ref.get()
-        if user_doc.exists:
-            return user_doc.to_dict()
-        return {}
+        return user_store.get(firebase_uid, fields)
     except Exception as e:
-        print(f"Error getting user data: {e}")
+        log.error("Error getting user data: %s", e, extra={'uid': firebase_uid})
         return {}
 
 def update_user_data(firebase_uid, data):
     try:
-        user_ref = db.collection('users').document(firebase_uid)
-        user_ref.set(data, merge=True)
+        user_store.update(firebase_uid, data)
         return True
     except Exception as e:
-        print(f"Error updating user data: {e}")
+        log.error("Error updating user data: %s", e, extra={'uid': firebase_uid})
         return False
 
+def page_changed(data):
+    return {**data, PAGE_VERSION: firestore.Increment(1)}
+
+def read_settings(firebase_uid, settings_fields, cache):
+    now = sync_clock.time()
+    if cache.get('expires', 0) <= now:
+        cache['settings'] = get_user_data(firebase_uid, settings_fields)
+        cache['expires'] = now + SETTINGS_REFRESH_SECONDS
+    return cache['settings']
+
+def suspend_session(sync, kind, until, settings):
+    """Parks the worker until its schedule or presence allows it to run again."""
+    sync.set_suspended(until)
+    sync_clock.wait(parking.park((kind, sync.uid), until), until - sync_clock.time())
+    sync.set_suspended(None)
+    # The schedule may have changed while parked.
+    settings['expires'] = 0
+
 def get_user_tokens(firebase_uid):
     try:
-        user_ref = db.collection('users').document(firebase_uid)
-        user_doc = user_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
+        user_data = user_store.get(firebase_uid, ['slack.access_token', 'spotify.access_token', 'spotify.refresh_token'])
+        if user_data:
             slack_token = user_data.get('slack', {}).get('access_token')
             spotify_access_token = user_data.get('spotify', {}).get('access_token')
             spotify_refresh_token = user_data.get('spotify', {}).get('refresh_token')
             return slack_token, spotify_access_token, spotify_refresh_token
         return None, None, None
     except Exception as e:
-        print(f"Error getting user tokens: {e}")
+        log.error("Error getting user tokens: %s", e, extra={'uid': firebase_uid})
         return None, None, None
 
+# Every Spotify call made with this app's client_id shares one rate limit.
+spotify_governor = RateGovernor()
+
 def refresh_spotify_token(firebase_uid, refresh_token):
     try:
-        sp_oauth = SpotifyOAuth(
+        spotify_governor.acquire(GOVERNOR_WAIT)
+        sp_oauth = spotify_oauth.SpotifyOAuth(
             client_id=os.getenv("SPOTIPY_CLIENT_ID"),
             client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
             redirect_uri="127.0.0.1:8888/callback", #os.getenv("SPOTIPY_REDIRECT_URI"),
@@ -117,16 +265,27 @@ def refresh_spotify_token(firebase_uid, refresh_token):
         
         return new_access_token
     except Exception as e:
-        print(f"Error refreshing Spotify token: {e}")
+        log.error("Error refreshing Spotify token: %s", e, extra={'uid': firebase_uid, 'source': 'spotify'})
         return None
 
 
+playback_snapshots = PlaybackSnapshots()
+
+providers = {
+    "youtube": ExtensionProvider("youtube"),
+    "apple_music": ExtensionProvider("apple_music"),
+    "spotify": SpotifyProvider(refresh=refresh_spotify_token, snapshots=playback_snapshots, governor=spotify_governor)
+}
+
+existing_services = list(providers)
+
+
 # Slack Syncing
 
-sync_threads = {}
-sync_status = {}  
+sync_sessions = SessionTable()
+sync_sessions.on_change = lambda uid: versions.bump(uid, 'sync')
 
-def get_current_track_from_priority(user_data):
+def get_current_track_from_priority(user_data, now=None):
     priority_list = user_data.get("priority", {}).get("list", "")
     if not priority_list:
         return None
@@ -135,71 +294,144 @@ def get_current_track_from_priority(user_data):
     for service in services:
         field = f"last_{service.lower()}"
         if field in user_data and user_data[field]:
-            return user_data[field]
+            track = user_data[field]
+            if now is not None:
+                track = staged_track(track, now)
+                ends_at = track_ends_at(track)
+                if ends_at is not None and ends_at <= now:
+                    continue
+            return track
     return None
 
-def slack_sync_worker(firebase_uid):
+def outbox_result(firebase_uid, sink_name, error):
+    if error is None:
+        return
+    sync = sync_sessions.get(firebase_uid)
+    if sync is not None:
+        sync.set_error(SyncError.EXCEPTION, f"{sink_name}: {error}")
+        if sync.playback is not None:
+            # Queue the status again on the next loop instead of assuming it is shown.
+            sync.playback.reset()
+
+outbox_dispatcher = OutboxDispatcher(
+    StatusOutbox(os.getenv("OUTBOX_DB_PATH", "outbox.db")),
+    resolve=lambda firebase_uid: sinks_for_user(get_user_data(firebase_uid, SINK_FIELDS)),
+    on_result=outbox_result
+)
+outbox_dispatcher.start(lambda: True)
+
+def slack_sync_worker(firebase_uid, generation):
+    sync = sync_sessions.get(firebase_uid)
     slack_token, _, _ = get_user_tokens(firebase_uid)
     if not slack_token:
-        sync_status[firebase_uid]['active'] = False
-        sync_status[firebase_uid]['error'] = "No Slack token"
+        if sync.generation == generation:
+            sync.active = False
+            leases.release('slack', firebase_uid, only_own=True)
+        sync.set_error(SyncError.NO_SLACK_TOKEN)
         return
 
-    slack_client = WebClient(token=slack_token)
+    if sync.playback is None:
+        sync.playback = PlaybackState()
+    playback = sync.playback
+    playback.reset()
+    settings = {}
 
-    while sync_status.get(firebase_uid, {}).get('active', False):
+    while sync.active and sync.generation == generation and leases.owns('slack', firebase_uid):
         try:
-            user_data = get_user_data(firebase_uid)
+            user_settings = read_settings(firebase_uid, SYNC_SETTINGS_FIELDS, settings)
+            schedule = SyncSchedule.from_user(user_settings)
+            slack = user_settings.get('slack') or {}
+            if schedule and schedule.presence and slack.get('user_id'):
+                presence.watch(firebase_uid, slack.get('access_token'), slack.get('team_id'), slack['user_id'])
+            else:
+                presence.unwatch(firebase_uid)
+            until = resume_at(schedule, presence, firebase_uid, sync_clock.time())
+            if until is not None:
+                team_boards.clear_user(firebase_uid)
+                suspend_session(sync, 'slack', until, settings)
+                continue
+
+            user_data = {**user_settings, **get_user_data(firebase_uid, playback_fields())}
             if not user_data:
-                sync_status[firebase_uid]['error'] = "User not found"
-                time.sleep(10)
+                sync.set_error(SyncError.USER_NOT_FOUND)
+                sync_clock.sleep(10)
                 continue
 
-            track = get_current_track_from_priority(user_data)
+            now = sync_clock.time()
+            track = get_current_track_from_priority(user_data, now)
             if not track:
-                sync_status[firebase_uid]['error'] = "No track found"
-                time.sleep(10)
+                if playback.should_clear():
+                    outbox_dispatcher.submit(firebase_uid, sinks_for_user(user_data),
+                                             {"uid": firebase_uid, "text": "", "emoji": "", "expiration": 0, "track": None})
+                playback.should_write(None, None, now)
+                team_boards.clear_user(firebase_uid)
+                sync.set_error(SyncError.NO_TRACK)
+                sync_clock.sleep(10)
                 continue
 
             status_text = f"{track['artist']} – {track['name']}"
-            slack_client.users_profile_set(profile={
-                "status_text": status_text,
-                "status_emoji": ":musical_note:",
-                "status_expiration": 0
-            })
-
-            sync_status[firebase_uid]['current_song'] = status_text
-            sync_status[firebase_uid]['last_update'] = datetime.now().isoformat()
-            sync_status[firebase_uid]['error'] = None
-            time.sleep(15)
+            key = track_key(track['artist'], track['name'])
+            predicted = track.get('predicted', False)
+            expiration = playback.should_write(status_text, track_ends_at(track), now, key, predicted)
+            if expiration is not None:
+                sinks = sinks_for_user(user_data)
+                # Delivery and its retries happen on the outbox workers.
+                outbox_dispatcher.submit(firebase_uid, sinks, {
+                    "uid": firebase_uid,
+                    "text": status_text,
+                    "emoji": ":musical_note:",
+                    "expiration": expiration,
+                    "track": {"name": track['name'], "artist": track['artist']}
+                })
+                playback.written(status_text, expiration, key, predicted)
+                sync.current_song = status_text
+                sync.last_update = sync_clock.time()
+                listening.record_team_play(firebase_uid, team_ids_for_user(user_data), track['artist'], track['name'])
+                for team_id, member_id in memberships(user_data):
+                    team_boards.update(team_id, member_id, firebase_uid,
+                                       {"name": track['name'], "artist": track['artist']}, status_text)
+                log.info("Status queued", extra={'uid': firebase_uid, 'sink': ",".join(sink.name for sink in sinks)})
+
+            sync.set_error(SyncError.NONE)
+            # With a queued track staged, wake up right at its predicted start.
+            boundary = next_boundary(track, sync_clock.time())
+            sync_clock.sleep(min(15, boundary) if boundary is not None else 15)
 
         except Exception as e:
-            sync_status[firebase_uid]['error'] = str(e)
-            sync_status[firebase_uid]['error_count'] = sync_status[firebase_uid].get('error_count', 0) + 1
-            time.sleep(10)
+            sync.set_error(SyncError.EXCEPTION, str(e))
+            sync_clock.sleep(10)
+
+    if sync.generation == generation:
+        sync.active = False
+        # Otherwise renew_all would keep a lease with nothing behind it.
+        leases.release('slack', firebase_uid, only_own=True)
+        team_boards.clear_user(firebase_uid)
+        presence.unwatch(firebase_uid)
+
+def launch_sync(firebase_uid):
+    sync = sync_sessions.ensure(firebase_uid)
+    sync.generation += 1
+    sync.active = True
+    sync.current_song = None
+    sync.last_update = 0.0
+    sync.error_count = 0
+    sync.set_error(SyncError.NONE)
+
+    sync.thread = sync_clock.spawn(slack_sync_worker, sync.uid, sync.generation)
 
 @app.route('/sync/slack/start/<firebase_uid>', methods=['POST'])
 def start_sync(firebase_uid):
+    if not drainer.accepting:
+        return jsonify({'error': 'Server is shutting down', 'success': False}), 503
     try:
         slack_token, _, _ = get_user_tokens(firebase_uid)
         if not slack_token:
             return jsonify({"error": "Slack account not connected", "success": False}), 400
 
-        if firebase_uid in sync_status:
-            sync_status[firebase_uid]['active'] = False
-            time.sleep(1)
-
-        sync_status[firebase_uid] = {
-            'active': True,
-            'current_song': None,
-            'last_update': None,
-            'error': None,
-            'error_count': 0
-        }
+        if not leases.acquire('slack', firebase_uid):
+            return jsonify({'error': 'Slack sync is running on another replica', 'success': False}), 409
 
-        thread = threading.Thread(target=slack_sync_worker, args=(firebase_uid,), daemon=True)
-        thread.start()
-        sync_threads[firebase_uid] = thread
+        launch_sync(firebase_uid)
 
         return jsonify({'success': True, 'message': f'Slack sync started for {firebase_uid}'})
     except Exception as e:
@@ -208,8 +440,11 @@ def start_sync(firebase_uid):
 @app.route('/sync/slack/stop/<firebase_uid>', methods=['POST'])
 def stop_sync(firebase_uid):
     try:
-        if firebase_uid in sync_status:
-            sync_status[firebase_uid]['active'] = False
+        sync = sync_sessions.get(firebase_uid)
+        if sync:
+            sync.active = False
+        parking.wake(('slack', firebase_uid))
+        leases.release('slack', firebase_uid)
         return jsonify({'success': True, 'message': f'Slack sync stopped for {firebase_uid}'})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
@@ -217,18 +452,260 @@ def stop_sync(firebase_uid):
 @app.route('/sync/slack/status/<firebase_uid>', methods=['GET'])
 def get_sync_status(firebase_uid):
     try:
-        status = sync_status.get(firebase_uid, {})
-        running = firebase_uid in sync_threads and sync_threads[firebase_uid].is_alive()
+        sync = sync_sessions.get(firebase_uid)
+        if sync is None:
+            return jsonify({
+                'running': False,
+                'active': False,
+                'current_song': None,
+                'last_update': None,
+                'error': None,
+                'error_count': 0
+            })
+        return conditional_response(versions, firebase_uid, 'sync', lambda: jsonify(sync.to_json()),
+                                    vary=str(sync.running()))
+    except Exception as e:
+        return jsonify({'error': str(e), 'running': False}), 500
+
+@app.route('/sync/list', methods=['GET'])
+def list_active_syncs():
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        error = parse_error_filter(request.args.get('error'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Invalid limit, error filter or cursor'}), 400
+    try:
+        page, next_cursor = sync_sessions.page(limit, after, error)
         return jsonify({
-            'running': running,
-            'active': status.get('active', False),
-            'current_song': status.get('current_song'),
-            'last_update': status.get('last_update'),
-            'error': status.get('error'),
-            'error_count': status.get('error_count', 0)
+            'active_syncs': {sync.uid: sync.summary_json() for sync in page},
+            'total_active': sync_sessions.stats()['active'],
+            'next_cursor': next_cursor
         })
     except Exception as e:
-        return jsonify({'error': str(e), 'running': False}), 500
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    stats = sync_sessions.stats()
+    return jsonify({
+        'status': 'healthy',
+        'active_syncs': stats['active'],
+        'erroring_syncs': stats['erroring'],
+        'sessions': stats,
+        'client_updates': coalescer.stats(),
+        'spotify_budget': spotify_governor.stats(),
+        'admission': admission.stats(),
+        'outbox': outbox_dispatcher.stats(),
+        'track_keys': track_key_stats(),
+        'logging': log_stats(),
+        'listening': listening.stats(),
+        'team_boards': team_boards.stats(),
+        'suspended': {**parking.stats(), 'presence_calls': presence.calls},
+        'reaper': reaper.stats(),
+        'startup': startup.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+# Shutdown
+
+def clear_slack_status(firebase_uid):
+    """Returns a drain job that clears the user's status on every sink.
+
+    A retry only goes to the sinks that failed before, and a rate-limited
+    sink's Retry-After reaches the Drainer through FanOutError.
+    """
+    status = {"uid": firebase_uid, "text": "", "emoji": "", "expiration": 0, "track": None}
+    pending = []
+
+    def job():
+        if not pending:
+            pending.extend(sinks_for_user(get_user_data(firebase_uid, SINK_FIELDS)))
+        results = fan_out(pending, status)
+        errors = {name: error for name, error in results.items() if error is not None}
+        pending[:] = [sink for sink in pending if sink.name in errors]
+        if errors:
+            raise FanOutError(errors)
+
+    return job
+
+def drain_sessions(deadline=None):
+    jobs = {}
+    for sync in sync_sessions:
+        if sync.active:
+            sync.active = False
+            # A queued status must not land after the clear.
+            outbox_dispatcher.discard(sync.uid)
+            jobs[sync.uid] = clear_slack_status(sync.uid)
+        sync.pulling = False
+    parking.wake_all()
+
+    report = drainer.drain(jobs, deadline)
+    log.info("Drain finished in %ss: %d cleared, %d failed, %d left undone", report['elapsed'],
+             len(report['restored']), len(report['failed']), len(report['pending']))
+    return report
+
+@app.route('/admin/drain', methods=['POST'])
+def admin_drain():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        deadline = request.args.get('deadline')
+        report = drain_sessions(float(deadline) if deadline else None)
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def handle_sigterm(signum, frame):
+    drain_sessions()
+    sys.exit(0)
+
+
+# Profiling
+
+def profiling_authorized(token):
+    return bool(PROFILING_TOKEN) and token == PROFILING_TOKEN
+
+# The hooks are only registered when profiling is enabled, so a normal
+# deployment runs exactly the same request path as before.
+if PROFILING_ENABLED:
+    @app.before_request
+    def start_request_profile():
+        if profiling_authorized(request.headers.get('X-Profile')):
+            g.profiler = SamplingProfiler(thread_ids=[threading.get_ident()]).start()
+
+    @app.after_request
+    def finish_request_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            profiler.stop()
+            output = profiler.write(PROFILE_DIR, request.endpoint or "request")
+            response.headers['X-Profile-Collapsed'] = output['collapsed']
+            response.headers['X-Profile-Speedscope'] = output['speedscope']
+        return response
+
+    @app.route('/debug/profile/workers', methods=['POST'])
+    def profile_sync_workers():
+        if not profiling_authorized(request.headers.get('X-Profile')):
+            return jsonify({'error': 'Unauthorized'}), 403
+        try:
+            seconds = min(float(request.args.get('seconds', 10)), 300)
+            output = profile_workers(seconds, PROFILE_DIR)
+            return jsonify({'success': True, **output})
+        except Exception as e:
+            return jsonify({'error': str(e), 'success': False}), 500
+
+
+# Replicas
+
+def adopt_session(kind, firebase_uid):
+    log.info("Replica %s took over %s session", REPLICA_ID, kind, extra={'uid': firebase_uid, 'kind': kind})
+    if kind == 'slack':
+        launch_sync(firebase_uid)
+    elif kind == 'spotify':
+        launch_pull(firebase_uid)
+
+threading.Thread(
+    target=run_heartbeat,
+    args=(leases, adopt_session, lambda: drainer.accepting),
+    name="lease_heartbeat",
+    daemon=True
+).start()
+threading.Thread(
+    target=team_boards.log.run,
+    args=(team_boards, lambda: True),
+    name="board_sync",
+    daemon=True
+).start()
+
+
+# Schedules
+
+threading.Thread(target=parking.run, args=(lambda: True,), name="parking", daemon=True).start()
+threading.Thread(target=presence.run, args=(lambda: drainer.accepting,), name="presence", daemon=True).start()
+
+@app.route('/api/schedule', methods=['GET', 'POST'])
+@require_auth
+def sync_schedule():
+    firebase_uid = session['firebase_uid']
+    if request.method == 'GET':
+        schedule = SyncSchedule.from_user(get_user_data(firebase_uid, ['schedule']))
+        return jsonify({'schedule': schedule.to_json() if schedule else None})
+
+    data = request.get_json() or {}
+    try:
+        schedule = SyncSchedule(
+            tz=data.get('tz') or "UTC",
+            days=data.get('days') or ALL_DAYS,
+            quiet_start=data.get('quiet_start'),
+            quiet_end=data.get('quiet_end'),
+            presence=data.get('presence', False)
+        ) if data else None
+    except (ValueError, TypeError, ZoneInfoNotFoundError) as e:
+        return jsonify({'error': f"Invalid schedule: {e}"}), 400
+
+    if not update_user_data(firebase_uid, {'schedule': schedule.to_json() if schedule else None}):
+        return jsonify({'error': 'Failed to save schedule'}), 500
+    parking.wake(('slack', firebase_uid))
+    parking.wake(('spotify', firebase_uid))
+    return jsonify({'success': True, 'schedule': schedule.to_json() if schedule else None})
+
+
+# Webhooks
+
+@app.route('/api/webhooks', methods=['GET', 'POST'])
+@require_auth
+def webhook_settings():
+    firebase_uid = session['firebase_uid']
+    if request.method == 'GET':
+        webhooks = get_user_data(firebase_uid, ['webhooks']).get('webhooks') or []
+        # Secrets are write-only.
+        return jsonify({'webhooks': [{'url': w.get('url'), 'has_secret': bool(w.get('secret'))} for w in webhooks]})
+
+    webhooks = (request.get_json() or {}).get('webhooks')
+    if not isinstance(webhooks, list) or len(webhooks) > WEBHOOK_LIMIT:
+        return jsonify({'error': f"webhooks must be a list of at most {WEBHOOK_LIMIT} entries"}), 400
+    saved = []
+    for webhook in webhooks:
+        if not isinstance(webhook, dict) or not isinstance(webhook.get('secret') or "", str):
+            return jsonify({'error': "Each webhook must be an object with a url and an optional secret"}), 400
+        try:
+            validate_webhook_url(webhook.get('url'))
+        except ValueError as e:
+            return jsonify({'error': f"Invalid webhook {webhook.get('url')!r}: {e}"}), 400
+        saved.append({'url': webhook['url'], 'secret': webhook.get('secret') or None})
+
+    if not update_user_data(firebase_uid, {'webhooks': saved}):
+        return jsonify({'error': 'Failed to save webhooks'}), 500
+    return jsonify({'success': True, 'webhooks': [{'url': w['url'], 'has_secret': bool(w['secret'])} for w in saved]})
+
+
+# Reaping
+
+def forget_user_caches(firebase_uid):
+    for source in providers:
+        coalescer.forget(firebase_uid, source)
+    playback_snapshots.forget(firebase_uid)
+    providers['spotify'].forget(firebase_uid)
+    presence.unwatch(firebase_uid)
+    team_boards.clear_user(firebase_uid)
+    versions.forget(firebase_uid)
+
+reaper = Reaper(sync_sessions, forget_hooks=[forget_user_caches, listening.forget, forget_log_budget])
+memory_inspector = MemoryInspector()
+if os.getenv("MEMORY_TRACE", "0") == "1":
+    memory_inspector.start()
+
+threading.Thread(target=reaper.run, args=(lambda: drainer.accepting,), name="reaper", daemon=True).start()
+
+@app.route('/debug/memory', methods=['GET'])
+def debug_memory():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 403
+    limit = min(int(request.args.get('limit', 20)), 200)
+    return jsonify({**memory_inspector.report(limit), 'sessions': len(sync_sessions), 'reaper': reaper.stats()})
 
 
 # Pages
@@ -237,17 +714,33 @@ def get_sync_status(firebase_uid):
 def index():
     return render_template('login.html', firebase_config=json.dumps(FIREBASE_CONFIG))
 
+template_digests = {}
+
+def account_page(template, user_data, **context):
+    """Renders an account page behind an ETag of the user's page_version; 304 when it still matches.
+
+    The tag also covers the template source, so a deploy that changes the
+    page does not leave browsers on the old one.
+    """
+    digest = template_digests.get(template)
+    if digest is None:
+        source = app.jinja_env.loader.get_source(app.jinja_env, template)[0]
+        digest = template_digests[template] = hashlib.sha256(source.encode()).hexdigest()[:8]
+    email = hashlib.sha256((context.get('user_email') or "").encode()).hexdigest()[:8]
+    etag = f"page-{digest}-{user_data.get(PAGE_VERSION, 0)}-{email}"
+    return conditional(etag, lambda: render_template(template, **context))
+
 @app.route("/linked-accounts")
 @require_auth
 def linked_accounts():
     firebase_uid = session['firebase_uid']
     
-    user_data = get_user_data(firebase_uid)
+    user_data = get_user_data(firebase_uid, PAGE_FIELDS)
     
     slack_data = user_data.get('slack', {})
     spotify_data = user_data.get('spotify', {})
     
-    return render_template('linked_accounts.html',
+    return account_page('linked_accounts.html', user_data,
                          user_email=session.get('user_email'),
                          firebase_uid=firebase_uid,
                          last_login=user_data.get('last_login'),
@@ -261,13 +754,14 @@ def linked_accounts():
 @require_auth
 def dashboard():
     firebase_uid = session['firebase_uid']
-    user_data = get_user_data(firebase_uid)
+    user_data = get_user_data(firebase_uid, PAGE_FIELDS)
 
     slack_data = user_data.get('slack', {})
     spotify_data = user_data.get('spotify', {})
 
-    return render_template(
+    return account_page(
         'dashboard.html',
+        user_data,
         user_email=session.get('user_email'),
         firebase_uid=firebase_uid,
         slack_connected=bool(slack_data.get('access_token')),
@@ -416,7 +910,7 @@ def verify_token():
                 'last_login': firestore.SERVER_TIMESTAMP,
                 'display_name': decoded_token.get('name', ''),
             }
-            update_user_data(decoded_token['uid'], user_data)
+            update_user_data(decoded_token['uid'], page_changed(user_data))
             
             return jsonify({"success": True})
         else:
@@ -436,7 +930,7 @@ def slack_login():
     auth_url = (
         "https://slack.com/oauth/v2/authorize"
         f"?client_id={SLACK_CLIENT_ID}"
-        f"&user_scope=users.profile:read,users.profile:write"
+        f"&user_scope=users.profile:read,users.profile:write,users:read,dnd:read"
         f"&redirect_uri={SLACK_REDIRECT_URI}"
     )
     return redirect(auth_url)
@@ -471,6 +965,8 @@ def slack_callback():
         
         slack_user_id = None
         slack_access_token = None
+        slack_team_id = resp_data.get("team", {}).get("id")
+        slack_team_name = resp_data.get("team", {}).get("name")
         
         if "authed_user" in resp_data:
             authed_user = resp_data["authed_user"]
@@ -491,11 +987,21 @@ def slack_callback():
         slack_data = {
             'slack': {
                 'user_id': slack_user_id,
+                'team_id': slack_team_id,
                 'access_token': slack_access_token,
                 'connected_at': firestore.SERVER_TIMESTAMP
             }
         }
-        update_user_data(firebase_uid, slack_data)
+        if slack_team_id:
+            slack_data['slack_workspaces'] = {
+                slack_team_id: {
+                    'user_id': slack_user_id,
+                    'team_name': slack_team_name,
+                    'access_token': slack_access_token,
+                    'connected_at': firestore.SERVER_TIMESTAMP
+                }
+            }
+        update_user_data(firebase_uid, page_changed(slack_data))
         
         return "Slack linked successfully! <a href='/linked-accounts'>Return to Linked Accounts</a>"
         
@@ -508,9 +1014,10 @@ def slack_disconnect():
     firebase_uid = session['firebase_uid']
     
     user_ref = db.collection('users').document(firebase_uid)
-    user_ref.update({
-        'slack': firestore.DELETE_FIELD
-    })
+    user_ref.update(page_changed({
+        'slack': firestore.DELETE_FIELD,
+        'slack_workspaces': firestore.DELETE_FIELD
+    }))
     
     return redirect('/linked-accounts')
 
@@ -560,7 +1067,7 @@ def spotify_callback():
                 'connected_at': firestore.SERVER_TIMESTAMP
             }
         }
-        update_user_data(firebase_uid, spotify_data)
+        update_user_data(firebase_uid, page_changed(spotify_data))
 
         return "Spotify linked successfully! <a href='/linked-accounts'>Return to Linked Accounts</a>"
         
@@ -573,17 +1080,17 @@ def spotify_disconnect():
     firebase_uid = session['firebase_uid']
     
     user_ref = db.collection('users').document(firebase_uid)
-    user_ref.update({
+    user_ref.update(page_changed({
         'spotify': firestore.DELETE_FIELD
-    })
+    }))
     
     return redirect('/linked-accounts')
 
 @app.route("/api/user/tokens")
 @require_auth
-def get_user_tokens():
+def user_tokens_overview():
     firebase_uid = session['firebase_uid']
-    user_data = get_user_data(firebase_uid)
+    user_data = get_user_data(firebase_uid, ['slack.user_id', 'slack.access_token', 'spotify.access_token'])
     
     return jsonify({
         'slack': {
@@ -598,61 +1105,150 @@ def get_user_tokens():
 
 # Spotify Pull
 
-spotify_pull_status = {}
-spotify_threads = {}
-
 def spotify_pull_worker(firebase_uid):
-    spotify_pull_status[firebase_uid] = True
+    sync = sync_sessions.ensure(firebase_uid)
 
-    _, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
-    sp = spotipy.Spotify(auth=spotify_token)
+    def store(source, song_data):
+        update_user_data(firebase_uid, {f"last_{source}": song_data})
+        if song_data.get('is_playing'):
+            listening.record_play(firebase_uid, source, song_data.get('artist'), song_data.get('name'))
+
+    scheduler = PollScheduler(firebase_uid, providers, store)
+    settings = {}
 
-    while spotify_pull_status.get(firebase_uid, False):
+    while sync.pulling and leases.owns('spotify', firebase_uid):
+        delay = 30
         try:
-            playback = sp.current_playback()
-            if playback and playback.get("is_playing"):
-                track = playback["item"]
-                if track:
-                    song_data = {
-                        "name": track["name"],
-                        "artist": ", ".join(a["name"] for a in track["artists"]),
-                        "updated": datetime.now().isoformat()
-                    }
-                    update_user_data(firebase_uid, {"last_spotify": song_data})
-        except spotipy.exceptions.SpotifyException as e:
-            if e.http_status == 401:
-                new_token = refresh_spotify_token(firebase_uid, spotify_refresh_token)
-                if new_token:
-                    sp = spotipy.Spotify(auth=new_token)
-                else:
-                    print(f"Spotify token refresh failed for {firebase_uid}")
-            else:
-                print(f"Spotify API error for {firebase_uid}: {e}")
+            user_settings = read_settings(firebase_uid, PULL_SETTINGS_FIELDS, settings)
+            until = resume_at(SyncSchedule.from_user(user_settings), presence, firebase_uid, sync_clock.time())
+            if until is not None:
+                suspend_session(sync, 'spotify', until, settings)
+                continue
+            user_data = {**user_settings, **get_user_data(firebase_uid, playback_fields())}
+            if user_data:
+                delay = scheduler.poll_once(user_data)
         except Exception as e:
-            print(f"Spotify pull error for {firebase_uid}: {e}")
+            log.error("Pull error: %s", e, extra={'uid': firebase_uid})
+
+        sync_clock.sleep(min(delay, 30))
 
-        time.sleep(30)
+    sync.pulling = False
+    leases.release('spotify', firebase_uid, only_own=True)
+    spotify_governor.forget(firebase_uid)
+    log.info("Spotify pull stopped", extra={'uid': firebase_uid, 'source': 'spotify'})
 
-    print(f"Spotify pull stopped for {firebase_uid}")
+def launch_pull(firebase_uid):
+    sync = sync_sessions.ensure(firebase_uid)
+    if not sync.pulling:
+        sync.pulling = True
+        sync.pull_thread = sync_clock.spawn(spotify_pull_worker, sync.uid)
 
 @app.route('/spotify/pull/start/<firebase_uid>', methods=['POST'])
 def start_spotify_pull(firebase_uid):
-    if not spotify_pull_status.get(firebase_uid, False):
-        spotify_pull_status[firebase_uid] = True
-        t = threading.Thread(target=spotify_pull_worker, args=(firebase_uid,), daemon=True)
-        t.start()
-        spotify_threads[firebase_uid] = t
+    if not drainer.accepting:
+        return jsonify({'error': 'Server is shutting down', 'success': False}), 503
+    if not leases.acquire('spotify', firebase_uid):
+        return jsonify({'error': 'Spotify pulling is running on another replica', 'success': False}), 409
+    launch_pull(firebase_uid)
     return jsonify({'success': True, 'message': 'Spotify pulling started'})
 
 @app.route('/spotify/pull/stop/<firebase_uid>', methods=['POST'])
 def stop_spotify_pull(firebase_uid):
-    spotify_pull_status[firebase_uid] = False
+    sync = sync_sessions.get(firebase_uid)
+    if sync:
+        sync.pulling = False
+    parking.wake(('spotify', firebase_uid))
+    leases.release('spotify', firebase_uid)
     return jsonify({'success': True, 'message': 'Spotify pulling stopped'})
 
 @app.route('/spotify/pull/status/<firebase_uid>', methods=['GET'])
 def spotify_pull_status_route(firebase_uid):
-    active = spotify_pull_status.get(firebase_uid, False)
-    return jsonify({'success': True, 'pulling': active})
+    sync = sync_sessions.get(firebase_uid)
+    return conditional_response(versions, firebase_uid, 'sync',
+                                lambda: jsonify({'success': True, 'pulling': bool(sync and sync.pulling)}))
+
+def fetch_spotify_playback(firebase_uid):
+    _, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
+    if not spotify_token:
+        raise LookupError("No Spotify token found")
+    try:
+        return providers['spotify'].call(fetch_playback, spotify_token)
+    except spotify_errors.SpotifyException as e:
+        if e.http_status != 401:
+            raise
+        new_token = refresh_spotify_token(firebase_uid, spotify_refresh_token)
+        if not new_token:
+            raise PermissionError("Unable to refresh token")
+        return providers['spotify'].call(fetch_playback, new_token)
+
+@app.route('/spotify/now/<firebase_uid>', methods=['GET'])
+def get_current_spotify_track(firebase_uid):
+    try:
+        sync_sessions.ensure(firebase_uid)
+        playback = playback_snapshots.get(firebase_uid, lambda: fetch_spotify_playback(firebase_uid))
+        return jsonify(now_playing_json(playback))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 401
+    except Throttled as e:
+        return jsonify({'error': str(e)}), 503, e.headers
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Analytics
+
+@app.route('/api/analytics/top', methods=['GET'])
+@require_auth
+def listening_top():
+    firebase_uid = session['firebase_uid']
+    window = request.args.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    return jsonify(listening.user_top(firebase_uid, window))
+
+@app.route('/api/analytics/team/<team_id>', methods=['GET'])
+@require_auth
+def listening_team_top(team_id):
+    firebase_uid = session['firebase_uid']
+    window = request.args.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    if team_id not in team_ids_for_user(get_user_data(firebase_uid, ['slack.team_id', 'slack_workspaces'])):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(listening.team_top(team_id, window))
+
+
+# Team board
+
+def require_team_member(firebase_uid, team_id):
+    return team_id in team_ids_for_user(get_user_data(firebase_uid, ['slack.team_id', 'slack_workspaces']))
+
+@app.route('/team/<team_id>')
+@require_auth
+def team_board(team_id):
+    if not require_team_member(session['firebase_uid'], team_id):
+        return "Error: Not a member of this workspace", 403
+    return render_template('team_board.html', team_id=team_id, user_email=session.get('user_email'))
+
+@app.route('/team/<team_id>/board', methods=['GET'])
+@require_auth
+def team_board_snapshot(team_id):
+    if not require_team_member(session['firebase_uid'], team_id):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return Response(team_boards.snapshot(team_id), mimetype='application/json')
+
+@app.route('/team/<team_id>/events', methods=['GET'])
+@require_auth
+def team_board_events(team_id):
+    if not require_team_member(session['firebase_uid'], team_id):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return Response(
+        stream_with_context(team_boards.stream(team_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 # Extension
@@ -724,32 +1320,38 @@ def set_client_status(firebase_uid):
     
     try:
         data = request.get_json()
-        name = data.get('name')
-        artist = data.get('artist')
         source = data.get('source', '').lower()
         
-        if not name or not artist:
-            return jsonify({'error': 'Name and artist are required'}), 400
-        
-        if source.lower() not in existing_services:
+        if source not in providers:
             return jsonify({'error': 'Unknown source'}), 400
         
-        song_data = {
-            'name': name,
-            'artist': artist,
-            'updated': datetime.now().isoformat()
-        }
+        try:
+            song_data = providers[source].ingest(data)
+            client_ts = float(data['client_ts']) if data.get('client_ts') is not None else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        sync_sessions.ensure(firebase_uid)
+        key = track_key(song_data['artist'], song_data['name'])
+        if not coalescer.offer(firebase_uid, source, key, client_ts):
+            return jsonify({
+                'success': True,
+                'message': 'Status unchanged',
+                'data': song_data
+            })
         
         field_name = f"last_{source.lower()}"
         update_data = {field_name: song_data}
         
         if update_user_data(firebase_uid, update_data):
+            listening.record_play(firebase_uid, source, song_data['artist'], song_data['name'])
             return jsonify({
                 'success': True,
                 'message': 'Status updated successfully',
                 'data': song_data
             })
         else:
+            coalescer.forget(firebase_uid, source)
             return jsonify({'error': 'Failed to update status'}), 500
             
     except Exception as e:
@@ -829,9 +1431,28 @@ def get_user_status(firebase_uid):
             return jsonify({"error": "Failed to update user data"}), 500
 
     except Exception as e:
-        print(f"Error in set_client_status: {e}")
+        log.error("Error in get_user_status: %s", e, extra={'uid': firebase_uid})
         return jsonify({"error": str(e)}), 500
 
+startup.mark('imported')
+
+PORT = int(os.getenv("PORT", "8888"))
+
+def serve(host="0.0.0.0", port=PORT):
+    """Binds the socket first, then pre-warms the deferred loads while serving.
+
+    Under a WSGI server, call startup.listening() from its post-fork hook
+    (gunicorn's post_worker_init) instead.
+    """
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app, threaded=True)
+    startup.listening()
+    server.serve_forever()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8888, debug=True)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if LAZY_STARTUP:
+        serve()
+    else:
+        app.run(host="0.0.0.0", port=PORT, debug=True)
 
@@ -80,7 +80,7 @@ class ApiClient {
   }
 
   async setClientStatus(firebaseUid, name, artist, source) {
-    const data = { name, artist, source };
+    const data = { name, artist, source, client_ts: Date.now() };
     const response = await this.auth.makeAuthenticatedRequest(
       `/api/set_client_status/${firebaseUid}`,
       'POST',
@@ -318,7 +318,8 @@ async function checkAndUpdateTrack() {
         body: JSON.stringify({
           name: track.title,
           artist: track.artist,
-          source: track.source
+          source: track.source,
+          client_ts: Date.now()
         })
       }).then(async res => {
         const data = await res.json();
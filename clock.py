@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(max(0, seconds))
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+    def spawn(self, target, *args, name=None):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        return thread
+
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+
+class SimulationEnded(BaseException):
+    """Raised inside simulated workers when the run is over.
+
+    A BaseException so the workers' own `except Exception` handlers let it
+    unwind the worker.
+    """
+
+
+class VirtualClock:
+    """Discrete-event clock for running the sync loops without waiting.
+
+    Workers started with spawn() run one at a time. When the running worker
+    sleeps, time jumps straight to the earliest pending wake-up and that
+    worker continues, so runs are deterministic and take as long as the
+    work itself. With greenlet installed the workers are greenlets switched
+    on the thread that calls run(), so a wake-up costs a switch rather than
+    an OS thread handoff; without it each worker gets a thread. Threads not
+    started by spawn() see the virtual time but sleep in real time.
+    """
+
+    def __init__(self, start=0.0, fibers=greenlet is not None):
+        self.current = float(start)
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.horizon = None
+        self.finished = threading.Event()
+        self.ended = False
+        self.wakeups = 0
+        self.fibers = fibers
+        self.hub = None
+        self.workers = set()
+
+    def time(self):
+        return self.current
+
+    def monotonic(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def simulated(self):
+        if self.fibers:
+            return greenlet.getcurrent() in self.workers
+        return getattr(self.local, 'simulated', False)
+
+    def schedule(self, at, waiter=None):
+        if waiter is None:
+            waiter = threading.Event()
+        heapq.heappush(self.heap, (at, next(self.counter), waiter))
+        return waiter
+
+    def dispatch(self):
+        """Hands control to the next due worker; the caller holds the lock and is about to block or exit."""
+        if self.ended or not self.heap or (self.horizon is not None and self.heap[0][0] > self.horizon):
+            self.finished.set()
+            return
+        at, _, event = heapq.heappop(self.heap)
+        self.current = max(self.current, at)
+        self.wakeups += 1
+        event.set()
+
+    def block(self, event):
+        event.wait()
+        if self.ended:
+            raise SimulationEnded()
+
+    def sleep(self, seconds):
+        if not self.simulated():
+            time.sleep(max(0, seconds))
+            return
+        if self.fibers:
+            if self.ended:
+                raise SimulationEnded()
+            self.schedule(self.current + max(0, seconds), greenlet.getcurrent())
+            self.hub.switch()
+            return
+        with self.lock:
+            event = self.schedule(self.current + max(0, seconds))
+            self.dispatch()
+        self.block(event)
+
+    def wait(self, event, timeout=None):
+        """Sleeps for timeout in virtual time; an early event.set() is only seen when it ends."""
+        if not self.simulated():
+            return event.wait(timeout)
+        if not event.is_set():
+            self.sleep(timeout if timeout is not None else 0)
+        return event.is_set()
+
+    def spawn(self, target, *args, name=None):
+        if self.fibers:
+            return self.spawn_fiber(target, args)
+
+        def run():
+            self.local.simulated = True
+            try:
+                self.block(start)
+                target(*args)
+            except SimulationEnded:
+                return
+            finally:
+                if not self.ended:
+                    with self.lock:
+                        self.dispatch()
+
+        with self.lock:
+            start = self.schedule(self.current)
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def spawn_fiber(self, target, args):
+        def run():
+            try:
+                target(*args)
+            except SimulationEnded:
+                pass
+            finally:
+                self.workers.discard(fiber)
+
+        fiber = greenlet.greenlet(run, parent=self.hub or greenlet.getcurrent())
+        self.workers.add(fiber)
+        self.schedule(self.current, fiber)
+        return fiber
+
+    def run(self, until):
+        """Runs the spawned workers until virtual time reaches until, then stops them."""
+        self.horizon = until
+        if self.fibers:
+            self.hub = greenlet.getcurrent()
+            for fiber in self.workers:
+                fiber.parent = self.hub
+            while self.heap and self.heap[0][0] <= until:
+                at, _, fiber = heapq.heappop(self.heap)
+                self.current = max(self.current, at)
+                self.wakeups += 1
+                fiber.switch()
+        else:
+            self.finished.clear()
+            with self.lock:
+                self.dispatch()
+            self.finished.wait()
+        self.current = max(self.current, until)
+        self.stop()
+
+    def stop(self):
+        with self.lock:
+            self.ended = True
+            pending, self.heap = self.heap, []
+        for _, _, waiter in pending:
+            if not self.fibers:
+                waiter.set()
+            elif waiter:
+                # Unwinds the worker where it sleeps, as the threads do.
+                waiter.throw(SimulationEnded)
+            else:
+                # Never started, so there is nothing to unwind.
+                self.workers.discard(waiter)
+
+
+class SyncClock:
+    """The clock every sync loop reads and sleeps on; install() swaps the implementation.
+
+    Defaults elsewhere bind to these methods rather than to the current
+    implementation, so installing a VirtualClock affects objects created
+    before it.
+    """
+
+    def __init__(self):
+        self.impl = SystemClock()
+
+    def install(self, impl):
+        previous, self.impl = self.impl, impl
+        return previous
+
+    def time(self):
+        return self.impl.time()
+
+    def monotonic(self):
+        return self.impl.monotonic()
+
+    def now(self):
+        return self.impl.now()
+
+    def sleep(self, seconds):
+        self.impl.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return self.impl.wait(event, timeout)
+
+    def spawn(self, target, *args, name=None):
+        return self.impl.spawn(target, *args, name=name)
+
+
+sync_clock = SyncClock()
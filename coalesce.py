@@ -0,0 +1,50 @@
+import os
+import threading
+
+from clock import sync_clock
+
+
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "300"))
+
+
+class UpdateCoalescer:
+    """Absorbs repeated track reports per (user, source) before they reach Firestore.
+
+    A report is forwarded when the track differs from the last forwarded one,
+    or when the same track was last forwarded more than window seconds ago so
+    its timestamp stays fresh. Reports older than the newest seen client
+    timestamp lost a race with another tab or device and are dropped.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW, clock=sync_clock.time):
+        self.window = window
+        self.clock = clock
+        self.last = {}
+        self.absorbed = 0
+        self.forwarded = 0
+        self.lock = threading.Lock()
+
+    def offer(self, firebase_uid, source, track_key, client_ts=None):
+        now = self.clock()
+        with self.lock:
+            previous = self.last.get((firebase_uid, source))
+            if previous is not None:
+                last_key, last_client_ts, forwarded_at = previous
+                if client_ts is not None and last_client_ts is not None and client_ts < last_client_ts:
+                    self.absorbed += 1
+                    return False
+                if track_key == last_key and now - forwarded_at < self.window:
+                    if client_ts is not None:
+                        self.last[(firebase_uid, source)] = (last_key, client_ts, forwarded_at)
+                    self.absorbed += 1
+                    return False
+            self.last[(firebase_uid, source)] = (track_key, client_ts, now)
+            self.forwarded += 1
+            return True
+
+    def forget(self, firebase_uid, source):
+        with self.lock:
+            self.last.pop((firebase_uid, source), None)
+
+    def stats(self):
+        return {'absorbed': self.absorbed, 'forwarded': self.forwarded, 'tracked': len(self.last)}
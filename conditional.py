@@ -0,0 +1,86 @@
+import gzip
+import threading
+import uuid
+
+from flask import request, make_response
+
+
+COMPRESS_MIN_BYTES = 1024
+
+
+class VersionCounter:
+    """Per-user version numbers, bumped on every state change this process makes.
+
+    Only state held in this process's memory (the sync session) is versioned
+    here; pages built from Firestore carry their version in the user's
+    document instead, so every replica sees the same one.
+
+    The boot id keeps ETags from a previous process from matching after a restart.
+    Versions come from one process-wide sequence, so a forgotten user reads the
+    sequence value at the time of forgetting, which is never older than any
+    version it was served before.
+    """
+
+    def __init__(self):
+        self.boot = uuid.uuid4().hex[:8]
+        self.versions = {}
+        self.sequence = 0
+        self.floor = 0
+        self.lock = threading.Lock()
+
+    def bump(self, firebase_uid, scope):
+        with self.lock:
+            self.sequence += 1
+            self.versions[(firebase_uid, scope)] = self.sequence
+
+    def get(self, firebase_uid, scope):
+        return self.versions.get((firebase_uid, scope), self.floor)
+
+    def forget(self, firebase_uid, scopes=('sync',)):
+        with self.lock:
+            for scope in scopes:
+                self.versions.pop((firebase_uid, scope), None)
+            self.floor = self.sequence
+
+    def etag(self, firebase_uid, scope, vary=""):
+        tag = f"{self.boot}-{scope}-{self.get(firebase_uid, scope)}"
+        if vary:
+            tag = f"{tag}-{uuid.uuid5(uuid.NAMESPACE_OID, vary).hex[:8]}"
+        return tag
+
+
+def compress(response):
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.status_code != 200
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def conditional(etag, build):
+    """Returns 304 when the client's ETag still matches; build() only runs otherwise.
+
+    The ETag is weak: the gzip and identity bodies are the same content in
+    two encodings, and a strong tag would claim they are byte-identical.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+        response = compress(response)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_response(versions, firebase_uid, scope, build, vary=""):
+    """conditional() for in-memory state versioned under scope."""
+    return conditional(versions.etag(firebase_uid, scope, vary), build)
@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import Counter
+
+from clock import sync_clock
+from synclog import get_logger
+
+log = get_logger("governor")
+
+
+# Requests per second the Spotify app may make across all users.
+SPOTIFY_RATE = float(os.getenv("SPOTIFY_RATE", "10"))
+SPOTIFY_BURST = float(os.getenv("SPOTIFY_BURST", "20"))
+# Share of the rate handed out as poll intervals; the rest absorbs queue
+# lookups, token refreshes and /spotify/now.
+POLL_UTILISATION = 0.8
+PLAYING_WEIGHT = 4
+IDLE_WEIGHT = 1
+
+
+class Throttled(Exception):
+    """The shared request budget is exhausted; shaped like a 429 so pollers back off the same way."""
+
+    http_status = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Request budget exhausted, retry in {retry_after:.1f}s")
+        self.headers = {'Retry-After': str(max(1, round(retry_after)))}
+
+
+class RateGovernor:
+    """One request budget for everything that calls an API under a shared app credential.
+
+    acquire() takes a token from a bucket refilled at rate per second, and
+    waits out any Retry-After the API sent to anyone. Pollers also ask
+    interval() how often to poll. While everyone polling at the base
+    interval fits the budget nobody is slowed down; past that the budget is
+    shared by weight, playing users first, so intervals stretch smoothly
+    instead of the whole app running into the limit.
+    """
+
+    def __init__(self, rate=SPOTIFY_RATE, burst=SPOTIFY_BURST, utilisation=POLL_UTILISATION,
+                 playing_weight=PLAYING_WEIGHT, idle_weight=IDLE_WEIGHT, clock=sync_clock.time):
+        self.rate = rate
+        self.capacity = burst
+        self.utilisation = utilisation
+        self.playing_weight = playing_weight
+        self.idle_weight = idle_weight
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.weights = {}
+        self.counts = Counter()
+        self.granted = 0
+        self.throttled = 0
+        self.penalties = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token if one is free; returns 0, or the seconds until one will be."""
+        with self.lock:
+            now = self.clock()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.granted += 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=0):
+        """Waits up to timeout for a token; raises Throttled if none comes in time."""
+        deadline = self.clock() + timeout
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            if self.clock() + wait > deadline:
+                self.throttled += 1
+                raise Throttled(wait)
+            # Never a sub-millisecond sleep: a clock with coarse resolution
+            # would hand back the same fractional token forever.
+            sync_clock.sleep(max(wait, 0.001))
+
+    def penalize(self, retry_after):
+        """The API returned 429: nobody calls again until Retry-After has passed."""
+        with self.lock:
+            until = self.clock() + retry_after
+            if until > self.blocked_until:
+                self.blocked_until = until
+                self.penalties += 1
+                log.warning("Spotify rate limited for %.0fs", retry_after, extra={'source': 'spotify'})
+            self.tokens = 0
+
+    def update(self, firebase_uid, playing):
+        weight = self.playing_weight if playing else self.idle_weight
+        with self.lock:
+            previous = self.weights.get(firebase_uid)
+            if previous == weight:
+                return
+            if previous:
+                self.counts[previous] -= 1
+            self.counts[weight] += 1
+            self.weights[firebase_uid] = weight
+
+    def forget(self, firebase_uid):
+        with self.lock:
+            weight = self.weights.pop(firebase_uid, None)
+            if weight:
+                self.counts[weight] -= 1
+
+    def seconds_per_weight(self, base):
+        """Water-fills the poll budget: returns k such that a user of weight w polls every max(base, k / w).
+
+        The heaviest users are held at base first; whatever budget is left is
+        split by weight among the rest. 0 means everyone fits at base.
+        """
+        budget = self.rate * self.utilisation
+        with self.lock:
+            groups = sorted(((w, n) for w, n in self.counts.items() if n > 0), reverse=True)
+        capped_rate = 0.0
+        remaining_weight = sum(w * n for w, n in groups)
+        for weight, count in groups:
+            left = budget - capped_rate
+            if left > 0 and remaining_weight / left > base * weight:
+                return remaining_weight / left
+            capped_rate += count / base
+            remaining_weight -= weight * count
+        return 0.0
+
+    def interval(self, firebase_uid, base, due=None):
+        """Seconds until this user's next poll, stretched to the user's share of the budget.
+
+        base is the provider's regular interval, which the budget is planned
+        around; due, if given, is when this particular poll wants to run
+        instead, such as just after a track boundary.
+        """
+        wanted = base if due is None else due
+        weight = self.weights.get(firebase_uid)
+        if not weight:
+            return wanted
+        return max(wanted, self.seconds_per_weight(base) / weight)
+
+    def stats(self, base=30):
+        k = self.seconds_per_weight(base)
+        return {
+            'rate': self.rate,
+            'users': len(self.weights),
+            'granted': self.granted,
+            'throttled': self.throttled,
+            'penalties': self.penalties,
+            'blocked_for': round(max(0.0, self.blocked_until - self.clock()), 1),
+            # Poll intervals the budget currently allows at the default 30 s base.
+            'playing_interval': round(max(base, k / self.playing_weight), 1),
+            'idle_interval': round(max(base, k / self.idle_weight), 1)
+        }
@@ -0,0 +1,214 @@
+import json
+from collections import namedtuple
+from typing import List, Optional
+
+from clock import sync_clock
+from startup import deferred, lazy_import
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+SPOTIFY_PLAYER_URL = "https://api.spotify.com/v1/me/player"
+SPOTIFY_QUEUE_URL = "https://api.spotify.com/v1/me/player/queue"
+SLACK_PROFILE_SET_URL = "https://slack.com/api/users.profile.set"
+SLACK_PRESENCE_URL = "https://slack.com/api/users.getPresence"
+SLACK_TEAM_DND_URL = "https://slack.com/api/dnd.teamInfo"
+
+# Retried the way spotipy's session did: 429 and 5xx, with exponential backoff.
+SPOTIFY_RETRIES = 3
+SPOTIFY_RETRY_STATUSES = (429, 500, 502, 503, 504)
+SPOTIFY_BACKOFF = 0.3
+# A longer Retry-After is raised to the caller's governor instead of slept through.
+SPOTIFY_MAX_RETRY_AFTER = 5
+
+# Imported on first use under LAZY_STARTUP.
+requests = lazy_import("requests")
+spotify_errors = lazy_import("spotipy.exceptions")
+slack_errors = lazy_import("slack_sdk.errors")
+
+http = deferred("http_session", lambda: requests.Session())
+
+# Only the fields the sync loops and /spotify/now read are decoded; device,
+# context, album images and available markets are skipped by the decoder.
+if msgspec is not None:
+    class Artist(msgspec.Struct):
+        name: str = ""
+
+    class Album(msgspec.Struct):
+        name: str = ""
+
+    class Track(msgspec.Struct):
+        id: Optional[str] = None
+        name: str = ""
+        artists: List[Artist] = []
+        duration_ms: int = 0
+        album: Optional[Album] = None
+
+    class Playback(msgspec.Struct):
+        is_playing: bool = False
+        progress_ms: Optional[int] = None
+        item: Optional[Track] = None
+
+    class Queue(msgspec.Struct):
+        queue: List[Track] = []
+
+    class SlackResult(msgspec.Struct):
+        ok: bool = False
+        error: Optional[str] = None
+
+    decode_playback = msgspec.json.Decoder(Playback).decode
+    decode_queue = msgspec.json.Decoder(Queue).decode
+    decode_slack = msgspec.json.Decoder(SlackResult).decode
+    encode_json = msgspec.json.encode
+else:
+    Artist = namedtuple('Artist', 'name')
+    Album = namedtuple('Album', 'name')
+    Track = namedtuple('Track', 'id name artists duration_ms album')
+    Playback = namedtuple('Playback', 'is_playing progress_ms item')
+    Queue = namedtuple('Queue', 'queue')
+    SlackResult = namedtuple('SlackResult', 'ok error')
+
+    if orjson is not None:
+        loads = orjson.loads
+        encode_json = orjson.dumps
+    else:
+        loads = json.loads
+        encode_json = lambda obj: json.dumps(obj).encode()
+
+    def decode_track(item):
+        return Track(
+            item.get('id'),
+            item.get('name', ''),
+            [Artist(a.get('name', '')) for a in item.get('artists') or ()],
+            item.get('duration_ms') or 0,
+            Album(item['album'].get('name', '')) if item.get('album') else None
+        )
+
+    def decode_playback(raw):
+        data = loads(raw)
+        item = data.get('item')
+        return Playback(bool(data.get('is_playing')), data.get('progress_ms'), decode_track(item) if item else None)
+
+    def decode_queue(raw):
+        # Only the head of the queue is decoded into a Track.
+        queue = loads(raw).get('queue') or []
+        return Queue([decode_track(queue[0])] if queue else [])
+
+    def decode_slack(raw):
+        data = loads(raw)
+        return SlackResult(bool(data.get('ok')), data.get('error'))
+
+
+class SlackErrorResponse(dict):
+    """Error payload carrying the HTTP status and headers, e.g. for Retry-After."""
+
+    def __init__(self, data, status_code, headers):
+        super().__init__(data)
+        self.status_code = status_code
+        self.headers = headers
+
+
+def retry_delay(resp, attempt):
+    """Seconds to wait before retrying resp, or None if it should be raised now."""
+    delay = SPOTIFY_BACKOFF * 2 ** attempt
+    if resp is None or resp.status_code != 429:
+        return delay
+    try:
+        retry_after = float(resp.headers.get('Retry-After', 0))
+    except (TypeError, ValueError):
+        retry_after = 0
+    return max(delay, retry_after) if retry_after <= SPOTIFY_MAX_RETRY_AFTER else None
+
+
+def spotify_get(url, access_token, timeout):
+    """GETs a Spotify endpoint; None for 204 or an empty body, raises SpotifyException for errors."""
+    for attempt in range(SPOTIFY_RETRIES + 1):
+        try:
+            resp = http.get(url, headers={"Authorization": f"Bearer {access_token}"}, timeout=timeout)
+        except requests.ConnectionError:
+            if attempt == SPOTIFY_RETRIES:
+                raise
+            resp = None
+        if resp is not None and (resp.status_code not in SPOTIFY_RETRY_STATUSES or attempt == SPOTIFY_RETRIES):
+            break
+        delay = retry_delay(resp, attempt)
+        if delay is None:
+            break
+        sync_clock.sleep(delay)
+    if resp.status_code >= 400:
+        raise spotify_errors.SpotifyException(resp.status_code, -1, f"{resp.url}: {resp.text}", headers=resp.headers)
+    if resp.status_code == 204 or not resp.content:
+        return None
+    return resp.content
+
+
+def fetch_playback(access_token, timeout=10):
+    content = spotify_get(SPOTIFY_PLAYER_URL, access_token, timeout)
+    return decode_playback(content) if content is not None else None
+
+
+def fetch_next_track(access_token, timeout=10):
+    """The track queued after the current one, or None if the queue is empty."""
+    content = spotify_get(SPOTIFY_QUEUE_URL, access_token, timeout)
+    if content is None:
+        return None
+    queue = decode_queue(content).queue
+    return queue[0] if queue else None
+
+
+def set_slack_profile(access_token, profile, timeout=10):
+    resp = http.post(
+        SLACK_PROFILE_SET_URL,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json; charset=utf-8"
+        },
+        data=encode_json({"profile": profile}),
+        timeout=timeout
+    )
+    try:
+        result = decode_slack(resp.content)
+    except Exception:
+        result = SlackResult(False, f"http_{resp.status_code}")
+    if resp.status_code == 429 or not result.ok:
+        error = result.error or f"http_{resp.status_code}"
+        raise slack_errors.SlackApiError(
+            f"The request to the Slack API failed. (url: {SLACK_PROFILE_SET_URL})",
+            SlackErrorResponse({"ok": False, "error": error}, resp.status_code, resp.headers)
+        )
+    return result
+
+
+def artist_names(track):
+    return ", ".join(a.name for a in track.artists)
+
+
+def slack_get(url, access_token, params, timeout=10):
+    resp = http.get(url, headers={"Authorization": f"Bearer {access_token}"}, params=params, timeout=timeout)
+    data = resp.json() if resp.content else {}
+    if resp.status_code == 429 or not data.get("ok"):
+        raise slack_errors.SlackApiError(
+            f"The request to the Slack API failed. (url: {url})",
+            SlackErrorResponse({"ok": False, "error": data.get("error") or f"http_{resp.status_code}"},
+                               resp.status_code, resp.headers)
+        )
+    return data
+
+
+def get_presence(access_token, user_id, timeout=10):
+    """Returns 'active' or 'away' for a Slack user (needs users:read)."""
+    return slack_get(SLACK_PRESENCE_URL, access_token, {"user": user_id}, timeout).get("presence")
+
+
+def get_team_dnd(access_token, user_ids, timeout=10):
+    """DND windows for up to 50 users of the token's workspace in one call (needs dnd:read)."""
+    data = slack_get(SLACK_TEAM_DND_URL, access_token, {"users": ",".join(user_ids)}, timeout)
+    return data.get("users") or {}
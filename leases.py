@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+
+from clock import sync_clock
+from synclog import get_logger
+
+log = get_logger("leases")
+
+
+class LeaseStore:
+    """Per-session ownership leases shared by all replicas through one SQLite file.
+
+    A replica owns a session while its lease has not expired. Renewal is a
+    single statement per replica, and survivors claim expired leases.
+    """
+
+    def __init__(self, path, owner, ttl=30, clock=sync_clock.time):
+        self.path = path
+        self.owner = owner
+        self.ttl = ttl
+        self.clock = clock
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    kind TEXT NOT NULL,
+                    uid TEXT NOT NULL,
+                    owner TEXT,
+                    expires_at REAL NOT NULL,
+                    released INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (kind, uid)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS leases_expiry ON leases (released, expires_at)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def acquire(self, kind, uid):
+        """Takes the lease unless another live replica holds it."""
+        now = self.clock()
+        conn = self.connect()
+        cursor = conn.execute('''
+            INSERT INTO leases (kind, uid, owner, expires_at, released) VALUES (?, ?, ?, ?, 0)
+            ON CONFLICT (kind, uid) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, released = 0
+            WHERE leases.owner = excluded.owner OR leases.released = 1 OR leases.expires_at <= ?
+        ''', (kind, uid, self.owner, now + self.ttl, now))
+        return cursor.rowcount == 1
+
+    def owns(self, kind, uid):
+        row = self.connect().execute(
+            'SELECT owner, expires_at, released FROM leases WHERE kind = ? AND uid = ?', (kind, uid)
+        ).fetchone()
+        return bool(row) and row[0] == self.owner and not row[2] and row[1] > self.clock()
+
+    def release(self, kind, uid, only_own=False):
+        """Marks the session stopped, whichever replica runs it; its owner stops at the next owns().
+
+        Workers exiting on their own pass only_own, so they never release a
+        lease another replica has taken over since.
+        """
+        if only_own:
+            self.connect().execute(
+                'UPDATE leases SET released = 1 WHERE kind = ? AND uid = ? AND owner = ?',
+                (kind, uid, self.owner)
+            )
+        else:
+            self.connect().execute('UPDATE leases SET released = 1 WHERE kind = ? AND uid = ?', (kind, uid))
+
+    def renew_all(self):
+        now = self.clock()
+        cursor = self.connect().execute(
+            'UPDATE leases SET expires_at = ? WHERE owner = ? AND released = 0 AND expires_at > ?',
+            (now + self.ttl, self.owner, now)
+        )
+        return cursor.rowcount
+
+    def claim_orphans(self, limit=100):
+        """Takes over expired, unreleased leases; returns the (kind, uid) pairs now owned."""
+        now = self.clock()
+        conn = self.connect()
+        orphans = conn.execute(
+            'SELECT kind, uid FROM leases WHERE released = 0 AND expires_at <= ? LIMIT ?', (now, limit)
+        ).fetchall()
+        claimed = []
+        for kind, uid in orphans:
+            cursor = conn.execute(
+                'UPDATE leases SET owner = ?, expires_at = ? WHERE kind = ? AND uid = ? AND released = 0 AND expires_at <= ?',
+                (self.owner, now + self.ttl, kind, uid, now)
+            )
+            if cursor.rowcount == 1:
+                claimed.append((kind, uid))
+        return claimed
+
+
+def run_heartbeat(store, on_orphan, is_running, interval=None):
+    """Renews this replica's leases and adopts orphaned sessions until is_running() is false."""
+    interval = interval or store.ttl / 3
+    while is_running():
+        try:
+            store.renew_all()
+            for kind, uid in store.claim_orphans():
+                on_orphan(kind, uid)
+        except Exception as e:
+            log.error("Lease heartbeat error: %s", e)
+        sync_clock.sleep(interval)
@@ -3,7 +3,6 @@ import time
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 import os
 import threading
@@ -11,9 +10,28 @@ import firebase_admin
 from firebase_admin import credentials, firestore, auth
 from datetime import datetime
 from flask_cors import CORS
+from shutdown import Drainer
+from playback_state import PlaybackState, GRACE_SECONDS
+from lean_api import fetch_playback, set_slack_profile, artist_names
+from sessions import SessionTable, decode_cursor, parse_error_filter
+from snapshots import PlaybackSnapshots, now_playing_json
+from user_store import UserStore
+from clock import sync_clock
+from reaper import Reaper, MemoryInspector
+from synclog import setup_logging, flush_logs, get_logger, log_stats
+from analytics import ListeningAnalytics, team_ids_for_user
+from sinks import SlackSink
+from outbox import StatusOutbox, OutboxDispatcher
+from governor import RateGovernor, Throttled
+from providers import retry_after_of, GOVERNOR_WAIT
+import signal
+import sys
 
 load_dotenv()
 
+setup_logging()
+log = get_logger("main")
+
 app = Flask(__name__)
 
 CORS(app, supports_credentials=True)
@@ -21,14 +39,72 @@ CORS(app, supports_credentials=True)
 cred = credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH"))
 firebase_admin.initialize_app(cred)
 db = firestore.client()
+user_store = UserStore(db)
 
 existing_services = ["YOUTUBE", "APPLE_MUSIC", "SPOTIFY"]
 
-sync_threads = {}
-sync_status = {}  
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+drainer = Drainer(
+    max_workers=int(os.getenv("SHUTDOWN_WORKERS", "16")),
+    rate=float(os.getenv("SHUTDOWN_RATE", "20")),
+    deadline=float(os.getenv("SHUTDOWN_DEADLINE", "30"))
+)
+drainer.register_flush(flush_logs)
+
+sync_sessions = SessionTable()
+playback_snapshots = PlaybackSnapshots()
+listening = ListeningAnalytics()
+# Every Spotify call made with this app's client_id shares one rate limit.
+spotify_governor = RateGovernor()
+
+def get_user_tokens(firebase_uid):
+    try:
+        user_data = user_store.get(firebase_uid, ['slack.access_token', 'spotify.access_token', 'spotify.refresh_token'])
+        if user_data:
+            slack_token = user_data.get('slack', {}).get('access_token')
+            spotify_access_token = user_data.get('spotify', {}).get('access_token')
+            spotify_refresh_token = user_data.get('spotify', {}).get('refresh_token')
+            return slack_token, spotify_access_token, spotify_refresh_token
+        return None, None, None
+    except Exception as e:
+        log.error("Error getting user tokens: %s", e, extra={'uid': firebase_uid})
+        return None, None, None
+
+def refresh_spotify_token(firebase_uid, refresh_token):
+    try:
+        spotify_governor.acquire(GOVERNOR_WAIT)
+        sp_oauth = SpotifyOAuth(
+            client_id=os.getenv("SPOTIPY_CLIENT_ID"),
+            client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
+            redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
+            scope="user-read-playback-state"
+        )
+        token_info = sp_oauth.refresh_access_token(refresh_token)
+        new_access_token = token_info['access_token']
+        db.collection('users').document(firebase_uid).update({'spotify.access_token': new_access_token})
+        return new_access_token
+    except Exception as e:
+        log.error("Error refreshing Spotify token: %s", e, extra={'uid': firebase_uid, 'source': 'spotify'})
+        return None
+
+def restore_original_status(firebase_uid):
+    """Puts back the status the user saved as original, or clears the one we set."""
+    slack_token, _, _ = get_user_tokens(firebase_uid)
+    if not slack_token:
+        return
+    sync = sync_sessions.get(firebase_uid)
+    original = (sync and sync.original_status) or {'text': "", 'emoji': ""}
+    set_slack_profile(slack_token, {
+        "status_text": original['text'],
+        "status_emoji": original['emoji'],
+        "status_expiration": 0
+    })
 
 @app.route('/sync/start/<firebase_uid>', methods=['POST'])
 def start_sync(firebase_uid):
+    if not drainer.accepting:
+        return jsonify({'error': 'Server is shutting down', 'success': False}), 503
     try:
         slack_token, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
         
@@ -38,8 +114,9 @@ def start_sync(firebase_uid):
                 'success': False
             }), 400
         
-        if firebase_uid in sync_status:
-            sync_status[firebase_uid]['active'] = False
+        sync = sync_sessions.ensure(firebase_uid)
+        if sync.active:
+            sync.active = False
             time.sleep(1)  
         
         sync_thread = threading.Thread(
@@ -48,7 +125,7 @@ def start_sync(firebase_uid):
             daemon=True
         )
         sync_thread.start()
-        sync_threads[firebase_uid] = sync_thread
+        sync.thread = sync_thread
         
         return jsonify({
             'success': True,
@@ -64,22 +141,15 @@ def start_sync(firebase_uid):
 @app.route('/sync/stop/<firebase_uid>', methods=['POST'])
 def stop_sync(firebase_uid):
     try:
-        if firebase_uid in sync_status:
-            sync_status[firebase_uid]['active'] = False
+        sync = sync_sessions.get(firebase_uid)
+        if sync:
+            sync.active = False
             
-            if 'original_status' in sync_status[firebase_uid]:
-                slack_token, _, _ = get_user_tokens(firebase_uid)
-                if slack_token:
-                    try:
-                        slack_client = WebClient(token=slack_token)
-                        original = sync_status[firebase_uid]['original_status']
-                        slack_client.users_profile_set(profile={
-                            "status_text": original['text'],
-                            "status_emoji": original['emoji'],
-                            "status_expiration": 0
-                        })
-                    except Exception as e:
-                        print(f"Error restoring original status: {e}")
+            if sync.original_status:
+                try:
+                    restore_original_status(firebase_uid)
+                except Exception as e:
+                    log.error("Error restoring original status: %s", e, extra={'uid': firebase_uid})
         
         return jsonify({
             'success': True,
@@ -96,17 +166,18 @@ def stop_sync(firebase_uid):
 def get_sync_status(firebase_uid):
     """Get sync status for a specific user"""
     try:
-        user_sync_status = sync_status.get(firebase_uid, {})
-        sync_running = firebase_uid in sync_threads and sync_threads[firebase_uid].is_alive()
+        sync = sync_sessions.get(firebase_uid)
+        if sync is None:
+            return jsonify({
+                'running': False,
+                'active': False,
+                'current_song': None,
+                'last_update': None,
+                'error_count': 0,
+                'error': None
+            })
         
-        return jsonify({
-            'running': sync_running,
-            'active': user_sync_status.get('active', False),
-            'current_song': user_sync_status.get('current_song'),
-            'last_update': user_sync_status.get('last_update'),
-            'error_count': user_sync_status.get('error_count', 0),
-            'error': user_sync_status.get('error')
-        })
+        return jsonify(sync.to_json())
         
     except Exception as e:
         return jsonify({
@@ -116,20 +187,21 @@ def get_sync_status(firebase_uid):
 
 @app.route('/sync/list', methods=['GET'])
 def list_active_syncs():
-    """List all active sync sessions"""
+    """List active sync sessions, most recently updated first, one page at a time"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        error = parse_error_filter(request.args.get('error'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Invalid limit, error filter or cursor'}), 400
     try:
-        active_syncs = {}
-        for uid, status in sync_status.items():
-            if status.get('active', False):
-                active_syncs[uid] = {
-                    'current_song': status.get('current_song'),
-                    'last_update': status.get('last_update'),
-                    'error_count': status.get('error_count', 0)
-                }
+        page, next_cursor = sync_sessions.page(limit, after, error)
         
         return jsonify({
-            'active_syncs': active_syncs,
-            'total_active': len(active_syncs)
+            'active_syncs': {sync.uid: sync.summary_json() for sync in page},
+            'total_active': sync_sessions.stats()['active'],
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -140,9 +212,17 @@ def list_active_syncs():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    stats = sync_sessions.stats()
     return jsonify({
         'status': 'healthy',
-        'active_syncs': len([uid for uid, status in sync_status.items() if status.get('active', False)]),
+        'active_syncs': stats['active'],
+        'erroring_syncs': stats['erroring'],
+        'sessions': stats,
+        'outbox': outbox_dispatcher.stats(),
+        'spotify_budget': spotify_governor.stats(),
+        'logging': log_stats(),
+        'listening': listening.stats(),
+        'reaper': reaper.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -161,47 +241,46 @@ def get_user_tokens_api(firebase_uid):
 @app.route('/sync/reset/<firebase_uid>', methods=['POST'])
 def reset_sync(firebase_uid):
     try:
-        if firebase_uid in sync_status:
-            sync_status.pop(firebase_uid)
-        if firebase_uid in sync_threads:
-            sync_threads.pop(firebase_uid)
+        sync_sessions.pop(firebase_uid)
+        forget_user_state(firebase_uid)
         return jsonify({'success': True, 'message': f'Sync data reset for {firebase_uid}'})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+def fetch_spotify_playback(firebase_uid):
+    _, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
+    if not spotify_token:
+        raise LookupError('No Spotify token found')
+    try:
+        return fetch_playback(spotify_token)
+    except spotipy.exceptions.SpotifyException as e:
+        if e.http_status != 401:
+            raise
+        new_token = refresh_spotify_token(firebase_uid, spotify_refresh_token)
+        if not new_token:
+            raise PermissionError('Unable to refresh token')
+        return fetch_playback(new_token)
+
 @app.route('/spotify/now/<firebase_uid>', methods=['GET'])
 def get_current_spotify_track(firebase_uid):
     try:
-        _, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
-        if not spotify_token:
-            return jsonify({'error': 'No Spotify token found'}), 400
-
-        sp = spotipy.Spotify(auth=spotify_token)
-        try:
-            playback = sp.current_playback()
-        except spotipy.exceptions.SpotifyException as e:
-            if e.http_status == 401:
-                new_token = refresh_spotify_token(firebase_uid, spotify_refresh_token)
-                if not new_token:
-                    return jsonify({'error': 'Unable to refresh token'}), 401
-                sp = spotipy.Spotify(auth=new_token)
-                playback = sp.current_playback()
-            else:
-                raise e
-
-        if not playback or not playback.get("is_playing"):
-            return jsonify({'is_playing': False})
-
-        track = playback["item"]
-        return jsonify({
-            'is_playing': True,
-            'name': track["name"],
-            'artists': [a["name"] for a in track.get("artists", [])],
-            'album': track["album"]["name"]
-        })
+        sync_sessions.ensure(firebase_uid)
+        playback = playback_snapshots.get(firebase_uid, lambda: fetch_spotify_playback(firebase_uid))
+        return jsonify(now_playing_json(playback))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 400
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/analytics/top/<firebase_uid>', methods=['GET'])
+def get_listening_top(firebase_uid):
+    try:
+        return jsonify(listening.user_top(firebase_uid, request.args.get('window', 'week')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/slack/status/<firebase_uid>', methods=['POST'])
 def set_slack_status(firebase_uid):
     try:
@@ -220,22 +299,13 @@ def set_slack_status(firebase_uid):
             "status_expiration": 0
         })
 
-        if firebase_uid in sync_status:
-            sync_status[firebase_uid]['original_status'] = {
-                'text': status_text,
-                'emoji': status_emoji
-            }
-        else:
-            sync_status[firebase_uid] = {
-                'original_status': {
-                    'text': status_text,
-                    'emoji': status_emoji
-                },
-                'active': False,
-                'current_song': None,
-                'error_count': 0,
-                'last_update': datetime.now().isoformat()
-            }
+        sync = sync_sessions.ensure(firebase_uid)
+        sync.original_status = {
+            'text': status_text,
+            'emoji': status_emoji
+        }
+        if not sync.last_update:
+            sync.last_update = time.time()
 
         return jsonify({'success': True, 'message': 'Slack status updated and saved as original'})
     except Exception as e:
@@ -247,58 +317,127 @@ status_threads = {}  # firebase_uid -> Thread
 spotify_threads = {}  # firebase_uid -> Thread
 spotify_active = {}   # firebase_uid -> bool
 slack_worker_status = {}  # firebase_uid -> bool
+status_playback = {}  # firebase_uid -> PlaybackState of the global status worker
+status_shown = {}  # firebase_uid -> expiration of the last status the global status worker queued
+
+def global_status_result(firebase_uid, sink_name, error):
+    playback = status_playback.get(firebase_uid)
+    if error is not None and playback is not None:
+        # Queue the status again on the next loop instead of assuming it is shown.
+        playback.reset()
+
+def slack_sinks(firebase_uid):
+    slack_token, _, _ = get_user_tokens(firebase_uid)
+    return [SlackSink(slack_token)] if slack_token else []
+
+outbox_dispatcher = OutboxDispatcher(
+    # Not app.py's file: each server drains its own outbox.
+    StatusOutbox(os.getenv("OUTBOX_DB_PATH", "main-outbox.db")),
+    resolve=slack_sinks,
+    on_result=global_status_result
+)
+outbox_dispatcher.start(lambda: True)
+
+def worker_alive(threads, firebase_uid):
+    thread = threads.get(firebase_uid)
+    return thread is not None and thread.is_alive()
+
+def forget_user_state(firebase_uid):
+    for state in (global_status, status_threads, spotify_threads, spotify_active, slack_worker_status, status_playback,
+                  status_shown):
+        state.pop(firebase_uid, None)
+    playback_snapshots.forget(firebase_uid)
+    spotify_governor.forget(firebase_uid)
+
+reaper = Reaper(
+    sync_sessions,
+    forget_hooks=[forget_user_state, listening.forget],
+    is_running=lambda sync: (sync.running() or worker_alive(status_threads, sync.uid)
+                             or worker_alive(spotify_threads, sync.uid))
+)
+memory_inspector = MemoryInspector()
+if os.getenv("MEMORY_TRACE", "0") == "1":
+    memory_inspector.start()
+
+threading.Thread(target=reaper.run, args=(lambda: drainer.accepting,), name="reaper", daemon=True).start()
+
+@app.route('/debug/memory', methods=['GET'])
+def debug_memory():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 403
+    limit = min(int(request.args.get('limit', 20)), 200)
+    return jsonify({**memory_inspector.report(limit), 'sessions': len(sync_sessions), 'reaper': reaper.stats()})
 
 def global_status_worker(firebase_uid):
     slack_worker_status[firebase_uid] = True
+    playback = status_playback[firebase_uid] = PlaybackState()
+    team_ids = team_ids_for_user(get_user_data(firebase_uid, ['slack.team_id', 'slack_workspaces']))
     while slack_worker_status.get(firebase_uid, False):
         if firebase_uid in global_status:
-            slack_token, _, _ = get_user_tokens(firebase_uid)
-            if slack_token:
-                status = global_status[firebase_uid]
-                try:
-                    slack_client = WebClient(token=slack_token)
-                    slack_client.users_profile_set(profile={
-                        "status_text": status.get('text', ''),
-                        "status_emoji": status.get('emoji', ''),
-                        "status_expiration": 0
-                    })
-                    print(f"Global status updated for {firebase_uid}: {status.get('text', '')}")
-                except SlackApiError as e:
-                    print(f"Failed to update Slack status for {firebase_uid}: {e.response['error']}")
-        time.sleep(30)
-    print(f"Slack worker stopped for {firebase_uid}")
+            status = global_status[firebase_uid]
+            expiration = playback.should_write(status.get('text', ''), status.get('expires_at'), sync_clock.time())
+            slack_token, _, _ = get_user_tokens(firebase_uid) if expiration is not None else (None, None, None)
+            # Once draining, a new write could land after the status is cleared.
+            if slack_token and drainer.accepting:
+                outbox_dispatcher.submit(firebase_uid, [SlackSink(slack_token)], {
+                    "uid": firebase_uid,
+                    "text": status.get('text', ''),
+                    "emoji": status.get('emoji', ''),
+                    "expiration": expiration,
+                    "track": status.get('track')
+                })
+                playback.written(status.get('text', ''), expiration)
+                status_shown[firebase_uid] = expiration
+                if status.get('track'):
+                    listening.record_team_play(firebase_uid, team_ids, status['track']['artist'], status['track']['name'])
+                log.info("Global status queued: %s", status.get('text', ''), extra={'uid': firebase_uid, 'sink': 'slack'})
+        sync_clock.sleep(30)
+    log.info("Slack worker stopped", extra={'uid': firebase_uid})
 
 def spotify_pull_worker(firebase_uid):
     spotify_active[firebase_uid] = True
     slack_token, spotify_token, spotify_refresh_token = get_user_tokens(firebase_uid)
-    sp = spotipy.Spotify(auth=spotify_token)
 
     while spotify_active.get(firebase_uid, False):
+        playing = False
         try:
-            playback = sp.current_playback()
-            if playback and playback.get("is_playing"):
-                track = playback["item"]
+            spotify_governor.acquire(GOVERNOR_WAIT)
+            playback = fetch_playback(spotify_token)
+            playback_snapshots.put(firebase_uid, playback)
+            playing = bool(playback and playback.is_playing)
+            if playback and playback.is_playing:
+                track = playback.item
                 if track:
-                    song_text = f"{track['name']} – {', '.join(a['name'] for a in track.get('artists', []))}"
+                    song_text = f"{track.name} – {artist_names(track)}"
+                    listening.record_play(firebase_uid, 'spotify', artist_names(track), track.name)
+                    remaining = max(0, track.duration_ms - (playback.progress_ms or 0)) / 1000
                     global_status[firebase_uid] = {
                         'text': f"Listening to: {song_text}",
                         'emoji': '🎵',
-                        'last_update': datetime.now().isoformat()
+                        'expires_at': sync_clock.time() + remaining + GRACE_SECONDS,
+                        'track': {'name': track.name, 'artist': artist_names(track)},
+                        'last_update': sync_clock.now().isoformat()
                     }
+        except Throttled as e:
+            log.debug("Spotify poll deferred: %s", e, extra={'uid': firebase_uid, 'source': 'spotify'})
         except spotipy.exceptions.SpotifyException as e:
             if e.http_status == 401:
                 new_token = refresh_spotify_token(firebase_uid, spotify_refresh_token)
                 if new_token:
-                    sp = spotipy.Spotify(auth=new_token)
+                    spotify_token = new_token
                 else:
-                    print(f"Spotify token refresh failed for {firebase_uid}")
+                    log.warning("Spotify token refresh failed", extra={'uid': firebase_uid, 'source': 'spotify'})
+            elif e.http_status == 429:
+                spotify_governor.penalize(retry_after_of(e))
             else:
-                print(f"Spotify API error for {firebase_uid}: {e}")
+                log.error("Spotify API error: %s", e, extra={'uid': firebase_uid, 'source': 'spotify'})
         except Exception as e:
-            print(f"Spotify pull error for {firebase_uid}: {e}")
+            log.error("Spotify pull error: %s", e, extra={'uid': firebase_uid, 'source': 'spotify'})
 
-        time.sleep(30)
-    print(f"Spotify pull stopped for {firebase_uid}")
+        spotify_governor.update(firebase_uid, playing)
+        sync_clock.sleep(spotify_governor.interval(firebase_uid, 30))
+    spotify_governor.forget(firebase_uid)
+    log.info("Spotify pull stopped", extra={'uid': firebase_uid, 'source': 'spotify'})
 
 @app.route('/global/status/<firebase_uid>', methods=['POST'])
 def set_global_status(firebase_uid):
@@ -306,6 +445,7 @@ def set_global_status(firebase_uid):
     text = data.get('text', '')
     emoji = data.get('emoji', '')
 
+    sync_sessions.ensure(firebase_uid)
     global_status[firebase_uid] = {
         'text': text,
         'emoji': emoji,
@@ -313,19 +453,18 @@ def set_global_status(firebase_uid):
     }
 
     if not slack_worker_status.get(firebase_uid, False):
-        t = threading.Thread(target=global_status_worker, args=(firebase_uid,), daemon=True)
-        t.start()
-        status_threads[firebase_uid] = t
+        status_threads[firebase_uid] = sync_clock.spawn(global_status_worker, firebase_uid)
 
     return jsonify({'success': True, 'message': 'Global status updated'})
 
 @app.route('/spotify/pull/start/<firebase_uid>', methods=['POST'])
 def start_spotify_pull(firebase_uid):
+    if not drainer.accepting:
+        return jsonify({'error': 'Server is shutting down', 'success': False}), 503
+    sync_sessions.ensure(firebase_uid)
     if not spotify_active.get(firebase_uid, False):
         spotify_active[firebase_uid] = True
-        t = threading.Thread(target=spotify_pull_worker, args=(firebase_uid,), daemon=True)
-        t.start()
-        spotify_threads[firebase_uid] = t
+        spotify_threads[firebase_uid] = sync_clock.spawn(spotify_pull_worker, firebase_uid)
     return jsonify({'success': True, 'message': 'Spotify pulling started'})
 
 @app.route('/spotify/pull/stop/<firebase_uid>', methods=['POST'])
@@ -340,11 +479,12 @@ def spotify_pull_status_route(firebase_uid):
 
 @app.route('/slack/worker/start/<firebase_uid>', methods=['POST'])
 def start_slack_worker(firebase_uid):
+    if not drainer.accepting:
+        return jsonify({'error': 'Server is shutting down', 'success': False}), 503
+    sync_sessions.ensure(firebase_uid)
     if not slack_worker_status.get(firebase_uid, False):
         slack_worker_status[firebase_uid] = True
-        t = threading.Thread(target=global_status_worker, args=(firebase_uid,), daemon=True)
-        t.start()
-        status_threads[firebase_uid] = t
+        status_threads[firebase_uid] = sync_clock.spawn(global_status_worker, firebase_uid)
     return jsonify({"success": True, "message": "Slack worker started"})
 
 @app.route('/slack/worker/stop/<firebase_uid>', methods=['POST'])
@@ -357,24 +497,19 @@ def slack_worker_status_route(firebase_uid):
     active = slack_worker_status.get(firebase_uid, False)
     return jsonify({"success": True, "active": active})
 
-def get_user_data(firebase_uid):
+def get_user_data(firebase_uid, fields=None):
     try:
-        user_ref = db.collection('users').document(firebase_uid)
-        user_doc = user_ref.get()
-        if user_doc.exists:
-            return user_doc.to_dict()
-        return {}
+        return user_store.get(firebase_uid, fields)
     except Exception as e:
-        print(f"Error getting user data: {e}")
+        log.error("Error getting user data: %s", e, extra={'uid': firebase_uid})
         return {}
 
 def update_user_data(firebase_uid, data):
     try:
-        user_ref = db.collection('users').document(firebase_uid)
-        user_ref.set(data, merge=True)
+        user_store.update(firebase_uid, data)
         return True
     except Exception as e:
-        print(f"Error updating user data: {e}")
+        log.error("Error updating user data: %s", e, extra={'uid': firebase_uid})
         return False
 
 def check_if_source_exists(src):
@@ -420,12 +555,13 @@ def set_client_status(firebase_uid):
 
         success = update_user_data(firebase_uid, update_data)
         if success:
+            listening.record_play(firebase_uid, source, artist, name)
             return jsonify({"status": "ok"}), 200
         else:
             return jsonify({"error": "Failed to update user data"}), 500
 
     except Exception as e:
-        print(f"Error in set_client_status: {e}")
+        log.error("Error in set_client_status: %s", e, extra={'uid': firebase_uid})
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/set_priority/<firebase_uid>', methods=['POST'])
@@ -476,10 +612,50 @@ def set_priority(firebase_uid):
             return jsonify({"error": "Failed to update user data"}), 500
 
     except Exception as e:
-        print(f"Error in set_client_status: {e}")
+        log.error("Error in set_priority: %s", e, extra={'uid': firebase_uid})
         return jsonify({"error": str(e)}), 500
 
 
+def drain_sessions(deadline=None):
+    jobs = {}
+    for sync in sync_sessions:
+        if sync.active and sync.original_status:
+            sync.active = False
+            jobs[sync.uid] = lambda uid=sync.uid: restore_original_status(uid)
+    for firebase_uid in list(slack_worker_status):
+        slack_worker_status[firebase_uid] = False
+    for firebase_uid in list(spotify_active):
+        spotify_active[firebase_uid] = False
+
+    now = sync_clock.time()
+    for firebase_uid, expiration in list(status_shown.items()):
+        # A queued status must not land after the clear, nor on the next start.
+        outbox_dispatcher.discard(firebase_uid)
+        # Slack already dropped a status whose expiration has passed.
+        if not expiration or expiration > now:
+            jobs[firebase_uid] = lambda uid=firebase_uid: restore_original_status(uid)
+
+    report = drainer.drain(jobs, deadline)
+    log.info("Drain finished in %ss: %d restored, %d failed, %d left undone", report['elapsed'],
+             len(report['restored']), len(report['failed']), len(report['pending']))
+    return report
+
+@app.route('/admin/drain', methods=['POST'])
+def admin_drain():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        deadline = request.args.get('deadline')
+        report = drain_sessions(float(deadline) if deadline else None)
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def handle_sigterm(signum, frame):
+    drain_sessions()
+    sys.exit(0)
+
+
 def verify_token(id_token):
     try:
         decoded_token = auth.verify_id_token(id_token)
@@ -513,4 +689,5 @@ def session_login():
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, handle_sigterm)
     app.run(host="0.0.0.0", port=1605, debug=True)
@@ -0,0 +1,275 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from clock import sync_clock
+from shutdown import retry_after
+from sinks import SINK_TIMEOUT, as_settled, pool
+from synclog import get_logger
+
+log = get_logger("outbox")
+
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "16"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# A status that could not be delivered within this long is no longer worth showing.
+OUTBOX_MAX_AGE = float(os.getenv("OUTBOX_MAX_AGE", "600"))
+# How long a claimed write stays invisible to other workers before it is retried.
+# A batch is written concurrently and given up on after SINK_TIMEOUT, so this must outlast it.
+OUTBOX_LEASE = max(float(os.getenv("OUTBOX_LEASE", "30")), 2 * SINK_TIMEOUT)
+BACKOFF_CAP = 300
+# Slack errors a retry cannot fix.
+PERMANENT_ERRORS = {'invalid_auth', 'not_authed', 'token_revoked', 'account_inactive', 'missing_scope', 'user_not_found'}
+
+
+def is_permanent(exc):
+    response = getattr(exc, 'response', None)
+    try:
+        return response is not None and response.get('error') in PERMANENT_ERRORS
+    except AttributeError:
+        return False
+
+
+class StatusOutbox:
+    """Pending status writes in a local SQLite file, at most one per (user, sink).
+
+    put() replaces an unsent status with the newer one. Workers claim due
+    writes under a lease and acknowledge them by version, so a write that was
+    replaced while in flight stays queued. Writes claimed by a process that
+    crashed become due again once their lease runs out.
+    """
+
+    def __init__(self, path, lease=OUTBOX_LEASE, clock=sync_clock.time):
+        self.path = path
+        self.lease = lease
+        self.clock = clock
+        self.local = threading.local()
+        # Versions only need to grow; seeding from the clock keeps them growing across restarts.
+        self.sequence = itertools.count(int(clock() * 1_000_000))
+        with self.connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    uid TEXT NOT NULL,
+                    sink TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    not_before REAL NOT NULL,
+                    leased_until REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (uid, sink)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (not_before)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # A power loss may drop the last few writes; a process crash cannot.
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def put(self, uid, sink, status):
+        now = self.clock()
+        version = next(self.sequence)
+        # An in-flight write keeps its lease, so the newer one goes out after it.
+        self.connect().execute('''
+            INSERT INTO outbox (uid, sink, version, payload, enqueued_at, not_before) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (uid, sink) DO UPDATE SET version = excluded.version, payload = excluded.payload,
+                enqueued_at = excluded.enqueued_at, not_before = excluded.not_before, attempts = 0
+        ''', (uid, sink, version, json.dumps(status), now, now))
+        return version
+
+    def claim(self, limit=OUTBOX_BATCH):
+        """Leases up to limit due writes; returns (uid, sink, version, status, attempts, enqueued_at) tuples."""
+        now = self.clock()
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('''
+                SELECT uid, sink, version, payload, attempts, enqueued_at FROM outbox
+                WHERE not_before <= ? AND leased_until <= ? ORDER BY not_before LIMIT ?
+            ''', (now, now, limit)).fetchall()
+            conn.executemany('UPDATE outbox SET leased_until = ? WHERE uid = ? AND sink = ?',
+                             [(now + self.lease, uid, sink) for uid, sink, *_ in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [(uid, sink, version, json.loads(payload), attempts, enqueued_at)
+                for uid, sink, version, payload, attempts, enqueued_at in rows]
+
+    def ack(self, uid, sink, version):
+        """Drops a delivered write; True unless a newer one replaced it meanwhile."""
+        conn = self.connect()
+        cursor = conn.execute('DELETE FROM outbox WHERE uid = ? AND sink = ? AND version = ?', (uid, sink, version))
+        if cursor.rowcount:
+            return True
+        conn.execute('UPDATE outbox SET leased_until = 0 WHERE uid = ? AND sink = ?', (uid, sink))
+        return False
+
+    def retry(self, uid, sink, version, delay):
+        conn = self.connect()
+        cursor = conn.execute('''
+            UPDATE outbox SET attempts = attempts + 1, not_before = ?, leased_until = 0
+            WHERE uid = ? AND sink = ? AND version = ?
+        ''', (self.clock() + delay, uid, sink, version))
+        if not cursor.rowcount:
+            conn.execute('UPDATE outbox SET leased_until = 0 WHERE uid = ? AND sink = ?', (uid, sink))
+
+    def discard(self, uid):
+        """Drops every pending write for uid, e.g. before its status is cleared."""
+        return self.connect().execute('DELETE FROM outbox WHERE uid = ?', (uid,)).rowcount
+
+    def recover(self):
+        """Clears leases that ran out, e.g. those of a crashed process; returns how many.
+
+        Live leases are left alone: another process sharing the file may still be
+        delivering them, and resetting them would send those statuses twice.
+        """
+        return self.connect().execute('UPDATE outbox SET leased_until = 0 WHERE leased_until > 0 AND leased_until <= ?',
+                                      (self.clock(),)).rowcount
+
+    def pending(self):
+        return self.connect().execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+
+class OutboxDispatcher:
+    """Worker threads draining a StatusOutbox into the users' sinks.
+
+    submit() records the sink objects in memory alongside the queued status;
+    after a restart they are rebuilt with resolve(uid), which returns the
+    user's sinks. on_result(uid, sink name, error) is called after each
+    delivery and after a write is given up on.
+    """
+
+    def __init__(self, outbox, resolve, on_result=None, workers=OUTBOX_WORKERS,
+                 max_attempts=OUTBOX_MAX_ATTEMPTS, max_age=OUTBOX_MAX_AGE, clock=sync_clock.time):
+        self.outbox = outbox
+        self.resolve = resolve
+        self.on_result = on_result
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+        self.clock = clock
+        self.sinks = {}
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.retried = 0
+        self.expired = 0
+        self.dropped = 0
+
+    def submit(self, uid, sinks, status):
+        with self.lock:
+            for sink in sinks:
+                self.sinks[(uid, sink.name)] = sink
+                self.outbox.put(uid, sink.name, status)
+        self.ready.set()
+
+    def discard(self, uid):
+        with self.lock:
+            for key in [key for key in self.sinks if key[0] == uid]:
+                del self.sinks[key]
+            return self.outbox.discard(uid)
+
+    def sink_for(self, uid, name):
+        sink = self.sinks.get((uid, name))
+        if sink is None:
+            for candidate in self.resolve(uid):
+                self.sinks.setdefault((uid, candidate.name), candidate)
+            sink = self.sinks.get((uid, name))
+        return sink
+
+    def finish(self, uid, name, version, error=None):
+        with self.lock:
+            if self.outbox.ack(uid, name, version):
+                self.sinks.pop((uid, name), None)
+        if self.on_result:
+            self.on_result(uid, name, error)
+
+    def deliver(self, entries):
+        """Writes a claimed batch, every write in flight at once on the sink pool."""
+        now = self.clock()
+        writes = []
+        for entry in entries:
+            uid, name, version, status, attempts, enqueued_at = entry
+            expiration = status.get('expiration') or 0
+            if now - enqueued_at > self.max_age or (expiration and expiration <= now):
+                self.expired += 1
+                self.finish(uid, name, version)
+                continue
+            try:
+                sink = self.sink_for(uid, name)
+            except Exception as e:
+                self.failed(entry, e)
+                continue
+            if sink is None:
+                # The user unlinked the destination since the write was queued.
+                self.dropped += 1
+                self.finish(uid, name, version)
+                continue
+            writes.append((entry, sink))
+
+        started = time.monotonic()
+        futures = [(sink, pool.submit(sink.write, entry[3])) for entry, sink in writes]
+        for i, error in as_settled(futures, started):
+            entry = writes[i][0]
+            uid, name, version = entry[:3]
+            if error is not None:
+                self.failed(entry, error)
+                continue
+            self.delivered += 1
+            log.info("Status delivered", extra={
+                'uid': uid, 'sink': name, 'latency_ms': round((time.monotonic() - started) * 1000, 1)
+            })
+            self.finish(uid, name, version)
+
+    def failed(self, entry, error):
+        uid, name, version, status, attempts, enqueued_at = entry
+        if is_permanent(error) or attempts + 1 >= self.max_attempts:
+            self.dropped += 1
+            log.error("Giving up on status write after %d attempts: %s", attempts + 1, error,
+                      extra={'uid': uid, 'sink': name})
+            self.finish(uid, name, version, str(error))
+        else:
+            self.retried += 1
+            delay = retry_after(error) or min(BACKOFF_CAP, 2 ** attempts)
+            self.outbox.retry(uid, name, version, delay)
+
+    def run_worker(self, is_running):
+        while is_running():
+            try:
+                # Cleared before claiming, so a put() that races the claim still wakes us.
+                self.ready.clear()
+                entries = self.outbox.claim()
+                if not entries:
+                    sync_clock.wait(self.ready, 1.0)
+                    continue
+                self.deliver(entries)
+                self.ready.set()
+            except Exception as e:
+                log.error("Outbox worker error: %s", e)
+                sync_clock.sleep(1.0)
+
+    def start(self, is_running):
+        recovered = self.outbox.recover()
+        if recovered:
+            log.info("Recovered %d in-flight status writes", recovered)
+        return [sync_clock.spawn(self.run_worker, is_running, name=f"outbox-{i}") for i in range(self.workers)]
+
+    def stats(self):
+        return {
+            'pending': self.outbox.pending(),
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'expired': self.expired,
+            'dropped': self.dropped
+        }
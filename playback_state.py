@@ -0,0 +1,123 @@
+from datetime import datetime
+import os
+
+
+GRACE_SECONDS = float(os.getenv("STATUS_GRACE_SECONDS", "30"))
+# Extension sources report a track once when it starts and carry no duration.
+UNTIMED_TTL_SECONDS = float(os.getenv("STATUS_UNTIMED_TTL_SECONDS", "600"))
+# Drift between polls that is not worth an extra write.
+EXTEND_TOLERANCE_SECONDS = 5
+
+IDLE = "idle"
+PLAYING = "playing"
+PAUSED = "paused"
+
+
+def track_ends_at(track):
+    updated = track.get('updated')
+    if not updated:
+        return None
+    started = datetime.fromisoformat(updated).timestamp()
+    if track.get('is_playing') is False:
+        return started
+    duration_ms = track.get('duration_ms')
+    if duration_ms is None:
+        return started + UNTIMED_TTL_SECONDS
+    remaining = max(0, duration_ms - track.get('progress_ms', 0)) / 1000
+    return started + remaining + GRACE_SECONDS
+
+
+def track_boundary(track):
+    """When a timed track is predicted to end, without the grace period; None if unknown."""
+    updated = track.get('updated')
+    duration_ms = track.get('duration_ms')
+    if not updated or duration_ms is None or track.get('is_playing') is False:
+        return None
+    remaining = max(0, duration_ms - track.get('progress_ms', 0)) / 1000
+    return datetime.fromisoformat(updated).timestamp() + remaining
+
+
+def staged_track(track, now):
+    """The track playing at now, switching to the queued 'next' track once its boundary has passed."""
+    upcoming = track.get('next')
+    if not upcoming:
+        return track
+    boundary = track_boundary(track)
+    if boundary is None or now < boundary:
+        return track
+    return {
+        **upcoming,
+        'progress_ms': 0,
+        'is_playing': True,
+        'updated': datetime.fromtimestamp(boundary).isoformat(),
+        'predicted': True
+    }
+
+
+def next_boundary(track, now):
+    """Seconds until the staged track switches over, or None when nothing is staged."""
+    if not track or not track.get('next'):
+        return None
+    boundary = track_boundary(track)
+    if boundary is None or boundary <= now:
+        return None
+    return boundary - now
+
+
+class PlaybackState:
+    """Per-user playing/paused state deciding when a Slack write is needed."""
+
+    def __init__(self):
+        self.state = IDLE
+        self.status_text = None
+        self.track_key = None
+        self.expires_at = 0
+        self.predicted = False
+
+    def should_write(self, status_text, ends_at, now, track_key=None, predicted=False):
+        """Returns the status_expiration to write, or None when Slack is already right.
+
+        track_key, when given, is the canonical identity of the track; a text
+        that differs only in decoration from the one written is not a change.
+        predicted marks a track staged from the queue rather than seen playing.
+        """
+        if status_text is None or (ends_at is not None and ends_at <= now):
+            # Slack clears the status itself at the expiration we wrote last.
+            if self.state == PLAYING:
+                self.state = PAUSED
+            return None
+
+        resumed = self.state != PLAYING
+        self.state = PLAYING
+        changed = status_text != self.status_text and (track_key is None or track_key != self.track_key)
+        if not changed and not predicted:
+            # A poll saw the predicted track actually playing.
+            self.predicted = False
+        if ends_at is None:
+            if resumed or changed or self.expires_at:
+                return 0
+            return None
+        if resumed or changed or ends_at > self.expires_at + EXTEND_TOLERANCE_SECONDS:
+            return int(ends_at)
+        return None
+
+    def written(self, status_text, expiration, track_key=None, predicted=False):
+        self.status_text = status_text
+        self.track_key = track_key
+        self.expires_at = expiration
+        self.predicted = predicted
+
+    def should_clear(self):
+        """True when Slack shows a predicted track that playback did not confirm.
+
+        Call before should_write(None, ...): unlike a track that was seen
+        playing, a wrong prediction should not stay up until it expires.
+        """
+        return self.state == PLAYING and self.predicted
+
+    def reset(self):
+        self.state = IDLE
+        self.status_text = None
+        self.track_key = None
+        self.expires_at = 0
+        self.predicted = False
@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+WORKER_THREADS = ("slack_sync_worker", "spotify_pull_worker")
+
+
+class SamplingProfiler:
+    """Samples the stacks of selected threads from a background thread."""
+
+    def __init__(self, interval=0.005, thread_ids=None, thread_names=None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.thread_names = tuple(thread_names) if thread_names else None
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _wanted(self, ident, names):
+        if ident == self._thread.ident:
+            return False
+        if self.thread_ids is not None and ident not in self.thread_ids:
+            return False
+        if self.thread_names is not None:
+            name = names.get(ident, "")
+            return any(n in name for n in self.thread_names)
+        return True
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if not self._wanted(ident, names):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped_at = time.time()
+        return self
+
+    def collapsed(self):
+        lines = []
+        for (thread_name, stack), count in self.samples.most_common():
+            lines.append(";".join((thread_name,) + stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name="profile"):
+        frames = []
+        frame_index = {}
+        per_thread = {}
+        for (thread_name, stack), count in self.samples.items():
+            indexes = []
+            for entry in stack:
+                if entry not in frame_index:
+                    frame_index[entry] = len(frames)
+                    frames.append({"name": entry})
+                indexes.append(frame_index[entry])
+            samples, weights = per_thread.setdefault(thread_name, ([], []))
+            samples.append(indexes)
+            weights.append(count)
+
+        profiles = []
+        for thread_name, (samples, weights) in sorted(per_thread.items()):
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "none",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "slackify-profiler",
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+    def write(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(directory, f"{name}-{stamp}")
+        with open(base + ".collapsed.txt", "w") as f:
+            f.write(self.collapsed())
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(self.speedscope(name), f)
+        return {
+            "collapsed": base + ".collapsed.txt",
+            "speedscope": base + ".speedscope.json",
+            "samples": self.sample_count,
+            "duration": round((self.stopped_at or time.time()) - self.started_at, 3)
+        }
+
+
+def profile_workers(seconds, directory, thread_names=WORKER_THREADS, interval=0.005):
+    profiler = SamplingProfiler(interval=interval, thread_names=thread_names).start()
+    time.sleep(seconds)
+    profiler.stop()
+    return profiler.write(directory, "workers")
@@ -0,0 +1,307 @@
+import os
+
+from clock import sync_clock
+from governor import Throttled
+from lean_api import fetch_playback, fetch_next_track, artist_names, spotify_errors
+from playback_state import track_ends_at, track_boundary
+from synclog import get_logger
+
+log = get_logger("providers")
+
+
+SPOTIFY_LOOKAHEAD = os.getenv("SPOTIFY_LOOKAHEAD", "0") == "1"
+# Seconds after a predicted track boundary at which the confirming poll runs.
+LOOKAHEAD_CONFIRM_DELAY = float(os.getenv("LOOKAHEAD_CONFIRM_DELAY", "2"))
+# Longest gap between polls while a boundary is predicted, to notice skips and pauses.
+LOOKAHEAD_MAX_INTERVAL = float(os.getenv("LOOKAHEAD_MAX_INTERVAL", "30"))
+# How long a poll waits for the shared Spotify budget before it is deferred.
+GOVERNOR_WAIT = float(os.getenv("SPOTIFY_GOVERNOR_WAIT", "5"))
+
+
+class MusicProvider:
+    """A music source that can be polled server-side and/or pushed to by the extension."""
+
+    name = None
+    pollable = False
+    interval = 30
+    max_backoff = 600
+
+    def credentials(self, user_data):
+        return None
+
+    def poll(self, firebase_uid, credentials):
+        """Returns the song data currently playing, or None when nothing is."""
+        raise NotImplementedError
+
+    def ingest(self, data):
+        name = data.get('name')
+        artist = data.get('artist')
+        if not name or not artist:
+            raise ValueError("Name and artist are required")
+        return {
+            'name': name,
+            'artist': artist,
+            'updated': sync_clock.now().isoformat()
+        }
+
+    def refresh_token(self, firebase_uid, credentials):
+        return None
+
+    def next_poll_in(self, firebase_uid, song_data, now):
+        """Seconds until the next poll after one that returned song_data."""
+        return self.interval
+
+    def is_auth_error(self, error):
+        return False
+
+    def backoff(self, failures, retry_after=None):
+        if retry_after:
+            return max(retry_after, self.interval)
+        return min(self.interval * 2 ** failures, self.max_backoff)
+
+
+class ExtensionProvider(MusicProvider):
+    """Sources only the browser extension can see; they are never polled."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+class SpotifyProvider(MusicProvider):
+    """Polls the Spotify player.
+
+    With lookahead, the head of the queue is fetched once per track and sent
+    along as 'next', so the sync loop can switch the status at the predicted
+    boundary; the next poll lands just after that boundary to confirm it.
+
+    With a governor, every call draws on the app-wide request budget, a 429
+    holds back all users until its Retry-After, and poll intervals stretch
+    to each user's share of the budget.
+    """
+
+    name = "spotify"
+    pollable = True
+
+    def __init__(self, refresh, snapshots=None, lookahead=SPOTIFY_LOOKAHEAD,
+                 confirm_delay=LOOKAHEAD_CONFIRM_DELAY, max_interval=LOOKAHEAD_MAX_INTERVAL, governor=None):
+        self.refresh = refresh
+        self.snapshots = snapshots
+        self.governor = governor
+        self.lookahead = lookahead
+        self.confirm_delay = confirm_delay
+        self.max_interval = max_interval
+        # uid -> (id of the playing track, song data of the one queued after it)
+        self.queued = {}
+        self.queue_calls = 0
+
+    def credentials(self, user_data):
+        spotify = user_data.get('spotify', {})
+        if not spotify.get('access_token'):
+            return None
+        return {'access_token': spotify['access_token'], 'refresh_token': spotify.get('refresh_token')}
+
+    def call(self, fetch, access_token):
+        if self.governor is None:
+            return fetch(access_token)
+        self.governor.acquire(GOVERNOR_WAIT)
+        try:
+            return fetch(access_token)
+        except spotify_errors.SpotifyException as e:
+            if e.http_status == 429:
+                self.governor.penalize(retry_after_of(e))
+            raise
+
+    def poll(self, firebase_uid, credentials):
+        playback = self.call(fetch_playback, credentials['access_token'])
+        if self.snapshots is not None:
+            self.snapshots.put(firebase_uid, playback)
+        if not (playback and playback.is_playing and playback.item):
+            return None
+        track = playback.item
+        song_data = {
+            "name": track.name,
+            "artist": artist_names(track),
+            "duration_ms": track.duration_ms,
+            "progress_ms": playback.progress_ms or 0,
+            "is_playing": True,
+            "updated": sync_clock.now().isoformat()
+        }
+        # Always written, even as None: the document is merged, so a missing
+        # key would leave the previous track's 'next' to be staged again.
+        song_data['next'] = self.upcoming(firebase_uid, credentials, track) if self.lookahead else None
+        return song_data
+
+    def upcoming(self, firebase_uid, credentials, track):
+        cached = self.queued.get(firebase_uid)
+        track_id = track.id or (track.name, artist_names(track))
+        if cached is not None and cached[0] == track_id:
+            return cached[1]
+        upcoming = None
+        try:
+            self.queue_calls += 1
+            queued = self.call(fetch_next_track, credentials['access_token'])
+            if queued is not None:
+                upcoming = {"name": queued.name, "artist": artist_names(queued), "duration_ms": queued.duration_ms}
+        except (spotify_errors.SpotifyException, Throttled) as e:
+            # Lookahead is best effort; the regular polls still catch the change.
+            log.warning("Queue lookup failed: %s", e, extra={'uid': firebase_uid, 'source': self.name})
+        self.queued[firebase_uid] = (track_id, upcoming)
+        return upcoming
+
+    def next_poll_in(self, firebase_uid, song_data, now):
+        boundary = track_boundary(song_data) if self.lookahead and song_data else None
+        if boundary is None:
+            delay = self.interval
+        else:
+            delay = max(1, min(boundary + self.confirm_delay - now, self.max_interval))
+        if self.governor is None:
+            return delay
+        self.governor.update(firebase_uid, playing=bool(song_data))
+        return self.governor.interval(firebase_uid, self.interval, delay)
+
+    def forget(self, firebase_uid):
+        self.queued.pop(firebase_uid, None)
+        if self.governor is not None:
+            self.governor.forget(firebase_uid)
+
+    def refresh_token(self, firebase_uid, credentials):
+        new_token = self.refresh(firebase_uid, credentials['refresh_token'])
+        if not new_token:
+            return None
+        return {**credentials, 'access_token': new_token}
+
+    def is_auth_error(self, error):
+        return isinstance(error, spotify_errors.SpotifyException) and error.http_status == 401
+
+
+class FakeProvider(MusicProvider):
+    """Local provider replaying a scripted list of tracks, for tests and simulations."""
+
+    pollable = True
+
+    def __init__(self, name, script, interval=30):
+        self.name = name
+        self.script = list(script)
+        self.interval = interval
+        self.calls = 0
+
+    def credentials(self, user_data):
+        return {}
+
+    def poll(self, firebase_uid, credentials):
+        self.calls += 1
+        track = self.script.pop(0) if self.script else None
+        if track is None:
+            return None
+        return {**track, 'is_playing': True, 'updated': sync_clock.now().isoformat()}
+
+
+def retry_after_of(error):
+    headers = getattr(error, 'headers', None) or {}
+    if getattr(error, 'http_status', None) != 429:
+        return None
+    try:
+        return float(headers.get('Retry-After', 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class PollScheduler:
+    """Polls all of one user's providers in a single slot, in priority order.
+
+    Once a source is playing, lower-priority sources are not polled until it
+    stops, since their result could not change the resolved status.
+    """
+
+    def __init__(self, firebase_uid, providers, store):
+        self.firebase_uid = firebase_uid
+        self.providers = providers
+        self.store = store
+        self.credentials = {}
+        self.next_poll = {}
+        self.failures = {}
+        self.playing = {}
+        self.calls = 0
+        self.skipped = 0
+
+    def ordered(self, user_data):
+        priority_list = user_data.get("priority", {}).get("list", "")
+        names = [s.strip().lower() for s in priority_list.split(",") if s.strip()]
+        names += [name for name in self.providers if name not in names]
+        return [self.providers[name] for name in names if name in self.providers]
+
+    def pushed_playing(self, provider, user_data, now):
+        track = user_data.get(f"last_{provider.name}")
+        if not track:
+            return False
+        ends_at = track_ends_at(track)
+        return ends_at is None or ends_at > now
+
+    def poll_once(self, user_data, now=None):
+        """Runs one scheduling slot; returns seconds until the next poll is due."""
+        now = now or sync_clock.time()
+        higher_playing = False
+        next_due = None
+
+        for provider in self.ordered(user_data):
+            if not provider.pollable:
+                higher_playing = higher_playing or self.pushed_playing(provider, user_data, now)
+                continue
+            if higher_playing:
+                if self.playing.get(provider.name):
+                    self.mark_stopped(provider)
+                self.skipped += 1
+                continue
+
+            if now >= self.next_poll.get(provider.name, 0):
+                self.poll_provider(provider, user_data, now)
+            due = self.next_poll.get(provider.name, now + provider.interval)
+            next_due = due if next_due is None else min(next_due, due)
+            higher_playing = higher_playing or self.playing.get(provider.name, False)
+
+        if next_due is None:
+            return min(p.interval for p in self.providers.values())
+        return max(1, next_due - now)
+
+    def poll_provider(self, provider, user_data, now):
+        if provider.name not in self.credentials:
+            self.credentials[provider.name] = provider.credentials(user_data)
+        credentials = self.credentials[provider.name]
+        if credentials is None:
+            self.next_poll[provider.name] = now + provider.interval
+            return
+
+        try:
+            self.calls += 1
+            song_data = provider.poll(self.firebase_uid, credentials)
+        except Exception as e:
+            if provider.is_auth_error(e):
+                refreshed = provider.refresh_token(self.firebase_uid, credentials)
+                if refreshed:
+                    self.credentials[provider.name] = refreshed
+                    self.next_poll[provider.name] = now
+                    return
+                log.warning("Token refresh failed", extra={'uid': self.firebase_uid, 'source': provider.name})
+            elif isinstance(e, Throttled):
+                log.debug("Poll deferred: %s", e, extra={'uid': self.firebase_uid, 'source': provider.name})
+            else:
+                log.error("Poll error: %s", e, extra={'uid': self.firebase_uid, 'source': provider.name})
+            failures = self.failures.get(provider.name, 0)
+            self.failures[provider.name] = failures + 1
+            self.next_poll[provider.name] = now + provider.backoff(failures, retry_after_of(e))
+            return
+
+        self.failures[provider.name] = 0
+        self.next_poll[provider.name] = now + provider.next_poll_in(self.firebase_uid, song_data, now)
+        if song_data:
+            self.playing[provider.name] = True
+            self.store(provider.name, song_data)
+        elif self.playing.get(provider.name):
+            self.mark_stopped(provider)
+
+    def mark_stopped(self, provider):
+        self.playing[provider.name] = False
+        self.store(provider.name, {
+            "is_playing": False,
+            "updated": sync_clock.now().isoformat()
+        })
@@ -0,0 +1,159 @@
+import gc
+import os
+import resource
+import threading
+import tracemalloc
+
+from clock import sync_clock
+from synclog import get_logger
+
+log = get_logger("reaper")
+
+
+REAP_INTERVAL = float(os.getenv("REAP_INTERVAL", "60"))
+# Stopped sessions are kept this long after they were last seen so status pages still work.
+REAP_IDLE_SECONDS = float(os.getenv("REAP_IDLE_SECONDS", "3600"))
+# RSS above which idle state is evicted least recently seen first; 0 disables the budget.
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "0"))
+# Share of the evictable sessions dropped per reap while over budget.
+BUDGET_EVICT_FRACTION = 0.25
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS, but the best available off Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Reaper:
+    """Evicts sessions nobody is using, along with every cache keyed by their uid.
+
+    A session is evictable when none of its workers is alive and the uid is
+    not marked active or pulling. It is evicted once it has not been seen for
+    idle_seconds, or earlier, least recently seen first, while the process is
+    over its memory budget. A session whose worker died without clearing its
+    flags is evicted after idle_seconds as well. forget_hooks are called with
+    each evicted uid to drop whatever else is kept for it.
+    """
+
+    def __init__(self, table, forget_hooks=(), is_running=None,
+                 idle_seconds=REAP_IDLE_SECONDS, budget_mb=MEMORY_BUDGET_MB, clock=sync_clock.time):
+        self.table = table
+        self.forget_hooks = list(forget_hooks)
+        self.is_running = is_running or (lambda sync: sync.running() or sync.pull_running())
+        self.idle_seconds = idle_seconds
+        self.budget = budget_mb * 1024 * 1024
+        self.clock = clock
+        self.evicted = 0
+        self.pressure_evicted = 0
+        self.last_rss = 0
+
+    def evict(self, sync):
+        if self.table.pop(sync.uid) is None:
+            return
+        for hook in self.forget_hooks:
+            try:
+                hook(sync.uid)
+            except Exception as e:
+                log.warning("Forget hook failed: %s", e, extra={'uid': sync.uid})
+
+    def reap(self):
+        now = self.clock()
+        stale, idle = [], []
+        for sync in self.table:
+            if self.is_running(sync):
+                continue
+            if now - sync.last_seen > self.idle_seconds:
+                stale.append(sync)
+            elif not sync.active and not sync.pulling:
+                idle.append(sync)
+
+        for sync in stale:
+            self.evict(sync)
+        self.evicted += len(stale)
+
+        pressured = 0
+        self.last_rss = rss_bytes()
+        if self.budget and self.last_rss > self.budget and idle:
+            idle.sort(key=lambda s: s.last_seen)
+            pressured = max(1, int(len(idle) * BUDGET_EVICT_FRACTION))
+            for sync in idle[:pressured]:
+                self.evict(sync)
+            self.pressure_evicted += pressured
+            gc.collect()
+
+        if stale or pressured:
+            log.info("Reaped %d stale and %d idle sessions", len(stale), pressured,
+                     extra={'kind': 'reap'})
+        return {'stale': len(stale), 'idle': pressured}
+
+    def run(self, is_running, interval=REAP_INTERVAL):
+        while is_running():
+            try:
+                self.reap()
+            except Exception as e:
+                log.error("Reaper error: %s", e)
+            sync_clock.sleep(interval)
+
+    def stats(self):
+        return {
+            'evicted': self.evicted,
+            'pressure_evicted': self.pressure_evicted,
+            'rss_mb': round(self.last_rss / 1024 / 1024, 1),
+            'budget_mb': round(self.budget / 1024 / 1024, 1) if self.budget else None
+        }
+
+
+class MemoryInspector:
+    """tracemalloc snapshots for /debug/memory, each compared with the previous one.
+
+    Tracing slows every allocation, so it only runs when start() was called
+    at startup (MEMORY_TRACE=1); otherwise the report has RSS alone.
+    """
+
+    def __init__(self, frames=int(os.getenv("MEMORY_TRACE_FRAMES", "1"))):
+        self.frames = frames
+        self.previous = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def report(self, limit=20):
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                return {
+                    'tracing': False,
+                    'rss_mb': round(rss_bytes() / 1024 / 1024, 1),
+                    'top': [],
+                    'growth': []
+                }
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            top = [
+                {'where': str(stat.traceback), 'kb': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:limit]
+            ]
+            growth = []
+            if self.previous is not None:
+                growth = [
+                    {'where': str(stat.traceback), 'kb_diff': round(stat.size_diff / 1024, 1),
+                     'count_diff': stat.count_diff}
+                    for stat in snapshot.compare_to(self.previous, 'lineno')[:limit]
+                ]
+            self.previous = snapshot
+            return {
+                'tracing': True,
+                'traced_kb': round(current / 1024, 1),
+                'peak_kb': round(peak / 1024, 1),
+                'rss_mb': round(rss_bytes() / 1024 / 1024, 1),
+                'top': top,
+                'growth': growth
+            }
@@ -0,0 +1,272 @@
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from clock import sync_clock
+from lean_api import get_presence, get_team_dnd
+from synclog import get_logger
+
+log = get_logger("schedule")
+
+
+PRESENCE_INTERVAL = float(os.getenv("PRESENCE_INTERVAL", "300"))
+DND_BATCH_SIZE = 50
+ALL_DAYS = (0, 1, 2, 3, 4, 5, 6)
+
+
+def parse_clock(value):
+    """'HH:MM' -> minutes after midnight."""
+    hours, minutes = value.split(":")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {value}")
+    return hours * 60 + minutes
+
+
+def parse_days(days):
+    """Weekday numbers, Monday 0 to Sunday 6; anything else is a ValueError."""
+    if not isinstance(days, (list, tuple, set, frozenset)) or not all(
+            isinstance(day, int) and not isinstance(day, bool) and 0 <= day <= 6 for day in days):
+        raise ValueError(f"Invalid days: {days!r}, expected weekday numbers 0-6")
+    return frozenset(days)
+
+
+class SyncSchedule:
+    """When a user's status is worth syncing: working days and quiet hours in their time zone.
+
+    Stored on the user document as
+        schedule: {tz, days: [0-6, Monday first], quiet_start: 'HH:MM', quiet_end: 'HH:MM', presence: bool}
+    Quiet hours may wrap past midnight. presence also suspends syncing while
+    the user is away or in Do Not Disturb on Slack.
+    """
+
+    __slots__ = ('tz', 'days', 'quiet_start', 'quiet_end', 'presence')
+
+    def __init__(self, tz="UTC", days=ALL_DAYS, quiet_start=None, quiet_end=None, presence=False):
+        self.tz = ZoneInfo(tz)
+        self.days = parse_days(days) or frozenset(ALL_DAYS)
+        self.quiet_start = parse_clock(quiet_start) if quiet_start else None
+        self.quiet_end = parse_clock(quiet_end) if quiet_end else None
+        self.presence = bool(presence)
+
+    @classmethod
+    def from_user(cls, user_data):
+        """Returns None when the user has no schedule or it cannot be parsed."""
+        config = user_data.get('schedule')
+        if not config:
+            return None
+        try:
+            return cls(
+                tz=config.get('tz') or "UTC",
+                days=config.get('days') or ALL_DAYS,
+                quiet_start=config.get('quiet_start'),
+                quiet_end=config.get('quiet_end'),
+                presence=config.get('presence', False)
+            )
+        except (ValueError, ZoneInfoNotFoundError):
+            return None
+
+    def quiet(self, minute):
+        if self.quiet_start is None or self.quiet_end is None or self.quiet_start == self.quiet_end:
+            return False
+        if self.quiet_start < self.quiet_end:
+            return self.quiet_start <= minute < self.quiet_end
+        return minute >= self.quiet_start or minute < self.quiet_end
+
+    def is_open(self, local):
+        return local.weekday() in self.days and not self.quiet(local.hour * 60 + local.minute)
+
+    def next_open(self, now):
+        """None if syncing is allowed at now, else the timestamp when it next is."""
+        local = datetime.fromtimestamp(now, self.tz)
+        if self.is_open(local):
+            return None
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        candidates = []
+        for offset in range(8):
+            day = midnight + timedelta(days=offset)
+            candidates.append(day)
+            if self.quiet_end is not None:
+                candidates.append(day.replace(hour=self.quiet_end // 60, minute=self.quiet_end % 60))
+        for candidate in sorted(candidates):
+            if candidate > local and self.is_open(candidate):
+                return candidate.timestamp()
+        return None
+
+    def to_json(self):
+        return {
+            'tz': self.tz.key,
+            'days': sorted(self.days),
+            'quiet_start': f"{self.quiet_start // 60:02d}:{self.quiet_start % 60:02d}" if self.quiet_start is not None else None,
+            'quiet_end': f"{self.quiet_end // 60:02d}:{self.quiet_end % 60:02d}" if self.quiet_end is not None else None,
+            'presence': self.presence
+        }
+
+
+class PresenceMonitor:
+    """Slack presence and DND for opted-in users, refreshed in one sweep per interval.
+
+    Workers only read the cached result. DND is fetched per workspace in
+    batches of up to 50 users; presence has no batch endpoint, so it costs one
+    call per watched user per sweep rather than one per worker loop.
+    """
+
+    def __init__(self, interval=PRESENCE_INTERVAL, clock=sync_clock.time,
+                 fetch_presence=get_presence, fetch_dnd=get_team_dnd):
+        self.interval = interval
+        self.clock = clock
+        self.fetch_presence = fetch_presence
+        self.fetch_dnd = fetch_dnd
+        self.watched = {}
+        self.hidden_until = {}
+        self.next_sweep = 0.0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def watch(self, firebase_uid, access_token, team_id, slack_user_id):
+        with self.lock:
+            self.watched[firebase_uid] = (access_token, team_id, slack_user_id)
+
+    def unwatch(self, firebase_uid):
+        with self.lock:
+            self.watched.pop(firebase_uid, None)
+            self.hidden_until.pop(firebase_uid, None)
+
+    def away_until(self, firebase_uid, now):
+        """None if the user can see their status (or is unknown), else when to look again."""
+        until = self.hidden_until.get(firebase_uid)
+        if until is None or until <= now:
+            return None
+        return until
+
+    def sweep(self):
+        now = self.clock()
+        with self.lock:
+            watched = dict(self.watched)
+        self.next_sweep = now + self.interval
+
+        teams = {}
+        for firebase_uid, (token, team_id, slack_user_id) in watched.items():
+            teams.setdefault(team_id, []).append((firebase_uid, token, slack_user_id))
+
+        hidden = {}
+        for members in teams.values():
+            token = members[0][1]
+            for start in range(0, len(members), DND_BATCH_SIZE):
+                batch = members[start:start + DND_BATCH_SIZE]
+                try:
+                    self.calls += 1
+                    dnd = self.fetch_dnd(token, [slack_user_id for _, _, slack_user_id in batch])
+                except Exception as e:
+                    log.warning("DND lookup failed: %s", e)
+                    dnd = {}
+                for firebase_uid, _, slack_user_id in batch:
+                    info = dnd.get(slack_user_id) or {}
+                    if info.get('dnd_enabled') and info.get('next_dnd_start_ts', now + 1) <= now < info.get('next_dnd_end_ts', 0):
+                        hidden[firebase_uid] = float(info['next_dnd_end_ts'])
+
+            for firebase_uid, member_token, slack_user_id in members:
+                if firebase_uid in hidden:
+                    continue
+                try:
+                    self.calls += 1
+                    if self.fetch_presence(member_token, slack_user_id) == 'away':
+                        hidden[firebase_uid] = self.next_sweep
+                except Exception as e:
+                    log.warning("Presence lookup failed: %s", e, extra={'uid': firebase_uid})
+
+        with self.lock:
+            self.hidden_until = {uid: until for uid, until in hidden.items() if uid in self.watched}
+
+    def run(self, is_running):
+        while is_running():
+            try:
+                if self.watched:
+                    self.sweep()
+            except Exception as e:
+                log.error("Presence sweep error: %s", e)
+            sync_clock.sleep(self.interval)
+
+
+class ParkingLot:
+    """Suspended sessions, ordered by the time they may run again.
+
+    A worker parks itself and blocks on the returned event; one dispatcher
+    thread sleeps until the earliest wake time and releases whatever is due.
+    wake() releases a session early, e.g. when it is stopped or its schedule
+    changes.
+    """
+
+    def __init__(self, clock=sync_clock.time):
+        self.clock = clock
+        self.heap = []
+        self.parked = {}
+        self.counter = itertools.count()
+        self.parks = 0
+        self.condition = threading.Condition()
+
+    def park(self, key, until):
+        event = threading.Event()
+        with self.condition:
+            previous = self.parked.pop(key, None)
+            if previous is not None:
+                previous[0].set()
+            self.parked[key] = (event, until)
+            heapq.heappush(self.heap, (until, next(self.counter), key, event))
+            self.parks += 1
+            self.condition.notify()
+        return event
+
+    def wake(self, key):
+        with self.condition:
+            entry = self.parked.pop(key, None)
+            if entry is not None:
+                entry[0].set()
+
+    def wake_all(self):
+        with self.condition:
+            for event, _ in self.parked.values():
+                event.set()
+            self.parked.clear()
+            self.heap.clear()
+
+    def release_due(self, now):
+        released = 0
+        while self.heap and self.heap[0][0] <= now:
+            _, _, key, event = heapq.heappop(self.heap)
+            entry = self.parked.get(key)
+            if entry is not None and entry[0] is event:
+                del self.parked[key]
+            event.set()
+            released += 1
+        return released
+
+    def run(self, is_running):
+        with self.condition:
+            while is_running():
+                self.release_due(self.clock())
+                timeout = self.heap[0][0] - self.clock() if self.heap else 60
+                self.condition.wait(max(0.05, min(timeout, 60)))
+
+    def until(self, key):
+        entry = self.parked.get(key)
+        return entry[1] if entry else None
+
+    def stats(self):
+        return {'parked': len(self.parked), 'parks': self.parks,
+                'next_wake': self.heap[0][0] if self.heap else None}
+
+
+def resume_at(schedule, presence, firebase_uid, now):
+    """None if the session may run now, else the timestamp at which to look again."""
+    if schedule is None:
+        return None
+    opens = schedule.next_open(now)
+    if opens is not None:
+        return opens
+    if schedule.presence and presence is not None:
+        return presence.away_until(firebase_uid, now)
+    return None
@@ -0,0 +1,285 @@
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from enum import IntEnum
+
+from clock import sync_clock
+
+
+class SyncError(IntEnum):
+    NONE = 0
+    NO_SLACK_TOKEN = 1
+    USER_NOT_FOUND = 2
+    NO_TRACK = 3
+    EXCEPTION = 4
+
+
+ERROR_MESSAGES = {
+    SyncError.NONE: None,
+    SyncError.NO_SLACK_TOKEN: "No Slack token",
+    SyncError.USER_NOT_FOUND: "User not found",
+    SyncError.NO_TRACK: "No track found",
+}
+
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+def parse_error_filter(value):
+    if not value:
+        return None
+    if value == "any":
+        return value
+    return SyncError[value.upper()]
+
+
+def encode_cursor(ts, uid):
+    return f"{ts!r}|{uid}"
+
+
+def decode_cursor(cursor):
+    ts, uid = cursor.split("|", 1)
+    return float(ts), uid
+
+
+class SyncSession:
+    """Everything the server keeps in memory for one user's sync and pull loops.
+
+    active, error and last_update are properties so the owning table can keep
+    its aggregate counters and last_update index current on every change.
+    """
+
+    __slots__ = (
+        'uid', 'table', '_active', 'generation', 'current_song', '_last_update',
+        'index_ts', '_error', 'error_detail', 'error_count', 'thread', 'playback',
+        '_pulling', 'pull_thread', 'original_status', 'suspended_until', 'last_seen'
+    )
+
+    def __init__(self, uid, table):
+        self.uid = uid
+        self.table = table
+        self._active = False
+        self.generation = 0
+        self.current_song = None
+        self._last_update = 0.0
+        self.index_ts = 0.0
+        self._error = SyncError.NONE
+        self.error_detail = None
+        self.error_count = 0
+        self.thread = None
+        self.playback = None
+        self._pulling = False
+        self.pull_thread = None
+        self.original_status = None
+        self.suspended_until = None
+        self.last_seen = 0.0
+
+    @property
+    def active(self):
+        return self._active
+
+    @active.setter
+    def active(self, value):
+        value = bool(value)
+        if value != self._active:
+            self._active = value
+            self.table._count('active', 1 if value else -1)
+            if value:
+                self.table._index(self, self.table.clock())
+            self.table._changed(self)
+
+    @property
+    def pulling(self):
+        return self._pulling
+
+    @pulling.setter
+    def pulling(self, value):
+        value = bool(value)
+        if value != self._pulling:
+            self._pulling = value
+            self.table._count('pulling', 1 if value else -1)
+            self.table._changed(self)
+
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def last_update(self):
+        return self._last_update
+
+    @last_update.setter
+    def last_update(self, ts):
+        self._last_update = ts
+        if ts:
+            self.table._index(self, ts)
+        self.table._changed(self)
+
+    def set_error(self, code, detail=None):
+        if code == self._error and code != SyncError.EXCEPTION:
+            return
+        if code != self._error:
+            self.table._move_error(self._error, code)
+            self._error = code
+        self.error_detail = detail
+        if code == SyncError.EXCEPTION:
+            self.error_count += 1
+        self.table._changed(self)
+
+    def set_suspended(self, until):
+        self.suspended_until = until
+        self.table._changed(self)
+
+    def error_message(self):
+        if self._error == SyncError.EXCEPTION:
+            return self.error_detail
+        return ERROR_MESSAGES[self._error]
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def pull_running(self):
+        return self.pull_thread is not None and self.pull_thread.is_alive()
+
+    def to_json(self):
+        return {
+            'running': self.running(),
+            'active': self._active,
+            'current_song': self.current_song,
+            'last_update': format_timestamp(self._last_update),
+            'error': self.error_message(),
+            'error_count': self.error_count,
+            'suspended_until': format_timestamp(self.suspended_until)
+        }
+
+    def summary_json(self):
+        return {
+            'current_song': self.current_song,
+            'last_update': format_timestamp(self._last_update),
+            'error': self.error_message(),
+            'error_count': self.error_count
+        }
+
+
+class SessionTable:
+    """Sessions by uid, with O(1) aggregate counts and a last_update index.
+
+    The index is an append-only list of (ts, uid) pairs kept in ts order; a
+    session's older entries are skipped while paging and dropped whenever the
+    list is compacted.
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or sync_clock.time
+        self.sessions = {}
+        self.counts = Counter()
+        self.errors = Counter()
+        self.order = []
+        self.lock = threading.Lock()
+        self.on_change = None
+
+    def _changed(self, sync):
+        if self.on_change is not None:
+            self.on_change(sync.uid)
+
+    def _count(self, key, delta):
+        with self.lock:
+            self.counts[key] += delta
+
+    def _move_error(self, old, new):
+        with self.lock:
+            if old != SyncError.NONE:
+                self.errors[old] -= 1
+            if new != SyncError.NONE:
+                self.errors[new] += 1
+
+    def _index(self, sync, ts):
+        with self.lock:
+            # Activating and updating in the same tick would index the same pair twice.
+            if sync.index_ts == ts:
+                return
+            sync.index_ts = ts
+            entry = (ts, sync.uid)
+            if self.order and entry < self.order[-1]:
+                self.order.insert(bisect_left(self.order, entry), entry)
+            else:
+                self.order.append(entry)
+            self._compact()
+
+    def _compact(self):
+        if len(self.order) > 2 * len(self.sessions) + 1024:
+            self.order = sorted((s.index_ts, s.uid) for s in list(self.sessions.values()) if s.index_ts)
+
+    def get(self, uid):
+        sync = self.sessions.get(uid)
+        if sync is not None:
+            sync.last_seen = self.clock()
+        return sync
+
+    def ensure(self, uid):
+        sync = self.sessions.get(uid)
+        if sync is None:
+            uid = sys.intern(uid)
+            sync = self.sessions.setdefault(uid, SyncSession(uid, self))
+        sync.last_seen = self.clock()
+        return sync
+
+    def pop(self, uid):
+        sync = self.sessions.pop(uid, None)
+        if sync is not None:
+            sync.active = False
+            sync.pulling = False
+            sync.set_error(SyncError.NONE)
+            with self.lock:
+                self._compact()
+        return sync
+
+    def stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'active': self.counts['active'],
+            'pulling': self.counts['pulling'],
+            'erroring': sum(self.errors.values()),
+            'errors': {code.name.lower(): count for code, count in self.errors.items() if count}
+        }
+
+    def page(self, limit=100, after=None, error=None, active_only=True):
+        """Sessions newest first by last update, starting after a decode_cursor() position.
+
+        error filters on a SyncError code, or on any error when it is "any".
+        """
+        order = self.order
+        pos = bisect_left(order, after) if after else len(order)
+        results = []
+        last_entry = None
+        next_cursor = None
+        for i in range(pos - 1, -1, -1):
+            ts, uid = order[i]
+            sync = self.sessions.get(uid)
+            if sync is None or sync.index_ts != ts:
+                continue
+            if active_only and not sync.active:
+                continue
+            if error == "any":
+                if sync.error == SyncError.NONE:
+                    continue
+            elif error is not None and sync.error != error:
+                continue
+            if len(results) == limit:
+                next_cursor = encode_cursor(*last_entry)
+                break
+            results.append(sync)
+            last_entry = (ts, uid)
+        return results, next_cursor
+
+    def __contains__(self, uid):
+        return uid in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __len__(self):
+        return len(self.sessions)
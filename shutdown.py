@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class RateLimiter:
+    """Token bucket shared by all drain workers."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+def retry_after(exc):
+    response = getattr(exc, 'response', None)
+    if response is None or getattr(response, 'status_code', None) != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class DeadlineReached(TimeoutError):
+    """The drain deadline passed before the job could (re)try."""
+
+
+class Drainer:
+    """Stops new sessions and runs the pending status restores on a bounded pool."""
+
+    def __init__(self, max_workers=16, rate=20, deadline=30):
+        self.max_workers = max_workers
+        self.rate = rate
+        self.deadline = deadline
+        self.accepting = True
+        self.flush_hooks = []
+        self.lock = threading.Lock()
+        self.report = None
+
+    def register_flush(self, hook):
+        self.flush_hooks.append(hook)
+
+    def _run_job(self, job, limiter, deadline):
+        while True:
+            if not limiter.acquire(deadline):
+                raise DeadlineReached("Drain deadline reached")
+            try:
+                return job()
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+
+    def drain(self, jobs, deadline=None):
+        with self.lock:
+            if self.report is not None:
+                return self.report
+            self.accepting = False
+
+            started = time.monotonic()
+            deadline_at = started + (deadline if deadline is not None else self.deadline)
+            limiter = RateLimiter(self.rate)
+            report = {'restored': [], 'failed': {}, 'pending': [], 'flush_errors': []}
+
+            pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="drain")
+            futures = {pool.submit(self._run_job, job, limiter, deadline_at): uid for uid, job in jobs.items()}
+            done, not_done = wait(futures, timeout=max(0, deadline_at - time.monotonic()))
+            pool.shutdown(wait=False, cancel_futures=True)
+
+            report['pending'] = [futures[f] for f in not_done]
+            for future in done:
+                uid = futures[future]
+                try:
+                    future.result()
+                    report['restored'].append(uid)
+                except DeadlineReached:
+                    report['pending'].append(uid)
+                except Exception as e:
+                    report['failed'][uid] = str(e)
+
+            for hook in self.flush_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    report['flush_errors'].append(str(e))
+
+            report['elapsed'] = round(time.monotonic() - started, 3)
+            self.report = report
+            return report
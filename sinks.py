@@ -0,0 +1,204 @@
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+from urllib.parse import urlsplit
+
+from lean_api import http, set_slack_profile, encode_json
+from shutdown import retry_after
+
+
+SINK_WORKERS = int(os.getenv("SINK_WORKERS", "32"))
+SINK_TIMEOUT = float(os.getenv("SINK_TIMEOUT", "5"))
+STATUS_FILE_SINK = os.getenv("STATUS_FILE_SINK")
+STATUS_SOCKET_SINK = os.getenv("STATUS_SOCKET_SINK")
+WEBHOOK_LIMIT = int(os.getenv("WEBHOOK_LIMIT", "5"))
+
+pool = ThreadPoolExecutor(max_workers=SINK_WORKERS, thread_name_prefix="sink")
+
+
+class StatusSink:
+    """A destination for a user's resolved status.
+
+    status is a dict with uid, text, emoji, expiration and the track it was
+    built from; write raises on failure.
+    """
+
+    kind = "sink"
+
+    def __init__(self, timeout=SINK_TIMEOUT):
+        self.timeout = timeout
+
+    @property
+    def name(self):
+        return self.kind
+
+    def write(self, status):
+        raise NotImplementedError
+
+
+class SlackSink(StatusSink):
+    kind = "slack"
+
+    def __init__(self, access_token, team_id=None, timeout=SINK_TIMEOUT):
+        super().__init__(timeout)
+        self.access_token = access_token
+        self.team_id = team_id
+
+    @property
+    def name(self):
+        return f"slack:{self.team_id}" if self.team_id else "slack"
+
+    def write(self, status):
+        set_slack_profile(self.access_token, {
+            "status_text": status['text'],
+            "status_emoji": status['emoji'],
+            "status_expiration": status.get('expiration', 0)
+        }, timeout=self.timeout)
+
+
+class WebhookSink(StatusSink):
+    kind = "webhook"
+
+    def __init__(self, url, secret=None, timeout=SINK_TIMEOUT):
+        super().__init__(timeout)
+        self.url = url
+        self.secret = secret
+
+    @property
+    def name(self):
+        return f"webhook:{self.url}"
+
+    def write(self, status):
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["Authorization"] = f"Bearer {self.secret}"
+        resp = http.post(self.url, data=encode_json(status), headers=headers, timeout=self.timeout)
+        resp.raise_for_status()
+
+
+def validate_webhook_url(url):
+    """Raises ValueError unless url is https and every address its host resolves to is public.
+
+    Statuses are posted from inside our network, so a webhook must not be
+    able to reach the metadata service, localhost or another internal host.
+    """
+    parsed = urlsplit(url or "")
+    if parsed.scheme != "https" or not parsed.hostname:
+        raise ValueError("Webhook URL must be an https:// URL")
+    if parsed.username or parsed.password:
+        raise ValueError("Webhook URL must not contain credentials")
+    try:
+        port = parsed.port or 443
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (ValueError, OSError) as e:
+        raise ValueError(f"Cannot resolve webhook host: {e}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f"Webhook host resolves to a non-public address ({address})")
+
+
+class FileSink(StatusSink):
+    kind = "file"
+    lock = threading.Lock()
+
+    def __init__(self, path, timeout=SINK_TIMEOUT):
+        super().__init__(timeout)
+        self.path = path
+
+    def write(self, status):
+        line = json.dumps(status) + "\n"
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class SocketSink(StatusSink):
+    """Sends one JSON line per status to a unix socket or host:port."""
+
+    kind = "socket"
+
+    def __init__(self, address, timeout=SINK_TIMEOUT):
+        super().__init__(timeout)
+        self.address = address
+
+    def write(self, status):
+        if ":" in self.address:
+            host, port = self.address.rsplit(":", 1)
+            sock = socket.create_connection((host, int(port)), timeout=self.timeout)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        with sock:
+            sock.sendall(json.dumps(status).encode() + b"\n")
+
+
+def sinks_for_user(user_data):
+    sinks = []
+    tokens = set()
+    for team_id, workspace in (user_data.get('slack_workspaces') or {}).items():
+        token = workspace.get('access_token')
+        if token and token not in tokens:
+            tokens.add(token)
+            sinks.append(SlackSink(token, team_id))
+    token = user_data.get('slack', {}).get('access_token')
+    if token and token not in tokens:
+        sinks.append(SlackSink(token, user_data.get('slack', {}).get('team_id')))
+
+    for webhook in user_data.get('webhooks') or []:
+        # Only URLs checked by validate_webhook_url are saved; never post anywhere else in the clear.
+        if (webhook.get('url') or "").startswith("https://"):
+            sinks.append(WebhookSink(webhook['url'], webhook.get('secret')))
+
+    if STATUS_FILE_SINK:
+        sinks.append(FileSink(STATUS_FILE_SINK))
+    if STATUS_SOCKET_SINK:
+        sinks.append(SocketSink(STATUS_SOCKET_SINK))
+    return sinks
+
+
+class FanOutError(Exception):
+    """Some sinks failed; errors maps each failed sink's name to its exception.
+
+    When any of them was rate limited, response is the 429 with the longest
+    Retry-After, so shutdown.retry_after() sees it like a single Slack error.
+    """
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors.items()))
+        self.errors = errors
+        limited = [e for e in errors.values() if retry_after(e) is not None]
+        self.response = max(limited, key=retry_after).response if limited else None
+
+
+def as_settled(writes, started):
+    """Yields (index, exception or None) for (sink, future) pairs begun at started, as each settles.
+
+    A write settles when it finishes or its own sink's timeout runs out, so a
+    slow destination never holds up the result of the others.
+    """
+    pending = {future: i for i, (sink, future) in enumerate(writes)}
+    while pending:
+        elapsed = time.monotonic() - started
+        for future, i in list(pending.items()):
+            if not future.done() and writes[i][0].timeout <= elapsed:
+                future.cancel()
+                del pending[future]
+                yield i, TimeoutError(f"{writes[i][0].name} did not answer within {writes[i][0].timeout}s")
+        if not pending:
+            break
+        remaining = min(writes[i][0].timeout for i in pending.values()) - elapsed
+        done, _ = wait(pending, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.exception()
+
+
+def fan_out(sinks, status):
+    """Writes status to every sink concurrently; returns {sink name: exception or None}."""
+    started = time.monotonic()
+    errors = dict(as_settled([(sink, pool.submit(sink.write, status)) for sink in sinks], started))
+    return {sink.name: errors[i] for i, sink in enumerate(sinks)}
@@ -0,0 +1,82 @@
+import os
+import threading
+
+from clock import sync_clock
+
+
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "5"))
+
+
+class Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class PlaybackSnapshots:
+    """Latest playback per user, shared by the pollers and /spotify/now.
+
+    A snapshot younger than max_age is served as is. Otherwise one caller
+    fetches upstream while concurrent callers for the same user wait for
+    that result instead of making their own call.
+    """
+
+    def __init__(self, max_age=SNAPSHOT_MAX_AGE, clock=sync_clock.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.entries = {}
+        self.inflight = {}
+        self.upstream_calls = 0
+        self.lock = threading.Lock()
+
+    def put(self, firebase_uid, playback):
+        self.entries[firebase_uid] = (self.clock(), playback)
+
+    def peek(self, firebase_uid):
+        entry = self.entries.get(firebase_uid)
+        return entry[1] if entry else None
+
+    def get(self, firebase_uid, fetch, max_age=None, timeout=15):
+        max_age = self.max_age if max_age is None else max_age
+        with self.lock:
+            entry = self.entries.get(firebase_uid)
+            if entry and self.clock() - entry[0] <= max_age:
+                return entry[1]
+            flight = self.inflight.get(firebase_uid)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[firebase_uid] = Flight()
+                self.upstream_calls += 1
+
+        if leader:
+            try:
+                flight.value = fetch()
+                self.put(firebase_uid, flight.value)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self.lock:
+                    self.inflight.pop(firebase_uid, None)
+                flight.event.set()
+        elif not flight.event.wait(timeout):
+            raise TimeoutError("Timed out waiting for playback")
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def forget(self, firebase_uid):
+        self.entries.pop(firebase_uid, None)
+
+
+def now_playing_json(playback):
+    if not playback or not playback.is_playing or not playback.item:
+        return {'is_playing': False}
+    track = playback.item
+    return {
+        'is_playing': True,
+        'name': track.name,
+        'artists': [a.name for a in track.artists],
+        'album': track.album.name if track.album else None
+    }
@@ -0,0 +1,151 @@
+import importlib
+import os
+import threading
+import time
+
+from synclog import get_logger
+
+log = get_logger("startup")
+
+
+# Defer the SDK imports and the Firebase credentials until first use.
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "0") == "1"
+# Under LAZY_STARTUP, load them on a background thread once the server listens.
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "1") == "1"
+
+UNSET = object()
+
+
+def process_started():
+    """Wall-clock time the process was created, so interpreter start-up is counted too."""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Deferred:
+    """Stands in for a module or client that is built on first use.
+
+    Attribute access is forwarded, so callers use it like the real thing;
+    pass resolve() where the real object itself is needed, e.g. to a
+    library that type-checks its arguments. Threads that need it while it
+    is being built wait for that one build; a build that raises is retried
+    by the next caller.
+    """
+
+    __slots__ = ('_name', '_factory', '_value', '_lock', '_timeline')
+
+    def __init__(self, name, factory, timeline):
+        self._name = name
+        self._factory = factory
+        self._value = UNSET
+        self._lock = threading.Lock()
+        self._timeline = timeline
+
+    def resolve(self):
+        value = self._value
+        if value is UNSET:
+            with self._lock:
+                value = self._value
+                if value is UNSET:
+                    started = time.perf_counter()
+                    value = self._factory()
+                    self._timeline.loaded(self._name, time.perf_counter() - started)
+                    self._value = value
+        return value
+
+    def __getattr__(self, attr):
+        if attr in Deferred.__slots__:
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        state = "pending" if self._value is UNSET else "loaded"
+        return f"<Deferred {self._name} ({state})>"
+
+
+class StartupTimeline:
+    """When the process reached each start-up milestone, and what each deferred load cost.
+
+    Milestones are seconds since the process was created: 'imported' once
+    the app module has run, 'listening' once the socket is bound,
+    'first_request' when the first request arrives and 'warm' when the
+    pre-warm has loaded everything. Load times are inclusive of anything a
+    load pulled in first.
+    """
+
+    def __init__(self):
+        self.started = process_started() or time.time()
+        self.marks = {}
+        self.loads = {}
+        self.resources = []
+        self.prewarming = False
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        """Records the first time a milestone is reached; returns seconds since process start."""
+        with self.lock:
+            if name not in self.marks:
+                self.marks[name] = time.time()
+            return self.marks[name] - self.started
+
+    def first_request(self):
+        if 'first_request' in self.marks:
+            return
+        log.info("First request %.0f ms after process start", self.mark('first_request') * 1000)
+
+    def loaded(self, name, seconds):
+        self.loads[name] = {'ms': round(seconds * 1000, 1), 'thread': threading.current_thread().name}
+
+    def listening(self, prewarm=STARTUP_PREWARM):
+        """Call once the server socket is bound; starts the pre-warm under LAZY_STARTUP."""
+        log.info("Listening %.0f ms after process start", self.mark('listening') * 1000)
+        with self.lock:
+            if not LAZY_STARTUP or not prewarm or self.prewarming:
+                return
+            self.prewarming = True
+        threading.Thread(target=self.prewarm, name="prewarm", daemon=True).start()
+
+    def prewarm(self):
+        # Early resources first; sorted() keeps registration order otherwise.
+        for _, resource in sorted(self.resources, key=lambda entry: not entry[0]):
+            try:
+                resource.resolve()
+            except Exception as e:
+                # Left for first use, which reports the error to its caller.
+                log.warning("Pre-warm of %s failed: %s", resource._name, e)
+        log.info("Pre-warm done %.0f ms after process start", self.mark('warm') * 1000)
+
+    def stats(self):
+        return {
+            'mode': "lazy" if LAZY_STARTUP else "eager",
+            'marks_ms': {name: round((at - self.started) * 1000) for name, at in self.marks.items()},
+            'loads': dict(self.loads),
+            'pending': [resource._name for _, resource in self.resources if resource._value is UNSET]
+        }
+
+
+startup = StartupTimeline()
+
+
+def deferred(name, factory, early=False):
+    """A resource built by factory on first use under LAZY_STARTUP, and right away otherwise.
+
+    early resources are what the first requests are likely to need; the
+    pre-warm loads them before the rest.
+    """
+    resource = Deferred(name, factory, startup)
+    startup.resources.append((early, resource))
+    if not LAZY_STARTUP:
+        resource.resolve()
+    return resource
+
+
+def lazy_import(module_name, early=False):
+    """A module imported on first attribute access under LAZY_STARTUP, and right away otherwise."""
+    return deferred(module_name, lambda: importlib.import_module(module_name), early)
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Per-user budget for warnings and errors: burst records, refilled every period seconds.
+LOG_ERROR_BURST = int(os.getenv("LOG_ERROR_BURST", "5"))
+LOG_ERROR_PERIOD = float(os.getenv("LOG_ERROR_PERIOD", "60"))
+
+FIELDS = ('uid', 'source', 'latency_ms', 'sink', 'kind', 'suppressed')
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread and drops them rather than block when it falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class UserRateLimitFilter(logging.Filter):
+    """Lets through at most burst warnings/errors per user per period and counts the rest."""
+
+    def __init__(self, burst=LOG_ERROR_BURST, period=LOG_ERROR_PERIOD):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        uid = getattr(record, 'uid', None)
+        if uid is None or record.levelno < logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            started, count, suppressed = self.buckets.get(uid, (now, 0, 0))
+            if now - started >= self.period:
+                started, count = now, 0
+            if count >= self.burst:
+                self.buckets[uid] = (started, count, suppressed + 1)
+                return False
+            self.buckets[uid] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def forget(self, uid):
+        with self.lock:
+            self.buckets.pop(uid, None)
+
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
+rate_limit = UserRateLimitFilter()
+queue_handler.addFilter(rate_limit)
+listener = None
+
+
+def setup_logging(stream=None):
+    global listener
+    if listener is not None:
+        return listener
+    writer = logging.StreamHandler(stream or sys.stdout)
+    if LOG_FORMAT == "json":
+        writer.setFormatter(JsonFormatter())
+    else:
+        writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger("slackify")
+    root.setLevel(LOG_LEVEL)
+    if queue_handler not in root.handlers:
+        root.addHandler(queue_handler)
+    root.propagate = False
+    listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def flush_logs():
+    """Writes out everything queued; records logged afterwards are written synchronously."""
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    root = logging.getLogger("slackify")
+    root.removeHandler(queue_handler)
+    for writer in listener.handlers:
+        root.addHandler(writer)
+    listener = None
+
+
+def get_logger(name):
+    return logging.getLogger(f"slackify.{name}")
+
+
+def forget_log_budget(uid):
+    """Drops the warning/error budget kept for uid, e.g. when its session is evicted."""
+    rate_limit.forget(uid)
+
+
+def log_stats():
+    return {'queued': log_queue.qsize(), 'dropped': queue_handler.dropped}
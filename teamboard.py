@@ -0,0 +1,302 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from clock import sync_clock
+from synclog import get_logger
+
+log = get_logger("teamboard")
+
+
+BOARD_HEARTBEAT = float(os.getenv("BOARD_HEARTBEAT", "15"))
+BOARD_SUBSCRIBER_QUEUE = int(os.getenv("BOARD_SUBSCRIBER_QUEUE", "256"))
+# How often each replica picks up the member changes the others made.
+BOARD_SYNC_INTERVAL = float(os.getenv("BOARD_SYNC_INTERVAL", "1"))
+# Removed members are remembered this long for replicas that are behind.
+BOARD_TOMBSTONE_TTL = 3600
+
+
+class Board:
+    __slots__ = ('members', 'owners', 'version', 'snapshot', 'subscribers')
+
+    def __init__(self):
+        self.members = {}
+        # member id -> firebase uid; never published, since the uid is all the
+        # unauthenticated per-user routes ask for.
+        self.owners = {}
+        self.version = 0
+        self.snapshot = None
+        self.subscribers = set()
+
+
+class TeamBoards:
+    """What every member of a Slack workspace is playing, kept up to date by the sync workers.
+
+    Boards are keyed by team id and then by the member's Slack user id. A
+    member's entry changes only when their published status does, and each
+    change is pushed to the team's subscribers as a single-member event, so
+    neither serving a board nor updating it touches the other members.
+
+    With a BoardLog, changes made here are shared with the other replicas
+    and theirs are applied here, so every replica serves the whole team.
+    """
+
+    def __init__(self, clock=sync_clock.time, queue_size=BOARD_SUBSCRIBER_QUEUE, log=None):
+        self.clock = clock
+        self.queue_size = queue_size
+        self.log = log
+        self.boards = {}
+        self.placed = {}
+        self.lock = threading.Lock()
+
+    def board(self, team_id):
+        board = self.boards.get(team_id)
+        if board is None:
+            board = self.boards[team_id] = Board()
+        return board
+
+    def publish(self, board, event):
+        board.version += 1
+        board.snapshot = None
+        event['version'] = board.version
+        for subscriber in list(board.subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Too far behind to catch up from deltas; it resyncs from a snapshot.
+                board.subscribers.discard(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+    def put(self, team_id, member_id, firebase_uid, entry):
+        """Places a member's entry; False when the board already shows it. Call with the lock held."""
+        board = self.board(team_id)
+        current = board.members.get(member_id)
+        owner = board.owners.get(member_id)
+        if current is not None and current['text'] == entry['text'] and owner == firebase_uid:
+            return False
+        if owner is not None and owner != firebase_uid:
+            self.placed.get(owner, set()).discard((team_id, member_id))
+        board.members[member_id] = entry
+        board.owners[member_id] = firebase_uid
+        self.placed.setdefault(firebase_uid, set()).add((team_id, member_id))
+        self.publish(board, {'type': 'playing', **entry})
+        return True
+
+    def remove(self, team_id, member_id, firebase_uid=None):
+        """Takes a member off the board; returns their uid, or None if absent. Call with the lock held.
+
+        With firebase_uid, only an entry placed by that user is removed.
+        """
+        board = self.boards.get(team_id)
+        if board is None or member_id not in board.members:
+            return None
+        owner = board.owners.get(member_id)
+        if firebase_uid is not None and owner != firebase_uid:
+            return None
+        del board.members[member_id]
+        del board.owners[member_id]
+        self.placed.get(owner, set()).discard((team_id, member_id))
+        self.publish(board, {'type': 'stopped', 'member': member_id})
+        self.drop_if_empty(team_id, board)
+        return owner
+
+    def update(self, team_id, member_id, firebase_uid, track, text):
+        entry = {
+            'member': member_id,
+            'text': text,
+            'track': track,
+            'updated': self.clock()
+        }
+        with self.lock:
+            if not self.put(team_id, member_id, firebase_uid, entry):
+                return False
+        if self.log is not None:
+            self.log.write(team_id, member_id, firebase_uid, entry)
+        return True
+
+    def clear(self, team_id, member_id):
+        with self.lock:
+            owner = self.remove(team_id, member_id)
+        if owner is None:
+            return False
+        if self.log is not None:
+            self.log.write(team_id, member_id, owner, None)
+        return True
+
+    def clear_user(self, firebase_uid):
+        """Removes a user's entries from every board they are on, e.g. when their sync stops."""
+        with self.lock:
+            removed = [(team_id, member_id) for team_id, member_id in list(self.placed.pop(firebase_uid, ()))
+                       if self.remove(team_id, member_id, firebase_uid) is not None]
+        if self.log is not None:
+            for team_id, member_id in removed:
+                self.log.write(team_id, member_id, firebase_uid, None)
+
+    def apply(self, team_id, member_id, firebase_uid, entry):
+        """Applies a change another replica made; entry None takes the member off."""
+        with self.lock:
+            if entry is None:
+                self.remove(team_id, member_id, firebase_uid)
+            else:
+                self.put(team_id, member_id, firebase_uid, entry)
+
+    def drop_if_empty(self, team_id, board):
+        if not board.members and not board.subscribers:
+            del self.boards[team_id]
+
+    def snapshot(self, team_id):
+        """Returns the board as JSON text; rebuilt only after a change, so repeat views are free."""
+        with self.lock:
+            board = self.boards.get(team_id)
+            if board is None:
+                return json.dumps({'type': 'snapshot', 'team': team_id, 'version': 0, 'members': []})
+            if board.snapshot is None:
+                board.snapshot = json.dumps({
+                    'type': 'snapshot',
+                    'team': team_id,
+                    'version': board.version,
+                    'members': list(board.members.values())
+                })
+            return board.snapshot
+
+    def subscribe(self, team_id):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.board(team_id).subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, team_id, subscriber):
+        with self.lock:
+            board = self.boards.get(team_id)
+            if board is not None:
+                board.subscribers.discard(subscriber)
+                self.drop_if_empty(team_id, board)
+
+    def stream(self, team_id, heartbeat=BOARD_HEARTBEAT):
+        """Server-sent events: a snapshot, then one event per member change."""
+        subscriber = self.subscribe(team_id)
+        try:
+            yield f"event: snapshot\ndata: {self.snapshot(team_id)}\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    subscriber = self.subscribe(team_id)
+                    yield f"event: snapshot\ndata: {self.snapshot(team_id)}\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(team_id, subscriber)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'teams': len(self.boards),
+                'members': sum(len(b.members) for b in self.boards.values()),
+                'subscribers': sum(len(b.subscribers) for b in self.boards.values())
+            }
+
+
+class BoardLog:
+    """Board members shared by every replica through one SQLite file, like the leases.
+
+    Each row is a member's current entry, or a tombstone once they stop,
+    stamped with a sequence number that grows with every change. A replica
+    writes the changes its own workers make and replays rows other replicas
+    wrote since the last sequence it saw.
+    """
+
+    def __init__(self, path, replica, clock=sync_clock.time):
+        self.path = path
+        self.replica = replica
+        self.clock = clock
+        self.seen = 0
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS board_members (
+                    team_id TEXT NOT NULL,
+                    member_id TEXT NOT NULL,
+                    firebase_uid TEXT NOT NULL,
+                    replica TEXT NOT NULL,
+                    entry TEXT,
+                    seq INTEGER NOT NULL,
+                    changed_at REAL NOT NULL,
+                    PRIMARY KEY (team_id, member_id)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS board_members_seq ON board_members (seq)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def write(self, team_id, member_id, firebase_uid, entry):
+        conn = self.connect()
+        # Immediate, so sequence numbers are taken and committed in the same order.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                INSERT INTO board_members (team_id, member_id, firebase_uid, replica, entry, seq, changed_at)
+                VALUES (?, ?, ?, ?, ?, (SELECT IFNULL(MAX(seq), 0) + 1 FROM board_members), ?)
+                ON CONFLICT (team_id, member_id) DO UPDATE SET firebase_uid = excluded.firebase_uid,
+                    replica = excluded.replica, entry = excluded.entry, seq = excluded.seq,
+                    changed_at = excluded.changed_at
+            ''', (team_id, member_id, firebase_uid, self.replica,
+                  json.dumps(entry) if entry is not None else None, self.clock()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def changes(self):
+        """Rows other replicas changed since the last call, oldest first."""
+        rows = self.connect().execute('''
+            SELECT seq, team_id, member_id, firebase_uid, entry FROM board_members
+            WHERE seq > ? AND replica != ? ORDER BY seq
+        ''', (self.seen, self.replica)).fetchall()
+        # A first read only needs the members still on a board.
+        first = self.seen == 0
+        if rows:
+            self.seen = rows[-1][0]
+        return [(team_id, member_id, firebase_uid, json.loads(entry) if entry is not None else None)
+                for _, team_id, member_id, firebase_uid, entry in rows if entry is not None or not first]
+
+    def prune(self):
+        return self.connect().execute('DELETE FROM board_members WHERE entry IS NULL AND changed_at <= ?',
+                                      (self.clock() - BOARD_TOMBSTONE_TTL,)).rowcount
+
+    def run(self, boards, is_running, interval=BOARD_SYNC_INTERVAL):
+        """Applies the other replicas' changes to boards until is_running() is false."""
+        passes = 0
+        while is_running():
+            try:
+                for team_id, member_id, firebase_uid, entry in self.changes():
+                    boards.apply(team_id, member_id, firebase_uid, entry)
+                passes += 1
+                if passes % 600 == 0:
+                    self.prune()
+            except Exception as e:
+                log.error("Board sync error: %s", e)
+            sync_clock.sleep(interval)
+
+
+def memberships(user_data):
+    """(team_id, slack_user_id) for every workspace the user's status is published to."""
+    members = {team_id: workspace.get('user_id')
+               for team_id, workspace in (user_data.get('slack_workspaces') or {}).items()}
+    slack = user_data.get('slack') or {}
+    if slack.get('team_id'):
+        members.setdefault(slack['team_id'], slack.get('user_id'))
+    return [(team_id, member_id) for team_id, member_id in members.items() if member_id]
@@ -0,0 +1,121 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics import DAY, TOP_K, WINDOWS, ListeningAnalytics
+
+USERS = int(os.getenv("BENCH_USERS", "200"))
+DAYS = int(os.getenv("BENCH_DAYS", "30"))
+PLAYS_PER_DAY = 40
+TEAM_SIZE = 25
+ARTISTS = 2000
+TRACKS_PER_ARTIST = 20
+START_DAY = 20460
+
+
+class ExactAnalytics:
+    """The straightforward alternative: exact per-day counters, summed over the window on every read."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.users = {}
+        self.teams = {}
+
+    def record(self, table, key, artist, track):
+        days = table.setdefault(key, {})
+        artists, tracks = days.setdefault(int(self.clock() // DAY), (Counter(), Counter()))
+        artists[artist] += 1
+        tracks[f"{artist} – {track}"] += 1
+
+    def record_play(self, firebase_uid, source, artist, track):
+        self.record(self.users, firebase_uid, artist, track)
+
+    def record_team_play(self, firebase_uid, team_ids, artist, track):
+        for team_id in team_ids:
+            self.record(self.teams, team_id, artist, track)
+
+    def top(self, table, key, window):
+        today = int(self.clock() // DAY)
+        artists, tracks = Counter(), Counter()
+        for day, (day_artists, day_tracks) in table.get(key, {}).items():
+            if today - day < WINDOWS[window]:
+                artists.update(day_artists)
+                tracks.update(day_tracks)
+        return {
+            'artists': [{'name': k, 'plays': v} for k, v in artists.most_common(TOP_K)],
+            'tracks': [{'name': k, 'plays': v} for k, v in tracks.most_common(TOP_K)]
+        }
+
+    def user_top(self, firebase_uid, window='week'):
+        return self.top(self.users, firebase_uid, window)
+
+    def team_top(self, team_id, window='week'):
+        return self.top(self.teams, team_id, window)
+
+
+def plays(seed):
+    """(day offset, uid, team, artist, track) for every play, in time order; each user has a Zipf-like taste."""
+    rng = random.Random(seed)
+    favourites = {u: rng.sample(range(ARTISTS), 60) for u in range(USERS)}
+    weights = [1 / (rank + 1) for rank in range(60)]
+    events = []
+    for day in range(DAYS):
+        for u in range(USERS):
+            for artist in rng.choices(favourites[u], weights, k=PLAYS_PER_DAY):
+                events.append((day, f"user-{u}", f"T{u // TEAM_SIZE}", f"Artist {artist}",
+                               f"Track {artist}-{rng.randrange(TRACKS_PER_ARTIST)}"))
+    return events
+
+
+def replay(make, events):
+    clock = [START_DAY * DAY]
+    analytics = make(lambda: clock[0])
+    for day, uid, team, artist, track in events:
+        clock[0] = (START_DAY + day) * DAY + 3600
+        analytics.record_play(uid, 'spotify', artist, track)
+        analytics.record_team_play(uid, [team], artist, track)
+    return analytics
+
+
+def run(make, events):
+    """Returns the analytics, seconds per play recorded, seconds per month top read and bytes held."""
+    started = time.perf_counter()
+    analytics = replay(make, events)
+    record = (time.perf_counter() - started) / len(events)
+
+    uids = [f"user-{u}" for u in range(USERS)]
+    started = time.perf_counter()
+    results = {uid: analytics.user_top(uid, 'month') for uid in uids}
+    read = (time.perf_counter() - started) / len(uids)
+
+    # A second replay under tracemalloc, which would skew the timings above.
+    tracemalloc.start()
+    held = replay(make, events)
+    memory = tracemalloc.get_traced_memory()[0]
+    del held
+    tracemalloc.stop()
+    return analytics, record, read, memory, results
+
+
+def overlap(a, b):
+    """Share of the exact top artists the estimate also ranks in its top k."""
+    exact = {entry['name'] for entry in a['artists']}
+    return len(exact & {entry['name'] for entry in b['artists']}) / max(1, len(exact))
+
+
+if __name__ == "__main__":
+    events = plays(0)
+    print(f"{USERS} users in teams of {TEAM_SIZE}, {DAYS} days, {PLAYS_PER_DAY} plays per user per day "
+          f"({len(events):,} plays)")
+    print(f"  {'layout':<10}{'record us':>11}{'month top us':>14}{'KB per user':>13}{'top-10 artist overlap':>23}")
+    exact, exact_record, exact_read, exact_memory, truth = run(ExactAnalytics, events)
+    sketch, record, read, memory, estimated = run(lambda clock: ListeningAnalytics(clock=clock), events)
+    accuracy = sum(overlap(truth[uid], estimated[uid]) for uid in truth) / len(truth)
+    for name, rec, rd, mem, acc in (("exact", exact_record, exact_read, exact_memory, 1.0),
+                                    ("sketch", record, read, memory, accuracy)):
+        print(f"  {name:<10}{rec * 1e6:>11.1f}{rd * 1e6:>14.1f}{mem / USERS / 1024:>13.1f}{acc * 100:>22.1f}%")
+    print(f"  sketch bytes reported by /health: {sketch.stats()}")
@@ -0,0 +1,149 @@
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(os.getenv("BENCH_RUNS", "5"))
+# When the delayed first auth request arrives, after the first /health answer.
+AUTH_DELAY = 0.5
+MODES = [
+    ("eager", {'LAZY_STARTUP': "0"}),
+    ("lazy, no pre-warm", {'LAZY_STARTUP': "1", 'STARTUP_PREWARM': "0"}),
+    ("lazy + pre-warm", {'LAZY_STARTUP': "1", 'STARTUP_PREWARM': "1"}),
+]
+
+
+def service_account(directory):
+    """A syntactically valid service account; nothing here talks to Google."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = os.path.join(directory, "service-account.json")
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account", "project_id": "bench", "private_key_id": "bench",
+            "private_key": key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                             serialization.NoEncryption()).decode(),
+            "client_email": "bench@bench.iam.gserviceaccount.com", "client_id": "1",
+            "token_uri": "https://oauth2.googleapis.com/token"
+        }, f)
+    return path
+
+
+def environment(directory, extra):
+    return {
+        **os.environ, **extra,
+        'PYTHONPATH': REPO,
+        'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account_path,
+        'LEASE_DB_PATH': os.path.join(directory, "leases.db"),
+        'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+        'LOG_LEVEL': "WARNING"
+    }
+
+
+def owner(module):
+    top = module.split('.')[0]
+    return "(this repo)" if os.path.exists(os.path.join(REPO, f"{top}.py")) else top
+
+
+def import_breakdown(directory, extra):
+    """Self time of `import app` per top-level package, from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=directory,
+                            env=environment(directory, extra), capture_output=True, text=True, timeout=120)
+    totals = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, module = line[len("import time:"):].split("|")
+        totals[owner(module.strip())] += int(self_us)
+    return totals
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(url, data=None):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(
+                url, data=data, headers={'Content-Type': 'application/json'}), timeout=30) as resp:
+            body = resp.read()
+    except urllib.error.HTTPError as e:
+        body = e.read()
+    return time.perf_counter() - started, body
+
+
+def cold_start(directory, extra, auth_delay):
+    """Seconds from spawning the server to the first /health answer, and how long the first
+    Firebase-backed request takes when it arrives auth_delay seconds after that."""
+    port = free_port()
+    launched = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", f"import app; app.serve('127.0.0.1', {port})"], cwd=directory,
+                              env=environment(directory, extra), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                request(f"http://127.0.0.1:{port}/health")
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError("server exited during start-up")
+                time.sleep(0.002)
+        first_health = time.perf_counter() - launched
+        time.sleep(auth_delay)
+        # An invalid ID token still needs the Firebase app and the auth module.
+        auth_latency, _ = request(f"http://127.0.0.1:{port}/verify_token", json.dumps({'idToken': "bench"}).encode())
+        time.sleep(1.5)
+        _, body = request(f"http://127.0.0.1:{port}/health")
+        return first_health, auth_latency, json.loads(body)['startup']
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def median_ms(values):
+    return statistics.median(values) * 1000
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        service_account_path = service_account(directory)
+
+        print("`import app` self time by package (ms)")
+        breakdowns = {label: import_breakdown(directory, extra) for label, extra in MODES[:2]}
+        packages = sorted(breakdowns["eager"], key=breakdowns["eager"].get, reverse=True)[:12]
+        print(f"  {'package':<24}{'eager':>10}{'lazy':>10}")
+        for package in packages:
+            print(f"  {package:<24}{breakdowns['eager'][package] / 1000:>10.1f}"
+                  f"{breakdowns['lazy, no pre-warm'].get(package, 0) / 1000:>10.1f}")
+        print(f"  {'total':<24}{sum(breakdowns['eager'].values()) / 1000:>10.1f}"
+              f"{sum(breakdowns['lazy, no pre-warm'].values()) / 1000:>10.1f}")
+
+        print(f"\ncold start, median of {RUNS} runs (ms since spawn unless noted)")
+        for label, extra in MODES:
+            runs = [cold_start(directory, extra, 0) for _ in range(RUNS)]
+            later = [cold_start(directory, extra, AUTH_DELAY) for _ in range(RUNS)]
+            marks = defaultdict(list)
+            for _, _, stats in runs:
+                for name, at in stats['marks_ms'].items():
+                    marks[name].append(at / 1000)
+            milestones = sorted((median_ms(values), name) for name, values in marks.items())
+            print(f"  {label:<18} first /health {median_ms([r[0] for r in runs]):5.0f}  first auth request "
+                  f"{median_ms([r[1] for r in runs]):5.0f} right away, {median_ms([r[1] for r in later]):5.0f} "
+                  f"{AUTH_DELAY:.1f}s later  |  since process start: "
+                  + "  ".join(f"{name} {at:.0f}" for at, name in milestones))
+            loads = runs[-1][2]['loads']
+            if extra['LAZY_STARTUP'] == "1":
+                slowest = sorted(loads.items(), key=lambda item: item[1]['ms'], reverse=True)[:5]
+                print("      loads: " + ", ".join(f"{name} {load['ms']:.0f} ms on {load['thread']}" for name, load in slowest))
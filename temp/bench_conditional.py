@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_cold_start import service_account
+
+POLLS = int(os.getenv("BENCH_POLLS", "5000"))
+# The session changes once every this many polls, e.g. a new song every 2-3 minutes at a 5 s poll.
+CHANGE_EVERY = 30
+UID = "bench-user"
+
+
+def poll(client, url, revalidate, on_change):
+    """Polls url like a dashboard tab; returns (requests/s, share of 304s, bytes received)."""
+    etag = None
+    not_modified = received = 0
+    started = time.perf_counter()
+    for i in range(POLLS):
+        if i % CHANGE_EVERY == 0:
+            on_change(i)
+        headers = {'Accept-Encoding': "gzip"}
+        if revalidate and etag:
+            headers['If-None-Match'] = etag
+        response = client.get(url, headers=headers)
+        not_modified += response.status_code == 304
+        received += len(response.data)
+        etag = response.headers.get('ETag')
+    return POLLS / (time.perf_counter() - started), not_modified / POLLS, received
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account(directory),
+            'LEASE_DB_PATH': os.path.join(directory, "leases.db"),
+            'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+            'LOG_LEVEL': "ERROR"
+        })
+        import app
+
+        reads = [0]
+        page_version = [0]
+
+        def get_user_data(firebase_uid, fields=None):
+            reads[0] += 1
+            return {'slack': {'access_token': "x", 'user_id': "U1"}, 'spotify': {'access_token': "y"},
+                    'page_version': page_version[0]}
+
+        app.get_user_data = get_user_data
+        app.app.secret_key = "bench"
+        client = app.app.test_client()
+        with client.session_transaction() as session:
+            session['firebase_uid'] = UID
+            session['user_email'] = "bench@example.com"
+
+        sync = app.sync_sessions.ensure(UID)
+        sync.active = True
+        sync.pulling = True
+
+        def new_song(i):
+            sync.current_song = f"Artist – Track {i}"
+            sync.last_update = time.time()
+            # As if an account were relinked just as often, on any replica.
+            page_version[0] += 1
+
+        print(f"{POLLS} polls per run, state changing every {CHANGE_EVERY} polls, gzip accepted")
+        print(f"  {'endpoint':<36}{'client':<14}{'req/s':>8}{'304s':>7}{'KB received':>13}{'Firestore reads':>17}")
+        for url in (f"/sync/slack/status/{UID}", f"/spotify/pull/status/{UID}", "/dashboard", "/linked-accounts"):
+            for revalidate in (False, True):
+                reads[0] = 0
+                rate, share, received = poll(client, url, revalidate, new_song)
+                print(f"  {url:<36}{'If-None-Match' if revalidate else 'plain':<14}{rate:>8,.0f}{share * 100:>6.0f}%"
+                      f"{received / 1024:>13,.0f}{reads[0]:>17,}")
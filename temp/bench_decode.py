@@ -0,0 +1,130 @@
+import gc
+import importlib.util
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "20000"))
+HELD = 1000
+
+
+def load_lean_api(name, blocked):
+    """A private copy of lean_api imported as if the blocked packages were not installed."""
+    saved = {module: sys.modules.get(module) for module in blocked}
+    sys.modules.update({module: None for module in blocked})
+    try:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(REPO, "lean_api.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        for module, previous in saved.items():
+            if previous is None:
+                sys.modules.pop(module, None)
+            else:
+                sys.modules[module] = previous
+
+
+def track(i):
+    """A Spotify track object with everything the API sends, most of which the sync loop ignores."""
+    return {
+        "id": f"track{i:018d}", "name": f"Track {i}", "duration_ms": 215000 + i, "explicit": False,
+        "popularity": 64, "track_number": 3, "disc_number": 1, "is_local": False, "type": "track",
+        "uri": f"spotify:track:track{i:018d}", "href": f"https://api.spotify.com/v1/tracks/track{i:018d}",
+        "preview_url": None, "external_ids": {"isrc": f"GBAYE{i:07d}"},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/track{i:018d}"},
+        "available_markets": ["AD", "AE", "AR", "AT", "AU", "BE", "BG", "BR", "CA", "CH", "CL", "CO", "CZ", "DE",
+                              "DK", "ES", "FI", "FR", "GB", "GR", "HK", "IE", "IL", "IN", "IT", "JP", "MX", "NL",
+                              "NO", "NZ", "PL", "PT", "SE", "SG", "US", "ZA"] * 5,
+        "artists": [{"id": f"artist{j}", "name": f"Artist {j}", "type": "artist", "uri": f"spotify:artist:artist{j}",
+                     "href": f"https://api.spotify.com/v1/artists/artist{j}",
+                     "external_urls": {"spotify": f"https://open.spotify.com/artist/artist{j}"}} for j in range(2)],
+        "album": {
+            "id": f"album{i}", "name": f"Album {i}", "album_type": "album", "release_date": "2013-05-17",
+            "release_date_precision": "day", "total_tracks": 13, "type": "album", "uri": f"spotify:album:album{i}",
+            "images": [{"height": size, "width": size, "url": f"https://i.scdn.co/image/{size}{i:032d}"}
+                       for size in (640, 300, 64)],
+            "artists": [{"id": "artist0", "name": "Artist 0", "type": "artist"}]
+        }
+    }
+
+
+PLAYBACK = json.dumps({
+    "timestamp": 1792420000000, "progress_ms": 73000, "is_playing": True, "currently_playing_type": "track",
+    "shuffle_state": False, "repeat_state": "off",
+    "device": {"id": "device0", "is_active": True, "is_private_session": False, "is_restricted": False,
+               "name": "Laptop", "type": "Computer", "volume_percent": 80, "supports_volume": True},
+    "context": {"type": "playlist", "uri": "spotify:playlist:37i9dQZF1DXcBWIGoYBM5M",
+                "href": "https://api.spotify.com/v1/playlists/37i9dQZF1DXcBWIGoYBM5M",
+                "external_urls": {"spotify": "https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M"}},
+    "actions": {"disallows": {"resuming": True}},
+    "item": track(0)
+}).encode()
+QUEUE = json.dumps({"currently_playing": track(0), "queue": [track(i) for i in range(1, 21)]}).encode()
+SLACK = json.dumps({"ok": True, "profile": {"status_text": "Track 0 - Artist 0", "status_emoji": ":headphones:",
+                                            "status_expiration": 0, "real_name": "Bench", "display_name": "bench"},
+                    "response_metadata": {"warnings": []}}).encode()
+
+
+def per_call_us(fn, payload):
+    return min(timeit.repeat(lambda: fn(payload), number=ROUNDS, repeat=3)) / ROUNDS * 1e6
+
+
+def allocations(fn, payload):
+    """Blocks each decoded result keeps alive, and the peak KB a single decode allocates."""
+    fn(payload)
+    gc.collect()
+    start = sys.getallocatedblocks()
+    held = [fn(payload) for _ in range(HELD)]
+    blocks = (sys.getallocatedblocks() - start) / HELD
+    del held
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(payload)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return blocks, peak / 1024
+
+
+if __name__ == "__main__":
+    decoders = [("stdlib json", load_lean_api("lean_api_stdlib", ["msgspec", "orjson"]))]
+    try:
+        import orjson  # noqa: F401
+        decoders.append(("orjson", load_lean_api("lean_api_orjson", ["msgspec"])))
+    except ImportError:
+        print("orjson not installed, skipping")
+    try:
+        import msgspec  # noqa: F401
+        decoders.append(("msgspec", load_lean_api("lean_api_msgspec", [])))
+    except ImportError:
+        print("msgspec not installed, skipping")
+
+    # What the decoders have to agree on: the fields the sync loops read.
+    for label, api in decoders:
+        playback = api.decode_playback(PLAYBACK)
+        head = api.decode_queue(QUEUE).queue[0]
+        assert (playback.is_playing, playback.progress_ms, playback.item.name, api.artist_names(playback.item),
+                playback.item.album.name, head.name) == (True, 73000, "Track 0", "Artist 0, Artist 1",
+                                                         "Album 0", "Track 1"), label
+        assert api.decode_slack(SLACK).ok, label
+
+    print(f"payloads: playback {len(PLAYBACK)} B, queue {len(QUEUE)} B, slack {len(SLACK)} B; best of 3 x {ROUNDS}")
+    print(f"  {'decoder':<14}{'playback us':>14}{'queue us':>12}{'slack us':>12}")
+    print(f"  {'json.loads':<14}{per_call_us(json.loads, PLAYBACK):>14.2f}{per_call_us(json.loads, QUEUE):>12.2f}"
+          f"{per_call_us(json.loads, SLACK):>12.2f}   (full dict, what spotipy returns)")
+    for label, api in decoders:
+        print(f"  {label:<14}{per_call_us(api.decode_playback, PLAYBACK):>14.2f}"
+              f"{per_call_us(api.decode_queue, QUEUE):>12.2f}{per_call_us(api.decode_slack, SLACK):>12.2f}")
+
+    print(f"allocations: blocks kept alive per result (sys.getallocatedblocks over {HELD} held), "
+          f"peak KB per decode (tracemalloc)")
+    print(f"  {'decoder':<14}{'playback blocks':>17}{'peak KB':>9}{'queue blocks':>14}{'peak KB':>9}")
+    for label, fn_playback, fn_queue in [("json.loads", json.loads, json.loads)] + \
+            [(label, api.decode_playback, api.decode_queue) for label, api in decoders]:
+        playback_blocks, playback_peak = allocations(fn_playback, PLAYBACK)
+        queue_blocks, queue_peak = allocations(fn_queue, QUEUE)
+        print(f"  {label:<14}{playback_blocks:>17.1f}{playback_peak:>9.1f}{queue_blocks:>14.1f}{queue_peak:>9.1f}")
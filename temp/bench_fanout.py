@@ -0,0 +1,71 @@
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sinks import WebhookSink, fan_out
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "50"))
+# Webhook receivers answering in 20-120 ms, with the odd one taking 400 ms.
+LATENCY = (0.02, 0.12)
+SLOW_LATENCY = 0.4
+SLOW_SHARE = 0.05
+
+
+class Receiver(BaseHTTPRequestHandler):
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.lock:
+            delay = SLOW_LATENCY if self.rng.random() < SLOW_SHARE else self.rng.uniform(*LATENCY)
+        time.sleep(delay)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(sinks, concurrent):
+    status = {'uid': "bench", 'text': "Artist – Track", 'emoji': ":musical_note:", 'expiration': 0, 'track': None}
+    latencies = []
+    failed = 0
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        if concurrent:
+            failed += sum(error is not None for error in fan_out(sinks, status).values())
+        else:
+            for sink in sinks:
+                try:
+                    sink.write(status)
+                except Exception:
+                    failed += 1
+        latencies.append(time.perf_counter() - started)
+    return percentile(latencies, 0.5), percentile(latencies, 0.95), failed
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # WebhookSink itself does not check the scheme; the local receiver is plain http.
+    url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+
+    print(f"{ROUNDS} statuses per run, receivers answering in {LATENCY[0] * 1000:.0f}-{LATENCY[1] * 1000:.0f} ms "
+          f"({SLOW_SHARE * 100:.0f}% at {SLOW_LATENCY * 1000:.0f} ms)")
+    print(f"  {'sinks':>5}  {'path':<10}{'p50 ms':>9}{'p95 ms':>9}{'failed':>8}")
+    for count in (1, 3, 10):
+        sinks = [WebhookSink(f"{url}?n={n}") for n in range(count)]
+        for concurrent in (False, True):
+            p50, p95, failed = run(sinks, concurrent)
+            print(f"  {count:>5}  {'fan_out' if concurrent else 'serial':<10}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}{failed:>8}")
+    server.shutdown()
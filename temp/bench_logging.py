@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THREADS = int(os.getenv("BENCH_THREADS", "200"))
+SECONDS = float(os.getenv("BENCH_SECONDS", "5"))
+# A container log driver draining stdout slower than the app writes at peak.
+DRAIN_BYTES_PER_SECOND = 256 * 1024
+
+CHILD = '''
+import json, os, sys, threading, time
+sys.path.insert(0, {repo!r})
+mode = {mode!r}
+if mode == "logging":
+    from synclog import setup_logging, get_logger, flush_logs, log_stats
+    setup_logging()
+    log = get_logger("bench")
+
+iterations = [0] * {threads}
+worst = [0.0] * {threads}
+stop = threading.Event()
+
+def worker(n):
+    uid = f"user-{{n}}"
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        # One status line per loop, and every tenth loop fails: the volume of a busy sync worker.
+        if mode == "print":
+            print(f"Global status updated for {{uid}}: Artist - Track {{i}}")
+            if i % 10 == 0:
+                print(f"Spotify API error for {{uid}}: http status 502")
+        else:
+            log.info("Global status updated: %s", f"Artist - Track {{i}}", extra={{'uid': uid, 'latency_ms': 12.5}})
+            if i % 10 == 0:
+                log.error("Spotify API error: %s", "http status 502", extra={{'uid': uid, 'source': 'spotify'}})
+        worst[n] = max(worst[n], time.perf_counter() - started)
+        iterations[n] += 1
+        i += 1
+        time.sleep(0.001)
+
+threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range({threads})]
+for t in threads:
+    t.start()
+time.sleep({seconds})
+stop.set()
+for t in threads:
+    t.join(timeout=1)
+result = {{'iterations': sum(iterations), 'worst_ms': max(worst) * 1000, 'stuck': sum(t.is_alive() for t in threads)}}
+if mode == "logging":
+    result.update(log_stats())
+with open({result_path!r}, "w") as f:
+    json.dump(result, f)
+os._exit(0)
+'''
+
+
+def run(mode, directory):
+    result_path = os.path.join(directory, f"{mode}.json")
+    env = {**os.environ, 'LOG_LEVEL': "INFO", 'LOG_FORMAT': "json"}
+    child = subprocess.Popen([sys.executable, "-c", CHILD.format(repo=REPO, mode=mode, threads=THREADS,
+                                                                 seconds=SECONDS, result_path=result_path)],
+                             stdout=subprocess.PIPE, env=env)
+    received = 0
+    chunk = DRAIN_BYTES_PER_SECOND // 20
+    while child.poll() is None:
+        received += len(child.stdout.read1(chunk))
+        time.sleep(0.05)
+    received += len(child.stdout.read())
+    with open(result_path) as f:
+        return json.load(f), received
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{THREADS} worker threads for {SECONDS:.0f}s, stdout drained at {DRAIN_BYTES_PER_SECOND // 1024} KB/s")
+        print(f"  {'path':<22}{'loops/s':>10}{'worst call ms':>15}{'KB delivered':>14}{'dropped':>9}")
+        for mode in ("print", "logging"):
+            result, received = run(mode, directory)
+            print(f"  {mode:<22}{result['iterations'] / SECONDS:>10,.0f}{result['worst_ms']:>15.1f}"
+                  f"{received / 1024:>14,.0f}{result.get('dropped', 0):>9,}")
@@ -0,0 +1,80 @@
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snapshots import PlaybackSnapshots
+
+USERS = int(os.getenv("BENCH_USERS", "50"))
+TABS = 3
+DURATION = float(os.getenv("BENCH_SECONDS", "20"))
+# Dashboard tabs refresh every 5 s; the pull worker polls every 30 s.
+TAB_INTERVAL = 5.0
+POLL_INTERVAL = 30.0
+UPSTREAM_LATENCY = (0.08, 0.3)
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, uid):
+        with self.lock:
+            self.calls += 1
+        time.sleep(random.uniform(*UPSTREAM_LATENCY))
+        return f"playback of {uid}"
+
+
+def run(mode):
+    """mode is "live" (one upstream call per request, as before), "snapshot", or "snapshot + poller"."""
+    spotify = FakeSpotify()
+    snapshots = PlaybackSnapshots()
+    latencies = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def tab(uid):
+        # Tabs open a few seconds apart and then refresh in step, as browsers do.
+        if stop.wait(random.uniform(0, TAB_INTERVAL)):
+            return
+        while not stop.is_set():
+            started = time.perf_counter()
+            if mode == "live":
+                spotify.fetch(uid)
+            else:
+                snapshots.get(uid, lambda: spotify.fetch(uid))
+            with lock:
+                latencies.append(time.perf_counter() - started)
+            stop.wait(TAB_INTERVAL)
+
+    def poller(uid):
+        stop.wait(random.uniform(0, POLL_INTERVAL))
+        while not stop.is_set():
+            playback = spotify.fetch(uid)
+            if mode == "snapshot + poller":
+                snapshots.put(uid, playback)
+            stop.wait(POLL_INTERVAL)
+
+    threads = [threading.Thread(target=tab, args=(f"user-{u}",)) for u in range(USERS) for _ in range(TABS)]
+    threads += [threading.Thread(target=poller, args=(f"user-{u}",)) for u in range(USERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return spotify.calls, len(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    print(f"{USERS} users x {TABS} dashboard tabs every {TAB_INTERVAL:.0f}s, pull worker every {POLL_INTERVAL:.0f}s, "
+          f"{DURATION:.0f}s run, upstream {UPSTREAM_LATENCY[0] * 1000:.0f}-{UPSTREAM_LATENCY[1] * 1000:.0f} ms")
+    print(f"  {'mode':<20}{'requests':>10}{'upstream calls':>16}{'p50 ms':>9}{'p95 ms':>9}")
+    for mode in ("live", "snapshot", "snapshot + poller"):
+        calls, requests, p50, p95 = run(mode)
+        print(f"  {mode:<20}{requests:>10}{calls:>16}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}")
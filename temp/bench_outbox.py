@@ -0,0 +1,183 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbox import OUTBOX_BATCH, StatusOutbox, OutboxDispatcher
+
+USERS = 2_000
+WRITES = 20_000
+WORKERS = 8
+# Short, so the crash bench does not wait out the default 30s lease.
+CRASH_LEASE = 2.0
+
+
+class RecordingSink:
+    """Counts deliveries per user; fails a share of writes when flaky."""
+
+    kind = "bench"
+    name = "bench"
+    timeout = 5.0
+
+    def __init__(self, delivered, fail_rate=0.0, latency=0.0, rng=None):
+        self.delivered = delivered
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.rng = rng or random.Random(0)
+
+    def write(self, status):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            raise ConnectionError("simulated Slack failure")
+        self.delivered.setdefault(status['uid'], []).append(status['text'])
+
+
+def drain(dispatcher, outbox, timeout=120):
+    running = [True]
+    started = time.perf_counter()
+    dispatcher.start(lambda: running[0])
+    while outbox.pending() and time.perf_counter() - started < timeout:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    running[0] = False
+    return elapsed
+
+
+def bench_enqueue(path):
+    outbox = StatusOutbox(path)
+    started = time.perf_counter()
+    for i in range(WRITES):
+        outbox.put(f"user-{i % USERS}", "bench", {'uid': f"user-{i % USERS}", 'text': f"Track {i}", 'expiration': 0})
+    single = WRITES / (time.perf_counter() - started)
+
+    def producer(offset):
+        for i in range(offset, WRITES, 4):
+            outbox.put(f"user-{i % USERS}", "bench", {'uid': f"user-{i % USERS}", 'text': f"Track {i}", 'expiration': 0})
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(4)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    threaded = WRITES / (time.perf_counter() - started)
+    return single, threaded, outbox.pending()
+
+
+def bench_dequeue(path, writes, workers, latency):
+    outbox = StatusOutbox(path)
+    delivered = {}
+    sink = RecordingSink(delivered, latency=latency)
+    for i in range(writes):
+        outbox.put(f"user-{i}", "bench", {'uid': f"user-{i}", 'text': f"Track {i}", 'expiration': 0})
+    dispatcher = OutboxDispatcher(outbox, resolve=lambda uid: [sink], workers=workers)
+    elapsed = drain(dispatcher, outbox)
+    return writes / elapsed, sum(map(len, delivered.values()))
+
+
+def bench_flaky(path):
+    # Backoff runs on a clock 100x faster than wall time, so 1s retries take 10ms.
+    t0 = time.time()
+    fast = lambda: t0 + (time.time() - t0) * 100
+    outbox = StatusOutbox(path, clock=fast)
+    delivered = {}
+    sink = RecordingSink(delivered, fail_rate=0.3)
+    dispatcher = OutboxDispatcher(outbox, resolve=lambda uid: [sink], workers=WORKERS, clock=fast)
+    latest = {}
+    for i in range(WRITES // 4):
+        uid = f"user-{i % USERS}"
+        latest[uid] = f"Track {i}"
+        dispatcher.submit(uid, [sink], {'uid': uid, 'text': latest[uid], 'expiration': 0})
+    drain(dispatcher, outbox)
+    lost = [uid for uid, text in latest.items() if text not in delivered.get(uid, [])]
+    return dispatcher.retried, dispatcher.dropped, len(lost)
+
+
+def bench_slow_neighbour(path, writes=160, slow=3.0):
+    """One user's sink hangs for slow seconds; returns the p95 and max wait of everyone else's write."""
+    outbox = StatusOutbox(path)
+    fast = RecordingSink({})
+    hung = RecordingSink({}, latency=slow)
+    queued = {}
+    waits = []
+
+    def on_result(uid, name, error):
+        if uid != "user-0":
+            waits.append(time.perf_counter() - queued[uid])
+
+    dispatcher = OutboxDispatcher(outbox, resolve=lambda uid: [hung if uid == "user-0" else fast],
+                                  on_result=on_result, workers=WORKERS)
+    for i in range(writes):
+        queued[f"user-{i}"] = time.perf_counter()
+        outbox.put(f"user-{i}", "bench", {'uid': f"user-{i}", 'text': f"Track {i}", 'expiration': 0})
+    drain(dispatcher, outbox)
+    waits.sort()
+    return waits[int(len(waits) * 0.95)], waits[-1]
+
+
+CRASHING_CHILD = '''
+import os, sys, time
+sys.path.insert(0, {root!r})
+from outbox import StatusOutbox
+outbox = StatusOutbox({path!r}, lease={lease})
+for i in range({writes}):
+    outbox.put(f"user-{{i}}", "bench", {{'uid': f"user-{{i}}", 'text': f"Track {{i}}", 'expiration': 0}})
+claimed = outbox.claim(500)
+# Killed mid-delivery: these writes are leased but never acknowledged.
+os._exit(9)
+'''
+
+
+def bench_shared(path):
+    """A second outbox on the same file, as another process would open it, must not resend writes in flight."""
+    first = StatusOutbox(path)
+    for i in range(100):
+        first.put(f"user-{i}", "bench", {'uid': f"user-{i}", 'text': f"Track {i}", 'expiration': 0})
+    in_flight = len(first.claim(50))
+    second = StatusOutbox(path)
+    second.recover()
+    stolen = len(second.claim(100))
+    return in_flight, stolen
+
+
+def bench_recovery(path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child = subprocess.run([sys.executable, "-c", CRASHING_CHILD.format(root=root, path=path, writes=WRITES,
+                                                                        lease=CRASH_LEASE)])
+    assert child.returncode == 9
+    delivered = {}
+    sink = RecordingSink(delivered)
+    started = time.perf_counter()
+    outbox = StatusOutbox(path)
+    dispatcher = OutboxDispatcher(outbox, resolve=lambda uid: [sink], workers=WORKERS)
+    drained = drain(dispatcher, outbox)
+    total = time.perf_counter() - started
+    missing = WRITES - len(delivered)
+    return total, drained, missing
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        single, threaded, pending = bench_enqueue(os.path.join(tmp, "enqueue.db"))
+        print(f"enqueue: {single:,.0f}/s one thread, {threaded:,.0f}/s four threads; "
+              f"{WRITES * 2} puts over {USERS} users left {pending} pending")
+        # With a real Slack round trip the workers, not SQLite, set the pace.
+        for writes, workers, latency in ((WRITES, WORKERS, 0.0), (2_000, WORKERS, 0.05), (2_000, 32, 0.05)):
+            rate, count = bench_dequeue(os.path.join(tmp, f"dequeue-{workers}-{latency}.db"), writes, workers, latency)
+            print(f"dequeue: {rate:,.0f}/s with {workers} workers, {latency * 1000:.0f} ms sink ({count}/{writes} delivered)")
+        p95, worst = bench_slow_neighbour(os.path.join(tmp, "slow.db"))
+        print(f"one sink hanging 3s in a batch of {OUTBOX_BATCH}: other writes waited p95 {p95 * 1000:.0f} ms, "
+              f"max {worst * 1000:.0f} ms")
+        retried, dropped, lost = bench_flaky(os.path.join(tmp, "flaky.db"))
+        print(f"flaky sink (30% failures): {retried} retries, {dropped} given up, {lost} users missing their latest status")
+        in_flight, stolen = bench_shared(os.path.join(tmp, "shared.db"))
+        print(f"shared file: second process claimed {stolen - (100 - in_flight)} of {in_flight} writes in flight elsewhere")
+        total, drained, missing = bench_recovery(os.path.join(tmp, "crash.db"))
+        print(f"crash recovery: {WRITES} pending (500 in flight, {CRASH_LEASE:.0f}s lease) delivered {total:.2f}s "
+              f"after reopen, {missing} missing")
+        sys.exit(0 if lost == 0 and missing == 0 and pending == USERS and stolen == 100 - in_flight else 1)
@@ -0,0 +1,107 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_cold_start import REPO, service_account
+from profiler import SamplingProfiler
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+WORK_SECONDS = 2.0
+MODES = [
+    ("disabled", {'PROFILING_ENABLED': "0"}, None),
+    ("enabled, no header", {'PROFILING_ENABLED': "1"}, None),
+    ("enabled, profiled", {'PROFILING_ENABLED': "1"}, "bench"),
+]
+
+CHILD = '''
+import json, sys, time
+import app
+client = app.app.test_client()
+headers = {{'X-Profile': {header!r}}} if {header!r} else {{}}
+timings = {{}}
+for path in ("/health", "/sync/slack/status/bench-user"):
+    for _ in range(50):
+        client.get(path, headers=headers)
+    samples = []
+    for _ in range({requests}):
+        started = time.perf_counter()
+        client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    timings[path] = samples[len(samples) // 2] * 1e6
+json.dump({{'hooks': len(app.app.before_request_funcs.get(None, [])) + len(app.app.after_request_funcs.get(None, [])),
+            'timings': timings}}, sys.stdout)
+'''
+
+
+def request_latency(directory, extra, header, requests):
+    env = {**os.environ, **extra, 'PYTHONPATH': REPO, 'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account_path,
+           'LEASE_DB_PATH': os.path.join(directory, "leases.db"), 'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+           'PROFILING_TOKEN': "bench", 'PROFILE_DIR': os.path.join(directory, "profiles"), 'LOG_LEVEL': "ERROR"}
+    result = subprocess.run([sys.executable, "-c", CHILD.format(header=header, requests=requests)], cwd=directory,
+                            env=env, capture_output=True, text=True, timeout=600)
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout)
+
+
+def spin(seconds, counts):
+    """Stands in for a CPU-bound slice of the sync loop: counts iterations for a fixed time."""
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        sum(range(200))
+        n += 1
+    counts.append(n)
+
+
+def worker_throughput(profiled):
+    counts = []
+    thread = threading.Thread(target=spin, args=(WORK_SECONDS, counts), name="slack_sync_worker-bench")
+    profiler = SamplingProfiler(thread_names=("slack_sync_worker",)).start() if profiled else None
+    thread.start()
+    thread.join()
+    if profiler:
+        profiler.stop()
+    return counts[0] / WORK_SECONDS, profiler.sample_count if profiler else 0
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        service_account_path = service_account(directory)
+        # Rounds interleave the modes, so drift in machine load hits each one alike.
+        results = {label: [] for label, _, _ in MODES}
+        hooks = {}
+        for _ in range(ROUNDS):
+            for label, extra, header in MODES:
+                run = request_latency(directory, extra, header, REQUESTS // 10 if header else REQUESTS)
+                hooks[label] = run['hooks']
+                results[label].append(run['timings'])
+
+        paths = list(results["disabled"][0])
+        print(f"request latency, median over {ROUNDS} rounds (us)")
+        print(f"  {'mode':<22}{'hooks':>6}" + "".join(f"{path:>32}" for path in paths))
+        baseline = {path: statistics.median(r[path] for r in results["disabled"]) for path in paths}
+        for label, _, _ in MODES:
+            cells = []
+            for path in paths:
+                value = statistics.median(r[path] for r in results[label])
+                cells.append(f"{value:>22.1f} ({(value / baseline[path] - 1) * 100:+5.1f}%)")
+            print(f"  {label:<22}{hooks[label]:>6}" + "".join(cells))
+
+        print(f"\nworker loop throughput over {WORK_SECONDS:.0f}s (iterations/s)")
+        plain = statistics.median(worker_throughput(False)[0] for _ in range(3))
+        sampled = [worker_throughput(True) for _ in range(3)]
+        rate = statistics.median(s[0] for s in sampled)
+        print(f"  no profiler            {plain:>12,.0f}")
+        print(f"  sampled every 5 ms     {rate:>12,.0f} ({(rate / plain - 1) * 100:+.1f}%, "
+              f"{sampled[0][1]} samples)")
+        # Disabled means no hooks at all: the request path is the one without the profiler.
+        sys.exit(0 if hooks["disabled"] < hooks["enabled, no header"] else 1)
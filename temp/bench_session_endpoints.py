@@ -0,0 +1,116 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_cold_start import service_account
+
+SESSIONS = int(os.getenv("BENCH_SESSIONS", "100000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "20"))
+# Sessions started within the same second share a last_update timestamp.
+STARTS_PER_SECOND = 4
+
+
+def legacy_app(sync_status):
+    """/health and /sync/list as main.py served them from the sync_status dict."""
+    from flask import Flask, jsonify
+    legacy = Flask("legacy")
+
+    @legacy.route('/sync/list', methods=['GET'])
+    def list_active_syncs():
+        active_syncs = {}
+        for uid, status in sync_status.items():
+            if status.get('active', False):
+                active_syncs[uid] = {
+                    'current_song': status.get('current_song'),
+                    'last_update': status.get('last_update'),
+                    'error_count': status.get('error_count', 0)
+                }
+        return jsonify({'active_syncs': active_syncs, 'total_active': len(active_syncs)})
+
+    @legacy.route('/health', methods=['GET'])
+    def health_check():
+        return jsonify({
+            'status': 'healthy',
+            'active_syncs': len([uid for uid, status in sync_status.items() if status.get('active', False)]),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    return legacy.test_client()
+
+
+def median_ms(client, url, repeat=REPEAT):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    return statistics.median(samples) * 1000, response.get_json()
+
+
+def walk(client, url):
+    """Pages through every session; returns the uids in order and the time taken."""
+    uids = []
+    started = time.perf_counter()
+    cursor = None
+    while True:
+        data = client.get(url + (f"&cursor={cursor}" if cursor else "")).get_json()
+        uids.extend(data['active_syncs'])
+        cursor = data['next_cursor']
+        if not cursor:
+            return uids, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account(directory),
+            'LEASE_DB_PATH': os.path.join(directory, "leases.db"),
+            'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+            'LOG_LEVEL': "ERROR"
+        })
+        import app
+        from sessions import SyncError
+
+        now = [time.time() - SESSIONS]
+        app.sync_sessions.clock = lambda: now[0]
+        sync_status = {}
+        for i in range(SESSIONS):
+            uid = f"user-{i}"
+            now[0] = int(now[0]) + (i % STARTS_PER_SECOND == 0)
+            sync = app.sync_sessions.ensure(uid)
+            sync.active = i % 10 != 9
+            sync.current_song = f"Artist {i % 500} – Track {i % 5000}"
+            sync.last_update = now[0]
+            if i % 20 == 0:
+                sync.set_error(SyncError.NO_TRACK)
+            sync_status[uid] = {'active': sync.active, 'current_song': sync.current_song,
+                                'last_update': datetime.fromtimestamp(now[0]).isoformat(),
+                                'error': "No track found" if i % 20 == 0 else None, 'error_count': 0}
+        active = {uid for uid, status in sync_status.items() if status['active']}
+
+        client = app.app.test_client()
+        legacy = legacy_app(sync_status)
+        first_page, data = median_ms(client, "/sync/list?limit=100")
+        deep = data['next_cursor']
+        for _ in range(49):
+            deep = client.get(f"/sync/list?limit=100&cursor={deep}").get_json()['next_cursor']
+        rows = [
+            ("/health", median_ms(legacy, "/health")[0], median_ms(client, "/health")[0]),
+            ("/sync/list (first 100)", median_ms(legacy, "/sync/list", 5)[0], first_page),
+            ("/sync/list (page 51)", None, median_ms(client, f"/sync/list?limit=100&cursor={deep}")[0]),
+            ("/sync/list?error=no_track", None, median_ms(client, "/sync/list?limit=100&error=no_track")[0]),
+        ]
+        print(f"{SESSIONS:,} sessions ({len(active):,} active), median ms")
+        print(f"  {'endpoint':<28}{'sync_status dict':>18}{'SessionTable':>14}")
+        for label, old, new in rows:
+            print(f"  {label:<28}{'' if old is None else f'{old:.2f}':>18}{new:>14.2f}")
+
+        uids, elapsed = walk(client, "/sync/list?limit=1000")
+        print(f"  paging all active sessions 1000 at a time: {elapsed * 1000:.0f} ms, "
+              f"{len(uids):,} listed, {len(uids) - len(set(uids))} duplicates")
+        sys.exit(0 if len(uids) == len(set(uids)) and set(uids) == active else 1)
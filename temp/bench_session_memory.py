@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSIONS = int(os.getenv("BENCH_SESSIONS", "100000"))
+TRACKS = 5000
+
+CHILD = '''
+import gc, sys, time
+from datetime import datetime
+sys.path.insert(0, {repo!r})
+from playback_state import PlaybackState
+from reaper import rss_bytes
+
+songs = [f"Artist {{i % 500}} – Track {{i}}" for i in range({tracks})]
+# uids arrive as fresh strings from each request, not shared with earlier ones.
+uid = lambda i: "".join(["firebase-uid-", str(i).zfill(16)])
+gc.collect()
+before = rss_bytes()
+now = time.time()
+
+if {layout!r} == "dicts":
+    # app.py before the session table: one dict of string keys per user,
+    # ISO timestamps, and parallel dicts for the other parts of a session.
+    sync_status, sync_threads, spotify_pull_status, spotify_threads, playback_states = {{}}, {{}}, {{}}, {{}}, {{}}
+    for i in range({sessions}):
+        sync_status[uid(i)] = {{
+            'active': True,
+            'current_song': songs[i % len(songs)],
+            'last_update': datetime.fromtimestamp(now - i).isoformat(),
+            'error': "No track found" if i % 10 == 0 else None,
+            'error_count': 0
+        }}
+        sync_threads[uid(i)] = None
+        spotify_pull_status[uid(i)] = True
+        spotify_threads[uid(i)] = None
+        playback_states[uid(i)] = PlaybackState()
+    keep = (sync_status, sync_threads, spotify_pull_status, spotify_threads, playback_states)
+else:
+    from sessions import SessionTable, SyncError
+    table = SessionTable(clock=lambda: now)
+    for i in range({sessions}):
+        sync = table.ensure(uid(i))
+        sync.active = True
+        sync.current_song = songs[i % len(songs)]
+        sync.last_update = now - i
+        if i % 10 == 0:
+            sync.set_error(SyncError.NO_TRACK)
+        sync.pulling = True
+        sync.playback = PlaybackState()
+    keep = table
+
+gc.collect()
+print(rss_bytes() - before)
+'''
+
+
+def rss_delta(layout):
+    result = subprocess.run([sys.executable, "-c", CHILD.format(repo=REPO, layout=layout, sessions=SESSIONS,
+                                                                tracks=TRACKS)],
+                            capture_output=True, text=True, timeout=600)
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return int(result.stdout)
+
+
+if __name__ == "__main__":
+    scale = 100_000 / SESSIONS
+    dicts = rss_delta("dicts")
+    table = rss_delta("table")
+    print(f"RSS growth for {SESSIONS:,} running sessions, scaled to per 100k")
+    print(f"  dict-of-dicts + parallel dicts   {dicts * scale / 2 ** 20:7.1f} MB  ({dicts / SESSIONS:5.0f} B/session)")
+    print(f"  SessionTable of SyncSession      {table * scale / 2 ** 20:7.1f} MB  ({table / SESSIONS:5.0f} B/session)")
+    print(f"  saved                            {(dicts - table) * scale / 2 ** 20:7.1f} MB  "
+          f"({(1 - table / dicts) * 100:.0f}%)")
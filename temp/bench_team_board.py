@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_cold_start import service_account
+
+SIZES = [int(n) for n in os.getenv("BENCH_SIZES", "10,100,1000,5000").split(",")]
+VIEWS = int(os.getenv("BENCH_VIEWS", "200"))
+TEAM = "T1"
+UID = "bench-viewer"
+
+
+def per_view(seconds, views=VIEWS):
+    return seconds / views * 1000
+
+
+def members(n, now):
+    """The user documents a per-view query would read: one per member, each playing something."""
+    return [{
+        'slack': {'team_id': TEAM, 'user_id': f"U{i}"},
+        'priority': {'list': "spotify"},
+        'last_spotify': {'name': f"Track {i}", 'artist': f"Artist {i % 300}", 'is_playing': True,
+                         'duration_ms': 240000, 'progress_ms': 1000, 'updated': now}
+    } for i in range(n)]
+
+
+def scan(app, users, now):
+    """The board built on every view, as a query over the team's user documents would."""
+    entries = []
+    for user_data in users:
+        track = app.get_current_track_from_priority(user_data)
+        if track:
+            entries.append({'member': user_data['slack']['user_id'], 'track': track,
+                            'text': f"{track['artist']} – {track['name']}", 'updated': now})
+    return json.dumps({'type': 'snapshot', 'team': TEAM, 'members': entries})
+
+
+def propagation(app, path, n):
+    """Seconds for one poll pass of a second replica to apply n changes made on this one."""
+    from teamboard import BoardLog, TeamBoards
+
+    replica = TeamBoards(log=BoardLog(path, "bench-replica"))
+    # Caught up first, so only the changes below are timed.
+    for change in replica.log.changes():
+        replica.apply(*change)
+    for i in range(n):
+        app.team_boards.update(TEAM, f"U{i}", f"user-{i}", {'name': "Next"}, f"Artist – Next {n}-{i}")
+    started = time.perf_counter()
+    for change in replica.log.changes():
+        replica.apply(*change)
+    elapsed = time.perf_counter() - started
+    shown = json.loads(replica.snapshot(TEAM))['members']
+    return elapsed, sum(entry['text'].startswith(f"Artist – Next {n}-") for entry in shown)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "leases.db")
+        os.environ.update({
+            'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account(directory),
+            'LEASE_DB_PATH': path,
+            'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+            'LOG_LEVEL': "ERROR"
+        })
+        import app
+
+        app.get_user_data = lambda firebase_uid, fields=None: {'slack': {'team_id': TEAM, 'user_id': "U0"}}
+        app.app.secret_key = "bench"
+        client = app.app.test_client()
+        with client.session_transaction() as session:
+            session['firebase_uid'] = UID
+            session['user_email'] = "bench@example.com"
+
+        print(f"GET /team/{TEAM}/board, ms per view over {VIEWS} views")
+        print(f"  {'members':>7}{'per-view scan':>15}{'cached':>9}{'after change':>14}{'KB':>8}"
+              f"{'replica catch-up ms':>21}")
+        for n in SIZES:
+            for i in range(n):
+                app.team_boards.update(TEAM, f"U{i}", f"user-{i}", {'name': f"Track {i}"}, f"Artist – Track {i}")
+            now = time.time()
+            users = members(n, now)
+
+            started = time.perf_counter()
+            for _ in range(VIEWS):
+                body = scan(app, users, now)
+            scanned = per_view(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for _ in range(VIEWS):
+                response = client.get(f"/team/{TEAM}/board")
+            cached = per_view(time.perf_counter() - started)
+            assert len(json.loads(response.data)['members']) == n
+
+            started = time.perf_counter()
+            for v in range(VIEWS):
+                app.team_boards.update(TEAM, "U0", "user-0", {'name': "Change"}, f"Artist – Change {v}")
+                client.get(f"/team/{TEAM}/board")
+            changed = per_view(time.perf_counter() - started)
+
+            caught_up, shown = propagation(app, path, n)
+            assert shown == n, (shown, n)
+            print(f"  {n:>7}{scanned:>15.2f}{cached:>9.2f}{changed:>14.2f}{len(response.data) / 1024:>8.0f}"
+                  f"{caught_up * 1000:>21.1f}")
@@ -0,0 +1,168 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coalesce import UpdateCoalescer
+from playback_state import PlaybackState
+from trackkey import track_key
+
+# The same recordings as reported by each source: Spotify metadata, YouTube
+# channel/video titles, SoundCloud uploads and Apple Music tab titles.
+CORPUS = [
+    [("Daft Punk, Pharrell Williams, Nile Rodgers", "Get Lucky (feat. Pharrell Williams & Nile Rodgers) - Radio Edit"),
+     ("DaftPunkVEVO", "Daft Punk - Get Lucky (Official Audio) ft. Pharrell Williams, Nile Rodgers"),
+     ("Daft Punk - Topic", "Get Lucky (feat. Pharrell Williams & Nile Rodgers)"),
+     ("Daft Punk", "Get Lucky (feat. Pharrell Williams and Nile Rodgers)")],
+    [("Queen", "Bohemian Rhapsody - Remastered 2011"),
+     ("Queen Official", "Queen – Bohemian Rhapsody (Official Video Remastered)"),
+     ("Queen", "Bohemian Rhapsody (2011 Remaster)")],
+    [("The Beatles", "Hey Jude - Remastered 2015"),
+     ("The Beatles - Topic", "Hey Jude (Remastered 2015)"),
+     ("The Beatles", "Hey Jude")],
+    [("Beyoncé", "Halo"),
+     ("BeyonceVEVO", "Beyoncé - Halo (Official Video)"),
+     ("Beyonce", "Halo [HD]")],
+    [("Sia, Sean Paul", "Cheap Thrills (feat. Sean Paul)"),
+     ("SiaVEVO", "Sia - Cheap Thrills ft. Sean Paul (Official Lyric Video)"),
+     ("Sia", "Cheap Thrills (Feat. Sean Paul)")],
+    [("Mark Ronson, Bruno Mars", "Uptown Funk (feat. Bruno Mars)"),
+     ("Mark Ronson", "Mark Ronson - Uptown Funk (Official Video) ft. Bruno Mars"),
+     ("Mark Ronson", "Uptown Funk (feat. Bruno Mars)")],
+    [("Ed Sheeran", "Shape of You"),
+     ("Ed Sheeran", "Ed Sheeran - Shape of You [Official Music Video]"),
+     ("Ed Sheeran", "Shape Of You (Official Lyric Video)")],
+    [("Rosalía", "DESPECHÁ"),
+     ("ROSALÍA", "ROSALÍA - DESPECHÁ (Official Video)"),
+     ("Rosalia", "Despecha")],
+    [("Sigur Rós", "Hoppípolla"),
+     ("Sigur Rós - Topic", "Hoppípolla"),
+     ("sigurros", "Sigur Rós - Hoppípolla (Official Video) [4K]")],
+    [("Childish Gambino", "This Is America"),
+     ("ChildishGambinoVEVO", "Childish Gambino - This Is America (Official Video)"),
+     ("Childish Gambino", "This Is America")],
+    [("Lady Gaga, Bradley Cooper", "Shallow"),
+     ("Lady Gaga", "Lady Gaga, Bradley Cooper - Shallow (from A Star Is Born) (Official Music Video)"),
+     ("Lady Gaga & Bradley Cooper", "Shallow")],
+    [("Eminem, Rihanna", "Love The Way You Lie"),
+     ("EminemVEVO", "Eminem - Love The Way You Lie ft. Rihanna"),
+     ("Eminem", "Love The Way You Lie (feat. Rihanna) [Explicit]")],
+    [("Radiohead", "Karma Police"),
+     ("Radiohead", "Radiohead - Karma Police"),
+     ("Radiohead - Topic", "Karma Police (Remastered)")],
+    [("Dua Lipa", "Levitating (feat. DaBaby)"),
+     ("Dua Lipa", "Dua Lipa - Levitating Featuring DaBaby (Official Music Video)"),
+     ("Dua Lipa, DaBaby", "Levitating")],
+    [("Fleetwood Mac", "Dreams - 2004 Remaster"),
+     ("Fleetwood Mac", "Fleetwood Mac - Dreams (Official Music Video) [HD]"),
+     ("Fleetwood Mac", "Dreams (2004 Remaster)")],
+    [("Arctic Monkeys", "From The Ritz To The Rubble"),
+     ("ArcticMonkeysVEVO", "Arctic Monkeys - From The Ritz To The Rubble")],
+    [("The Buggles", "Video Killed the Radio Star"),
+     ("BugglesVEVO", "The Buggles - Video Killed the Radio Star (Official Video)")],
+]
+
+# Different recordings that must keep distinct keys.
+DISTINCT = [
+    ("Childish Gambino", "This Is America"),
+    ("Childish Gambino", "This Is America (Live)"),
+    ("Queen", "Bohemian Rhapsody"),
+    ("Queen", "Bohemian Rhapsody - Live Aid"),
+    ("Daft Punk", "Get Lucky"),
+    ("Daft Punk", "Get Lucky (Daft Punk Remix)"),
+    ("Billy Idol", "Dancing with Myself"),
+    ("Myself", "Dancing"),
+    # Titles that start with a decoration word must not lose the title.
+    ("ArcticMonkeysVEVO", "Arctic Monkeys - From The Ritz To The Rubble"),
+    ("ArcticMonkeysVEVO", "Arctic Monkeys - Clean Up Your Act"),
+    ("BugglesVEVO", "The Buggles - Video Killed the Radio Star"),
+    ("The Buggles", "The Buggles"),
+]
+
+BENCH_TITLES = 100_000
+STREAM_REPORTS = 20_000
+SYNC_INTERVAL = 15
+
+
+def check_corpus():
+    merged = sum(len({track_key(*variant) for variant in group}) == 1 for group in CORPUS)
+    distinct = len({track_key(*pair) for pair in DISTINCT}) == len(DISTINCT)
+    return merged, distinct
+
+
+def throughput(rng):
+    # Cold: every pair is new, as for a fresh upload title. Warm: the pairs a
+    # running server keeps seeing.
+    variants = [variant for group in CORPUS for variant in group]
+    unique = [(artist, f"{name} {i}") for i in range(BENCH_TITLES // len(variants) + 1) for artist, name in variants][:BENCH_TITLES]
+    track_key.cache_clear()
+    started = time.perf_counter()
+    for artist, name in unique:
+        track_key(artist, name)
+    cold = time.perf_counter() - started
+
+    repeated = [rng.choice(variants) for _ in range(BENCH_TITLES)]
+    track_key.cache_clear()
+    started = time.perf_counter()
+    for artist, name in repeated:
+        track_key(artist, name)
+    warm = time.perf_counter() - started
+    return BENCH_TITLES / cold, BENCH_TITLES / warm
+
+
+def redundant_writes(rng):
+    """A listener whose active source flips between variants of the same song.
+
+    Each step picks a song, then reports it 1-6 times from random sources, as
+    happens when priority changes or a video autoplays the track already on
+    Spotify; video tabs sometimes carry a notification count. Counts the
+    Firestore writes the per-source coalescer forwards and the Slack writes
+    PlaybackState makes, with raw (name, artist) identity and with the
+    canonical key.
+    """
+    now = [0.0]
+    clock = lambda: now[0]
+    raw = {'firestore': 0, 'slack': 0, 'coalescer': UpdateCoalescer(clock=clock), 'playback': PlaybackState()}
+    keyed = {'firestore': 0, 'slack': 0, 'coalescer': UpdateCoalescer(clock=clock), 'playback': PlaybackState()}
+    sources = ['spotify', 'youtube', 'soundcloud', 'apple_music']
+    last_variant = {}
+
+    reports = 0
+    while reports < STREAM_REPORTS:
+        group = rng.choice(CORPUS)
+        for _ in range(rng.randint(1, 6)):
+            reports += 1
+            now[0] += SYNC_INTERVAL
+            source = rng.choice(sources)
+            # A source keeps reporting its own spelling of the song.
+            variant = last_variant.get((source, id(group))) or rng.choice(group)
+            last_variant[(source, id(group))] = variant
+            artist, name = variant
+            if source in ('youtube', 'soundcloud') and rng.random() < 0.25:
+                # The tab title picked up a notification count meanwhile.
+                name = f"({rng.randint(1, 9)}) {name}"
+            text = f"{artist} – {name}"
+            key = track_key(artist, name)
+            for counts, offered, identity in ((raw, (name, artist), None), (keyed, key, key)):
+                if counts['coalescer'].offer("user", source, offered):
+                    counts['firestore'] += 1
+                expiration = counts['playback'].should_write(text, None, now[0], identity)
+                if expiration is not None:
+                    counts['playback'].written(text, expiration, identity)
+                    counts['slack'] += 1
+    return reports, raw, keyed
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    merged, distinct = check_corpus()
+    print(f"corpus: {merged}/{len(CORPUS)} songs collapse to one key, distinct recordings kept apart: {distinct}")
+    cold, warm = throughput(rng)
+    print(f"throughput: {cold:,.0f} keys/s cold, {warm:,.0f} keys/s memoised")
+    reports, raw, keyed = redundant_writes(rng)
+    print(f"{reports} reports:")
+    for sink in ('firestore', 'slack'):
+        saved = 1 - keyed[sink] / raw[sink]
+        print(f"  {sink:<9} raw {raw[sink]:>6}  keyed {keyed[sink]:>6}  ({saved:.1%} fewer)")
+    sys.exit(0 if merged == len(CORPUS) and distinct else 1)
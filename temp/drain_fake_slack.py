@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_cold_start import service_account
+
+SESSIONS = int(os.getenv("DRAIN_SESSIONS", "5000"))
+# Slack answers profile.set in tens of milliseconds and rate limits per workspace;
+# one shared bucket here keeps the fake simple and strict.
+SLACK_LATENCY = 0.02
+SLACK_RATE = 300
+# Every fifth user has a second workspace, so partial failures are possible.
+TWO_WORKSPACES_EVERY = 5
+CONFIGS = [
+    # (label, workers, rate/s, deadline s)
+    ("defaults", 16, 20, 30),
+    ("32 workers, 200/s", 32, 200, 60),
+    ("64 workers, 1000/s", 64, 1000, 60),
+]
+
+
+class FakeSlack(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    tokens = SLACK_RATE
+    updated = time.monotonic()
+    writes = Counter()
+    limited = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        token = self.headers['Authorization'].split()[-1]
+        time.sleep(SLACK_LATENCY)
+        cls = FakeSlack
+        with cls.lock:
+            now = time.monotonic()
+            cls.tokens = min(SLACK_RATE, cls.tokens + (now - cls.updated) * SLACK_RATE)
+            cls.updated = now
+            allowed = cls.tokens >= 1
+            if allowed:
+                cls.tokens -= 1
+                cls.writes[token] += 1
+            else:
+                cls.limited += 1
+        if allowed:
+            assert body['profile']['status_text'] == ""
+            self.reply(200, {'ok': True})
+        else:
+            self.reply(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': "1"})
+
+    def reply(self, status, data, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def users(count):
+    data = {}
+    for i in range(count):
+        uid = f"user-{i}"
+        workspaces = {'T1': {'access_token': f"{uid}-T1"}}
+        if i % TWO_WORKSPACES_EVERY == 0:
+            workspaces['T2'] = {'access_token': f"{uid}-T2"}
+        data[uid] = {'slack_workspaces': workspaces}
+    return data
+
+
+def run(app, config, data):
+    from shutdown import Drainer
+    label, workers, rate, deadline = config
+    FakeSlack.writes.clear()
+    FakeSlack.limited = 0
+    app.drainer = Drainer(max_workers=workers, rate=rate, deadline=deadline)
+    for uid in data:
+        app.sync_sessions.ensure(uid).active = True
+    report = app.drain_sessions()
+    tokens = sum(len(user['slack_workspaces']) for user in data.values())
+    restored = set(report['restored'])
+    missing = [uid for uid in restored if any(FakeSlack.writes[f"{uid}-{team}"] != 1
+                                              for team in data[uid]['slack_workspaces'])]
+    duplicates = sum(1 for count in FakeSlack.writes.values() if count > 1)
+    print(f"  {label:<20}{report['elapsed']:>8.1f}s{len(report['restored']):>9}{len(report['failed']):>8}"
+          f"{len(report['pending']):>9}{sum(FakeSlack.writes.values()):>8}/{tokens}{FakeSlack.limited:>7}"
+          f"{duplicates:>7}")
+    return not report['failed'] and not missing and not duplicates
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSlack)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account(directory),
+            'LEASE_DB_PATH': os.path.join(directory, "leases.db"),
+            'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db"),
+            'LOG_LEVEL': "ERROR"
+        })
+        import app
+        import lean_api
+        logging.getLogger("urllib3").setLevel(logging.ERROR)
+        lean_api.SLACK_PROFILE_SET_URL = f"http://127.0.0.1:{server.server_address[1]}/api/users.profile.set"
+        data = users(SESSIONS)
+        app.get_user_data = lambda uid, fields=None: data[uid]
+
+        print(f"drain of {SESSIONS} sessions, fake Slack at {SLACK_RATE}/s with {SLACK_LATENCY * 1000:.0f} ms latency")
+        print(f"  {'config':<20}{'elapsed':>9}{'cleared':>9}{'failed':>8}{'pending':>9}{'writes':>14}{'429s':>7}"
+              f"{'dupes':>7}")
+        ok = all([run(app, config, data) for config in CONFIGS])
+    server.shutdown()
+    sys.exit(0 if ok else 1)
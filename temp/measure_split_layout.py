@@ -0,0 +1,218 @@
+"""Bytes read and write contention for one user, before and after the users/playback split.
+
+Runs against the Firestore emulator only, e.g.
+
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python temp/measure_split_layout.py
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from user_store import MIGRATED, PLAYBACK, USERS, UserStore, is_playback_field
+
+TICKS = int(os.getenv("BENCH_TICKS", "720"))
+# The loops poll every 5 s and refresh their settings once a minute.
+SETTINGS_EVERY = 12
+EDITS = int(os.getenv("BENCH_EDITS", "50"))
+WRITERS = int(os.getenv("BENCH_WRITERS", "4"))
+PROJECT = "demo-split-layout"
+
+SYNC_SETTINGS_FIELDS = ['priority', 'slack', 'slack_workspaces', 'webhooks', 'schedule']
+PULL_SETTINGS_FIELDS = ['priority', 'spotify.access_token', 'spotify.refresh_token', 'schedule']
+PLAYBACK_FIELDS = ['last_spotify', 'last_apple', 'last_youtube']
+
+
+def track(source, n):
+    return {
+        'name': f"A Reasonably Long Track Title {n}",
+        'artist': "Some Artist feat. Another Artist",
+        'album': "The Album Name (Deluxe Edition)",
+        'album_art': f"https://i.scdn.co/image/ab67616d0000b273{n:024d}",
+        'duration_ms': 215000,
+        'progress_ms': 1000 * n % 215000,
+        'is_playing': True,
+        'source': source,
+        'updated': datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+
+
+def user_document(n=0):
+    """A connected user with three workspaces, two webhooks and a schedule."""
+    return {
+        'email': "someone@example.com",
+        'last_login': datetime.datetime.now(datetime.timezone.utc),
+        'page_version': 7,
+        'priority': {'list': "spotify,apple,youtube"},
+        'slack': {'access_token': "xoxp-" + "1" * 70, 'user_id': "U0123456789", 'team_id': "T0123456789",
+                  'connected_at': datetime.datetime.now(datetime.timezone.utc)},
+        'slack_workspaces': {f"T{i:010d}": {'access_token': "xoxp-" + "2" * 70, 'user_id': f"U{i:010d}"}
+                             for i in range(3)},
+        'spotify': {'access_token': "BQ" + "3" * 250, 'refresh_token': "AQ" + "4" * 130,
+                    'connected_at': datetime.datetime.now(datetime.timezone.utc)},
+        'webhooks': [{'url': f"https://hooks.example.com/now-playing/{i}", 'secret': "s" * 32} for i in range(2)],
+        'schedule': {'days': [0, 1, 2, 3, 4], 'start': "09:00", 'end': "18:00", 'timezone': "Europe/Berlin"},
+        **{f"last_{source}": track(source, n) for source in ('spotify', 'apple', 'youtube')}
+    }
+
+
+def value_size(value):
+    """Storage size of a Firestore value, as documented for billing and limits."""
+    if isinstance(value, str):
+        return len(value.encode()) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, dict):
+        return sum(len(k.encode()) + 1 + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(value_size(v) for v in value)
+    # Numbers, timestamps and geo points.
+    return 8
+
+
+def document_size(snapshot):
+    if not snapshot.exists:
+        return 0
+    name = sum(len(part.encode()) + 1 for part in snapshot.reference.path.split('/')) + 16
+    return name + value_size(snapshot.to_dict() or {})
+
+
+class Counting:
+    """Wraps a client so every document read adds its size to bytes."""
+
+    def __init__(self, db):
+        self.db = db
+        self.bytes = 0
+        self.reads = 0
+
+    def collection(self, name):
+        return CountingCollection(self, self.db.collection(name))
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+class CountingCollection:
+    def __init__(self, counter, collection):
+        self.counter = counter
+        self.collection = collection
+
+    def document(self, document_id):
+        return CountingDocument(self.counter, self.collection.document(document_id))
+
+
+class CountingDocument:
+    def __init__(self, counter, ref):
+        self.counter = counter
+        self.ref = ref
+
+    def get(self, *args, **kwargs):
+        snapshot = self.ref.get(*args, **kwargs)
+        self.counter.reads += 1
+        self.counter.bytes += document_size(snapshot)
+        return snapshot
+
+    def __getattr__(self, name):
+        return getattr(self.ref, name)
+
+
+def legacy_loops(db, uid, ticks):
+    """The loops before the split: the whole users/<uid> read on every tick, by both loops."""
+    users = db.collection(USERS)
+    for _ in range(ticks):
+        users.document(uid).get()
+        users.document(uid).get()
+
+
+def split_loops(db, uid, ticks):
+    """The loops now: masked settings once a minute, the playback document every tick."""
+    store = UserStore(db)
+    for tick in range(ticks):
+        if tick % SETTINGS_EVERY == 0:
+            store.get(uid, SYNC_SETTINGS_FIELDS)
+            store.get(uid, PULL_SETTINGS_FIELDS)
+        store.get(uid, PLAYBACK_FIELDS)
+        store.get(uid, PLAYBACK_FIELDS)
+
+
+def seed(db, uid, split):
+    data = user_document()
+    if split:
+        db.collection(USERS).document(uid).set({k: v for k, v in data.items() if not is_playback_field(k)})
+        db.collection(PLAYBACK).document(uid).set(
+            {**{k: v for k, v in data.items() if is_playback_field(k)}, MIGRATED: True})
+    else:
+        db.collection(USERS).document(uid).set(data)
+
+
+def contention(db, uid, split):
+    """Settings edits made in a transaction while WRITERS poll loops write playback as fast as they can.
+
+    Returns (attempts per edit, p95 edit seconds, playback writes made meanwhile).
+    """
+    from google.cloud import firestore
+
+    target = db.collection(PLAYBACK if split else USERS).document(uid)
+    users = db.collection(USERS).document(uid)
+    stop = threading.Event()
+    writes = [0] * WRITERS
+
+    def poller(n):
+        i = 0
+        while not stop.is_set():
+            target.set({'last_spotify': track('spotify', i)}, merge=True)
+            writes[n] += 1
+            i += 1
+
+    attempts = [0]
+
+    @firestore.transactional
+    def edit(transaction, n):
+        attempts[0] += 1
+        hooks = (users.get(field_paths=['webhooks'], transaction=transaction).to_dict() or {}).get('webhooks', [])
+        transaction.update(users, {'webhooks': hooks[-1:] + [{'url': f"https://hooks.example.com/{n}",
+                                                               'secret': "s" * 32}]})
+
+    threads = [threading.Thread(target=poller, args=(n,), daemon=True) for n in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    latencies = []
+    failed = 0
+    try:
+        for n in range(EDITS):
+            started = time.perf_counter()
+            try:
+                edit(db.transaction(), n)
+            except Exception:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    latencies.sort()
+    return attempts[0] / EDITS, latencies[int(len(latencies) * 0.95)], sum(writes), failed
+
+
+if __name__ == "__main__":
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("Set FIRESTORE_EMULATOR_HOST; this writes test documents and must not run against production.")
+    from google.cloud import firestore
+
+    db = firestore.Client(project=PROJECT)
+    print(f"One user, {TICKS} ticks of both loops ({TICKS * 5 / 60:.0f} min at a 5 s poll)")
+    print(f"  {'layout':<8}{'reads':>8}{'KB read':>10}{'edit attempts':>15}{'edit p95 ms':>13}"
+          f"{'poll writes':>13}{'failed edits':>14}")
+    for split in (False, True):
+        uid = f"bench-{'split' if split else 'legacy'}-{int(time.time())}"
+        seed(db, uid, split)
+        counter = Counting(db)
+        (split_loops if split else legacy_loops)(counter, uid, TICKS)
+        attempts, p95, writes, failed = contention(db, uid, split)
+        print(f"  {'split' if split else 'legacy':<8}{counter.reads:>8}{counter.bytes / 1024:>10.1f}"
+              f"{attempts:>15.2f}{p95 * 1000:>13.1f}{writes:>13}{failed:>14}")
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import firebase_admin
+from dotenv import load_dotenv
+from firebase_admin import credentials, firestore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from user_store import USERS, PLAYBACK, MIGRATED, is_playback_field
+
+load_dotenv()
+
+BATCH_SIZE = 200
+
+
+def migrate(db, dry_run=False):
+    moved = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection(USERS).stream():
+        data = doc.to_dict() or {}
+        hot = {k: v for k, v in data.items() if is_playback_field(k)}
+        moved += bool(hot)
+        if dry_run:
+            continue
+        # Sources polled since the split already have a newer track in playback.
+        playback = db.collection(PLAYBACK).document(doc.id).get()
+        current = (playback.to_dict() or {}) if playback.exists else {}
+        if current.get(MIGRATED):
+            continue
+        fresh = {k: v for k, v in hot.items() if k not in current}
+        # Every user gets the marker, so reads stop looking in users/<uid>.
+        batch.set(db.collection(PLAYBACK).document(doc.id), {**fresh, MIGRATED: True}, merge=True)
+        if hot:
+            batch.update(doc.reference, {k: firestore.DELETE_FIELD for k in hot})
+        pending += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return moved
+
+
+if __name__ == "__main__":
+    cred = credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH"))
+    firebase_admin.initialize_app(cred)
+    dry_run = "--dry-run" in sys.argv
+    count = migrate(firestore.client(), dry_run)
+    print(f"{'Would move' if dry_run else 'Moved'} playback fields of {count} users to '{PLAYBACK}'")
@@ -0,0 +1,94 @@
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import AdmissionController, RouteClass
+
+# A gthread-style server: a fixed pool of request threads in front of a
+# backend (Firestore/Auth) that serves BACKEND_CAPACITY calls at a time.
+SERVER_THREADS = 64
+BACKEND_CAPACITY = 16
+RATE = 200
+CLIENT_TIMEOUT = 5.0
+# (start, end, backend latency in seconds); latency is injected in the middle phase.
+PHASES = [(0, 4, 0.02), (4, 16, 0.4), (16, 22, 0.02)]
+MIX = [('set_client_status', 0.75), ('get_sync_status', 0.1), ('verify_token', 0.05), ('health_check', 0.1)]
+
+
+def make_admission():
+    return AdmissionController([
+        RouteClass('ingest', 16),
+        RouteClass('auth', 8),
+        RouteClass('sync', 8),
+        RouteClass('default', 8),
+    ], {'set_client_status': 'ingest', 'get_sync_status': 'sync', 'verify_token': 'auth'},
+        exempt=['health_check'])
+
+
+def run(admission):
+    latency = [PHASES[0][2]]
+    backend = threading.BoundedSemaphore(BACKEND_CAPACITY)
+    server = ThreadPoolExecutor(max_workers=SERVER_THREADS)
+    results = []
+    lock = threading.Lock()
+
+    def handle(endpoint, arrived):
+        status = 200
+        if endpoint != 'health_check':
+            route_class = admission.classify(endpoint) if admission else None
+            if route_class is not None and not route_class.acquire():
+                status = 503
+            else:
+                started = time.monotonic()
+                with backend:
+                    time.sleep(latency[0])
+                if route_class is not None:
+                    route_class.release(time.monotonic() - started)
+        with lock:
+            results.append((arrived, endpoint, status, time.monotonic() - arrived))
+
+    rng = random.Random(0)
+    endpoints, weights = zip(*MIX)
+    began = time.monotonic()
+    arrivals = 0
+    for start, end, phase_latency in PHASES:
+        latency[0] = phase_latency
+        while time.monotonic() - began < end:
+            server.submit(handle, rng.choices(endpoints, weights)[0], time.monotonic())
+            arrivals += 1
+            time.sleep(rng.expovariate(RATE))
+    server.shutdown(wait=True)
+    return began, arrivals, results
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def report(label, began, results):
+    print(label)
+    for start, end, phase_latency in PHASES:
+        # Bucketed by completion time, so a backlog served late counts where it was served.
+        phase = [r for r in results if start <= r[0] + r[3] - began < end]
+        ok = [r for r in phase if r[2] == 200 and r[1] != 'health_check' and r[3] <= CLIENT_TIMEOUT]
+        shed = [r for r in phase if r[2] == 503]
+        health = [r[3] for r in phase if r[1] == 'health_check']
+        print(f"  {start:>2}-{end:<2}s backend {phase_latency * 1000:>4.0f} ms: "
+              f"goodput {len(ok) / (end - start):6.1f}/s  p50 {percentile([r[3] for r in ok], 0.5) * 1000:7.0f} ms  "
+              f"p99 {percentile([r[3] for r in ok], 0.99) * 1000:7.0f} ms  shed {len(shed):5}  "
+              f"health p99 {percentile(health, 0.99) * 1000:7.0f} ms")
+
+
+if __name__ == "__main__":
+    began, arrivals, results = run(None)
+    report(f"without admission ({arrivals} requests)", began, results)
+    admission = make_admission()
+    began, arrivals, results = run(admission)
+    report(f"with admission ({arrivals} requests)", began, results)
+    print({name: {k: v for k, v in stats.items() if k in ('admitted', 'shed', 'timed_out')}
+           for name, stats in admission.stats().items()})
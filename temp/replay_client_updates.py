@@ -0,0 +1,95 @@
+import heapq
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coalesce import UpdateCoalescer
+from trackkey import track_key
+
+DAY = 86400
+START = 1767600000
+POPUP_INTERVAL = 5
+BACKGROUND_INTERVAL = 20
+# Reports reach the server up to this late, so two devices can arrive out of order.
+MAX_NETWORK_DELAY = 3.0
+SOURCES = ["youtube", "apple_music"]
+
+
+def listening(rng):
+    """(start, end, source, artist, title) tracks over a day of sessions."""
+    tracks = []
+    t = START + rng.uniform(0, 3600)
+    while t < START + DAY:
+        session_end = t + rng.uniform(600, 3 * 3600)
+        source = rng.choice(SOURCES)
+        while t < session_end:
+            duration = rng.uniform(120, 360)
+            tracks.append((t, t + duration, source, f"Artist {rng.randrange(500)}", f"Track {rng.randrange(5000)}"))
+            t += duration
+        t += rng.uniform(1800, 6 * 3600)
+    return tracks
+
+
+def reports(rng, uid, tracks):
+    """(arrival, uid, source, artist, title, client_ts) as the extension sends them.
+
+    The background script reports every 20 s from each of the user's devices;
+    a popup left open reports every 5 s on top of that. Tab titles sometimes
+    carry decoration the next report drops.
+    """
+    devices = 1 + (rng.random() < 0.4) + (rng.random() < 0.1)
+    events = []
+    for _ in range(devices):
+        offset = rng.uniform(0, BACKGROUND_INTERVAL)
+        for start, end, source, artist, title in tracks:
+            t = start + offset % BACKGROUND_INTERVAL
+            popup_until = start + rng.uniform(30, 300) if rng.random() < 0.15 else start
+            while t < end:
+                name = f"{title} (Official Video)" if rng.random() < 0.1 else title
+                events.append((t + rng.uniform(0.05, MAX_NETWORK_DELAY), uid, source, artist, name, t))
+                t += POPUP_INTERVAL if t < popup_until else BACKGROUND_INTERVAL
+    return events
+
+
+def replay(users, seed=0, window=300):
+    rng = random.Random(seed)
+    clock = [START]
+    coalescer = UpdateCoalescer(window=window, clock=lambda: clock[0])
+    streams = []
+    truth = {}
+    for i in range(users):
+        uid = f"user-{i}"
+        tracks = listening(rng)
+        streams.append(sorted(reports(rng, uid, tracks)))
+        truth[uid] = tracks
+    written = {}
+    reports_seen = 0
+    for arrival, uid, source, artist, name, client_ts in heapq.merge(*streams):
+        clock[0] = arrival
+        reports_seen += 1
+        key = track_key(artist, name)
+        if coalescer.offer(uid, source, key, client_ts):
+            written[(uid, source)] = key
+
+    # Whatever Firestore holds last for each source must be that source's latest track.
+    stale = 0
+    for uid, tracks in truth.items():
+        for source in SOURCES:
+            played = [(artist, title) for _, _, s, artist, title in tracks if s == source]
+            if played and written.get((uid, source)) != track_key(*played[-1]):
+                stale += 1
+    stats = coalescer.stats()
+    return reports_seen, stats['forwarded'], stats['absorbed'], stale
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seen, forwarded, absorbed, stale = replay(users)
+    print(f"{users} users, one day of extension reports (background {BACKGROUND_INTERVAL}s, "
+          f"popup {POPUP_INTERVAL}s, 1-3 devices)")
+    print(f"  reports received           {seen:>10,}  (one Firestore write each before coalescing)")
+    print(f"  forwarded to Firestore     {forwarded:>10,}  ({forwarded / seen * 100:.1f}%)")
+    print(f"  absorbed in memory         {absorbed:>10,}")
+    print(f"  sources left on an older track than the last one played: {stale}")
+    sys.exit(0 if stale == 0 else 1)
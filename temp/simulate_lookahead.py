@@ -0,0 +1,213 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import providers as providers_module
+from clock import VirtualClock, sync_clock
+from playback_state import PlaybackState, track_ends_at, staged_track, next_boundary
+from providers import SpotifyProvider, PollScheduler
+from trackkey import track_key
+
+DAY = 86400
+START = 1767600000
+# Share of tracks skipped part-way, and of queue heads that change after they were read.
+SKIP_RATE = 0.1
+QUEUE_CHANGE_RATE = 0.05
+SAMPLE_SECONDS = 2
+
+
+class Listener:
+    """A seeded day of listening sessions with skips, plus what the queue endpoint reports."""
+
+    def __init__(self, rng):
+        self.tracks = []
+        t = START + rng.uniform(0, 3600)
+        while t < START + DAY:
+            session_end = t + rng.uniform(600, 3 * 3600)
+            while t < session_end:
+                duration = rng.uniform(120, 360)
+                played = duration * rng.uniform(0.2, 0.9) if rng.random() < SKIP_RATE else duration
+                self.tracks.append({
+                    'start': t, 'end': t + played, 'duration': duration,
+                    'name': f"Track {rng.randrange(5000)}", 'artist': f"Artist {rng.randrange(500)}"
+                })
+                t += played
+            t += rng.uniform(1800, 6 * 3600)
+        for i, track in enumerate(self.tracks):
+            following = self.tracks[i + 1] if i + 1 < len(self.tracks) else None
+            if following is not None and following['start'] == track['end'] and rng.random() >= QUEUE_CHANGE_RATE:
+                track['queued'] = following
+            else:
+                # The queue still holds something when the user stops or rearranges it.
+                track['queued'] = {'name': f"Track {rng.randrange(5000)}", 'artist': f"Artist {rng.randrange(500)}",
+                                   'duration': rng.uniform(120, 360)}
+        self.position = 0
+
+    def playing(self, now):
+        while self.position < len(self.tracks) and self.tracks[self.position]['end'] <= now:
+            self.position += 1
+        if self.position == len(self.tracks) or self.tracks[self.position]['start'] > now:
+            return None
+        return self.tracks[self.position]
+
+
+def as_item(track, track_id=None):
+    return SimpleNamespace(id=track_id, name=track['name'], artists=[SimpleNamespace(name=track['artist'])],
+                           duration_ms=int(track['duration'] * 1000))
+
+
+def install_fake_spotify(listeners):
+    """Routes the provider's Spotify calls to the listeners; the access token is the uid."""
+    def fetch_playback(access_token, timeout=10):
+        now = sync_clock.time()
+        track = listeners[access_token].playing(now)
+        if track is None:
+            return None
+        return SimpleNamespace(is_playing=True, progress_ms=int((now - track['start']) * 1000),
+                               item=as_item(track, f"{access_token}:{track['start']}"))
+
+    def fetch_next_track(access_token, timeout=10):
+        track = listeners[access_token].playing(sync_clock.time())
+        return as_item(track['queued']) if track else None
+
+    providers_module.fetch_playback = fetch_playback
+    providers_module.fetch_next_track = fetch_next_track
+
+
+def pull_loop(uid, user_data, scheduler, offset):
+    """Same cadence as spotify_pull_worker."""
+    # Workers start whenever their user did, so the two loops are not in phase.
+    sync_clock.sleep(offset)
+    while True:
+        delay = scheduler.poll_once(user_data, sync_clock.time())
+        sync_clock.sleep(min(delay, 30))
+
+
+def sync_loop(uid, user_data, shown, offset):
+    """Same write decisions and sleeps as slack_sync_worker, with the Slack write recorded instead of sent."""
+    playback = PlaybackState()
+    sync_clock.sleep(offset)
+    while True:
+        now = sync_clock.time()
+        raw = user_data.get('last_spotify')
+        track = staged_track(raw, now) if raw else None
+        ends_at = track_ends_at(track) if track else None
+        if not track or track.get('is_playing') is False or (ends_at is not None and ends_at <= now):
+            if playback.should_clear():
+                shown.append((now, None, 0))
+            playback.should_write(None, None, now)
+            sync_clock.sleep(10)
+            continue
+
+        status_text = f"{track['artist']} – {track['name']}"
+        predicted = track.get('predicted', False)
+        key = track_key(track['artist'], track['name'])
+        expiration = playback.should_write(status_text, ends_at, now, key, predicted)
+        if expiration is not None:
+            playback.written(status_text, expiration, key, predicted)
+            shown.append((now, status_text, expiration))
+        boundary = next_boundary(track, sync_clock.time())
+        sync_clock.sleep(min(15, boundary) if boundary is not None else 15)
+
+
+def score(listener, shown):
+    """Switch latency per track start, and seconds spent showing something other than what plays."""
+    latencies, missed = [], 0
+    times = [event[0] for event in shown]
+    for track in listener.tracks:
+        text = f"{track['artist']} – {track['name']}"
+        hit = None
+        for event in itertools.islice(shown, bisect_left(times, track['start'] - 1), None):
+            if event[0] >= track['end']:
+                break
+            if event[1] == text:
+                hit = event[0]
+                break
+        if hit is None:
+            missed += 1
+        else:
+            latencies.append(max(0.0, hit - track['start']))
+
+    wrong = 0
+    index, current = 0, (None, 0)
+    listener.position = 0
+    for t in range(START, START + DAY, SAMPLE_SECONDS):
+        while index < len(shown) and shown[index][0] <= t:
+            current = (shown[index][1], shown[index][2])
+            index += 1
+        text, expiration = current
+        if text is not None and expiration and expiration <= t:
+            text = None
+        playing = listener.playing(t)
+        expected = f"{playing['artist']} – {playing['name']}" if playing else None
+        if text != expected and (text is not None or expected is not None):
+            wrong += SAMPLE_SECONDS
+    return latencies, missed, wrong
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def simulate(users, lookahead, max_interval=30, seed=0):
+    rng = random.Random(seed)
+    listeners = {f"user-{i}": Listener(rng) for i in range(users)}
+    install_fake_spotify(listeners)
+    provider = SpotifyProvider(refresh=lambda uid, token: None, lookahead=lookahead, max_interval=max_interval)
+    clock = VirtualClock(start=START)
+    previous = sync_clock.install(clock)
+    threading.stack_size(256 * 1024)
+    schedulers, shown = {}, {}
+    try:
+        for uid in listeners:
+            user_data = {'priority': {'list': 'spotify'}, 'spotify': {'access_token': uid}}
+
+            def store(source, song_data, user_data=user_data):
+                user_data[f"last_{source}"] = song_data
+
+            schedulers[uid] = PollScheduler(uid, {'spotify': provider}, store)
+            shown[uid] = []
+            clock.spawn(pull_loop, uid, user_data, schedulers[uid], rng.uniform(0, 30))
+            clock.spawn(sync_loop, uid, user_data, shown[uid], rng.uniform(0, 15))
+        started = time.perf_counter()
+        clock.run(START + DAY)
+        elapsed = time.perf_counter() - started
+    finally:
+        sync_clock.install(previous)
+
+    latencies, missed, wrong = [], 0, 0
+    for uid, listener in listeners.items():
+        user_latencies, user_missed, user_wrong = score(listener, shown[uid])
+        latencies += user_latencies
+        missed += user_missed
+        wrong += user_wrong
+    polls = sum(s.calls for s in schedulers.values())
+    return {
+        'mode': f"lookahead (max {max_interval:.0f}s)" if lookahead else "fixed 30s",
+        'tracks': sum(len(l.tracks) for l in listeners.values()),
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'missed': missed,
+        'wrong_minutes': round(wrong / 60),
+        'calls': polls + provider.queue_calls,
+        'queue_calls': provider.queue_calls,
+        'seconds': round(elapsed, 1)
+    }
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for lookahead, max_interval in ((False, 30), (True, 30), (True, 60)):
+        result = simulate(users, lookahead, max_interval)
+        print(f"{result['mode']:<20} tracks {result['tracks']}  switch latency p50 {result['p50']:.1f}s "
+              f"p90 {result['p90']:.1f}s p99 {result['p99']:.1f}s  missed {result['missed']}  "
+              f"wrong {result['wrong_minutes']} min  upstream calls {result['calls']} "
+              f"({result['queue_calls']} queue)  [{result['seconds']}s]")
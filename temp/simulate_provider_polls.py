@@ -0,0 +1,128 @@
+import os
+import random
+import sys
+from bisect import bisect_right
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from providers import MusicProvider, PollScheduler
+
+DAY = 86400
+START = 1767600000
+INTERVAL = 30
+# Resolution at which the resolved source is compared with what is playing.
+STEP = 5
+SOURCES = ["spotify", "deezer", "tidal", "soundcloud"]
+# Most listening happens on the user's first source.
+SOURCE_WEIGHTS = [0.6, 0.2, 0.12, 0.08]
+
+
+class TimelineProvider(MusicProvider):
+    """A pollable source playing its share of the user's seeded listening sessions."""
+
+    pollable = True
+    interval = INTERVAL
+
+    def __init__(self, name, sessions, clock):
+        self.name = name
+        self.sessions = [(start, end) for start, end, source in sessions if source == name]
+        self.starts = [start for start, _ in self.sessions]
+        self.clock = clock
+        self.calls = 0
+
+    def credentials(self, user_data):
+        return {}
+
+    def playing_at(self, now):
+        i = bisect_right(self.starts, now) - 1
+        return i >= 0 and now < self.sessions[i][1]
+
+    def poll(self, firebase_uid, credentials):
+        self.calls += 1
+        if not self.playing_at(self.clock[0]):
+            return None
+        return {'name': "Track", 'artist': "Artist", 'is_playing': True}
+
+
+def listening_day(rng, sources):
+    sessions = []
+    t = START + rng.uniform(0, 3600)
+    while t < START + DAY:
+        end = t + rng.uniform(600, 3 * 3600)
+        source = rng.choices(sources, SOURCE_WEIGHTS[:len(sources)])[0]
+        sessions.append((t, end, source))
+        t = end + rng.uniform(60, 4 * 3600)
+    return sessions
+
+
+def resolved(sources, user_data):
+    for name in sources:
+        track = user_data.get(f"last_{name}")
+        if track and track.get('is_playing') is not False:
+            return name
+    return None
+
+
+def truth(providers, now):
+    for provider in providers:
+        if provider.playing_at(now):
+            return provider.name
+    return None
+
+
+def run_user(rng, sources, scheduled):
+    sessions = listening_day(rng, sources)
+    clock = [START]
+    providers = [TimelineProvider(name, sessions, clock) for name in sources]
+    user_data = {'priority': {'list': ",".join(sources)}}
+
+    def store(source, song_data):
+        user_data[f"last_{source}"] = song_data
+
+    if scheduled:
+        scheduler = PollScheduler("user", {p.name: p for p in providers}, store)
+        due = START
+    else:
+        # One pull worker per source, each on its own 30 s cadence.
+        due = {p.name: START + rng.uniform(0, INTERVAL) for p in providers}
+
+    wrong = 0
+    for step in range(0, DAY, STEP):
+        now = clock[0] = START + step
+        if scheduled:
+            if now >= due:
+                due = now + scheduler.poll_once(user_data, now)
+        else:
+            for provider in providers:
+                if now >= due[provider.name]:
+                    song_data = provider.poll("user", {})
+                    store(provider.name, song_data or {'is_playing': False})
+                    due[provider.name] = now + INTERVAL
+        if resolved(sources, user_data) != truth(providers, now):
+            wrong += STEP
+    return sum(p.calls for p in providers), wrong
+
+
+def simulate(users, seed=0):
+    results = []
+    for count in range(1, len(SOURCES) + 1):
+        sources = SOURCES[:count]
+        row = [count]
+        for scheduled in (False, True):
+            rng = random.Random(seed)
+            calls = wrong = 0
+            for _ in range(users):
+                user_calls, user_wrong = run_user(rng, sources, scheduled)
+                calls += user_calls
+                wrong += user_wrong
+            row += [calls / users, wrong / 60 / users]
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"{users} users, one day, {INTERVAL}s poll interval; per user per day:")
+    print(f"  {'sources':>7}{'per-source calls':>18}{'wrong min':>11}{'scheduler calls':>17}{'wrong min':>11}{'saved':>8}")
+    for count, naive_calls, naive_wrong, calls, wrong in simulate(users):
+        print(f"  {count:>7}{naive_calls:>18.0f}{naive_wrong:>11.1f}{calls:>17.0f}{wrong:>11.1f}"
+              f"{(naive_calls - calls) / naive_calls * 100:>7.1f}%")
@@ -0,0 +1,70 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from schedule import SyncSchedule, PresenceMonitor, resume_at
+
+WEEK = 7 * 86400
+START = 1767571200  # Monday 2026-01-05 00:00 UTC
+SYNC_INTERVAL = 15
+PULL_INTERVAL = 30
+ZONES = ["UTC", "Europe/Paris", "America/New_York", "America/Los_Angeles", "Asia/Tokyo", "Asia/Kolkata"]
+
+
+def synthetic_user(rng):
+    if rng.random() < 0.2:
+        return None
+    return {
+        'tz': rng.choice(ZONES),
+        'days': [0, 1, 2, 3, 4] if rng.random() < 0.8 else [0, 1, 2, 3, 4, 5, 6],
+        'quiet_start': f"{rng.randint(17, 22)}:00",
+        'quiet_end': f"0{rng.randint(7, 9)}:30",
+        'presence': rng.random() < 0.5
+    }
+
+
+def simulate(users, seed=0):
+    """Upstream calls over one week: (always-on baseline, with schedules, presence lookups)."""
+    rng = random.Random(seed)
+    away = {}
+    presence = PresenceMonitor(
+        fetch_presence=lambda token, slack_user_id: 'away' if away[slack_user_id] else 'active',
+        fetch_dnd=lambda token, user_ids: {}
+    )
+    configs = [synthetic_user(rng) for _ in range(users)]
+    schedules = [SyncSchedule.from_user({'schedule': c}) if c else None for c in configs]
+    for uid, schedule in enumerate(schedules):
+        away[str(uid)] = False
+        if schedule and schedule.presence:
+            presence.watch(uid, "token", "T1", str(uid))
+
+    baseline = users * (WEEK // SYNC_INTERVAL + WEEK // PULL_INTERVAL)
+    calls = 0
+    # Walk the week in presence-sweep steps; within a step each user's
+    # loop either runs at its normal cadence or is parked.
+    step = int(presence.interval)
+    for t in range(START, START + WEEK, step):
+        for slack_user_id in away:
+            away[slack_user_id] = rng.random() < 0.3
+        presence.clock = lambda: t
+        presence.sweep()
+        for uid, schedule in enumerate(schedules):
+            now, end = t, t + step
+            while now < end:
+                until = resume_at(schedule, presence, uid, now)
+                if until is None:
+                    calls += (end - now) * (1 / SYNC_INTERVAL + 1 / PULL_INTERVAL)
+                    break
+                now = until
+    return baseline, round(calls), presence.calls
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    baseline, calls, presence_calls = simulate(users)
+    total = calls + presence_calls
+    print(f"{users} users over one week")
+    print(f"  always on:      {baseline} upstream calls")
+    print(f"  with schedules: {total} ({calls} sync/pull + {presence_calls} presence/DND)")
+    print(f"  reduction:      {100 * (1 - total / baseline):.1f}%")
@@ -0,0 +1,140 @@
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+from spotipy.exceptions import SpotifyException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import providers as providers_module
+from clock import VirtualClock, sync_clock
+from governor import RateGovernor
+from providers import SpotifyProvider, PollScheduler
+
+START = 1767600000
+DURATION = 3600
+# The fake Spotify app limit: requests per rolling 30 s window, as Spotify counts them.
+SERVER_RATE = 10
+WINDOW = 30
+PLAYING_SHARE = 0.3
+
+
+class TooManyRequests(SpotifyException):
+    def __init__(self, retry_after):
+        Exception.__init__(self, "429 Too Many Requests")
+        self.http_status = 429
+        self.headers = {'Retry-After': str(retry_after)}
+
+
+class FakeSpotify:
+    """Serves /me/player for every user and rejects calls beyond SERVER_RATE * WINDOW per window."""
+
+    def __init__(self, users, rng):
+        self.recent = deque()
+        self.calls = 0
+        self.rejected = 0
+        self.sessions = {}
+        for uid in users:
+            # Playing users listen for the whole run; the rest drop in for a while.
+            if rng.random() < PLAYING_SHARE:
+                self.sessions[uid] = [(START, START + DURATION)]
+            else:
+                start = START + rng.uniform(0, DURATION)
+                self.sessions[uid] = [(start, start + rng.uniform(60, 600))] if rng.random() < 0.3 else []
+
+    def playing(self, uid, now):
+        return any(start <= now < end for start, end in self.sessions[uid])
+
+    def fetch_playback(self, access_token, timeout=10):
+        now = sync_clock.time()
+        self.calls += 1
+        while self.recent and self.recent[0] <= now - WINDOW:
+            self.recent.popleft()
+        if len(self.recent) >= SERVER_RATE * WINDOW:
+            self.rejected += 1
+            raise TooManyRequests(math.ceil(self.recent[0] + WINDOW - now))
+        self.recent.append(now)
+        if not self.playing(access_token, now):
+            return None
+        track = SimpleNamespace(id="t", name="Track", artists=[SimpleNamespace(name="Artist")], duration_ms=240_000)
+        return SimpleNamespace(is_playing=True, progress_ms=0, item=track)
+
+
+def pull_loop(uid, user_data, scheduler, polls, server, offset):
+    """Same cadence as spotify_pull_worker, recording each successful poll."""
+    sync_clock.sleep(offset)
+    while True:
+        calls = scheduler.calls
+        delay = scheduler.poll_once(user_data, sync_clock.time())
+        if scheduler.calls > calls and not scheduler.failures.get('spotify'):
+            polls.append((sync_clock.time(), server.playing(uid, sync_clock.time())))
+        sync_clock.sleep(min(delay, 30))
+
+
+def jain(values):
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values)) if values else float('nan')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def simulate(users, governed, seed=0):
+    rng = random.Random(seed)
+    uids = [f"user-{i}" for i in range(users)]
+    server = FakeSpotify(uids, rng)
+    providers_module.fetch_playback = server.fetch_playback
+    clock = VirtualClock(start=START)
+    governor = RateGovernor(rate=SERVER_RATE, burst=SERVER_RATE, clock=clock.time) if governed else None
+    provider = SpotifyProvider(refresh=lambda uid, token: None, governor=governor)
+    previous = sync_clock.install(clock)
+    threading.stack_size(256 * 1024)
+    polls = {uid: [] for uid in uids}
+    try:
+        for uid in uids:
+            user_data = {'priority': {'list': 'spotify'}, 'spotify': {'access_token': uid}}
+            scheduler = PollScheduler(uid, {'spotify': provider}, lambda source, song_data: None)
+            clock.spawn(pull_loop, uid, user_data, scheduler, polls[uid], server, rng.uniform(0, 30))
+        started = time.perf_counter()
+        clock.run(START + DURATION)
+        elapsed = time.perf_counter() - started
+    finally:
+        sync_clock.install(previous)
+
+    playing_gaps, idle_gaps, playing_counts = [], [], []
+    for uid, user_polls in polls.items():
+        for (t0, playing), (t1, _) in zip(user_polls, user_polls[1:]):
+            (playing_gaps if playing else idle_gaps).append(t1 - t0)
+        if server.sessions[uid] and server.sessions[uid][0] == (START, START + DURATION):
+            playing_counts.append(len(user_polls))
+    return {
+        'users': users,
+        'mode': "governed" if governed else "ungoverned",
+        'calls': server.calls,
+        'rejected': server.rejected,
+        'playing_gap': percentile(playing_gaps, 0.5),
+        'playing_p99': percentile(playing_gaps, 0.99),
+        'idle_gap': percentile(idle_gaps, 0.5),
+        'fairness': jain(playing_counts),
+        # Playing users whose status was refreshed less than once every ten minutes.
+        'starved': sum(1 for count in playing_counts if count < DURATION / 600),
+        'seconds': round(elapsed, 1)
+    }
+
+
+if __name__ == "__main__":
+    logging.disable(logging.ERROR)
+    loads = [int(n) for n in sys.argv[1:]] or [200, 400, 800, 1600]
+    print(f"fake Spotify limit {SERVER_RATE} req/s over {WINDOW}s windows, {DURATION // 60} virtual minutes")
+    for users in loads:
+        for governed in (False, True):
+            r = simulate(users, governed)
+            print(f"{r['users']:>5} users {r['mode']:<11} calls {r['calls']:>6}  429s {r['rejected']:>6}  "
+                  f"poll gap playing p50 {r['playing_gap']:6.1f}s p99 {r['playing_p99']:6.1f}s  idle p50 {r['idle_gap']:6.1f}s  "
+                  f"fairness {r['fairness']:.3f} starved {r['starved']:>4}  [{r['seconds']}s]")
@@ -0,0 +1,160 @@
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from playback_state import PlaybackState, track_ends_at
+
+DAY = 86400
+START = 1767600000
+SYNC_INTERVAL = 15
+# Resolution at which Slack's status is compared with what is actually playing.
+STEP = 5
+PAUSE_RATE = 0.08
+# Share of sessions that end with the player stopped mid-track rather than after it.
+STOP_MID_TRACK = 0.5
+
+
+def listening_day(rng):
+    """(start, end, playing, name, duration, progress at start) segments; gaps are silence."""
+    segments = []
+    t = START + rng.uniform(0, 3600)
+    while t < START + DAY:
+        session_end = t + rng.uniform(600, 3 * 3600)
+        while t < session_end:
+            duration = rng.uniform(120, 360)
+            name = f"Artist {rng.randrange(500)} – Track {rng.randrange(5000)}"
+            played = 0.0
+            if rng.random() < PAUSE_RATE:
+                played = rng.uniform(10, duration - 10)
+                segments.append((t, t + played, True, name, duration, 0.0))
+                t += played
+                pause = rng.uniform(60, 1200)
+                segments.append((t, t + pause, False, name, duration, played))
+                t += pause
+            segments.append((t, t + duration - played, True, name, duration, played))
+            t += duration - played
+        if rng.random() < STOP_MID_TRACK:
+            start, end, playing, name, duration, progress = segments[-1]
+            cut = rng.uniform(start, end)
+            segments[-1] = (start, cut, playing, name, duration, progress)
+            t = cut
+        t += rng.uniform(1800, 6 * 3600)
+    return segments
+
+
+class Listener:
+    def __init__(self, segments):
+        self.segments = segments
+        self.position = 0
+
+    def at(self, now):
+        """The segment covering now, or None during silence."""
+        while self.position < len(self.segments) and self.segments[self.position][1] <= now:
+            self.position += 1
+        if self.position == len(self.segments) or self.segments[self.position][0] > now:
+            return None
+        return self.segments[self.position]
+
+
+class Slack:
+    def __init__(self):
+        self.text = None
+        self.expiration = 0
+        self.writes = 0
+
+    def set(self, text, expiration=0):
+        self.text = text
+        self.expiration = expiration
+        self.writes += 1
+
+    def shown(self, now):
+        if self.text and (not self.expiration or now < self.expiration):
+            return self.text
+        return None
+
+
+def pulled(segment, now, legacy_last):
+    """last_spotify as spotify_pull_worker stores it; the legacy worker never marked a stop."""
+    if segment is None or not segment[2]:
+        return legacy_last, {'is_playing': False, 'updated': datetime.fromtimestamp(now).isoformat()}
+    start, _, _, name, duration, progress = segment
+    track = {
+        'name': name,
+        'duration_ms': int(duration * 1000),
+        'progress_ms': int((progress + now - start) * 1000),
+        'is_playing': True,
+        'updated': datetime.fromtimestamp(now).isoformat()
+    }
+    return track, track
+
+
+def write_every_poll(slack, state, track, now):
+    """The original loop: rewrite whatever last_spotify holds, with no expiration."""
+    if track:
+        slack.set(track['name'])
+
+
+def clear_on_pause(slack, state, track, now):
+    """Writes on change and spends one more write to clear when playback stops."""
+    text = track['name'] if track and track.get('is_playing') is not False else None
+    if text != slack.text:
+        slack.set(text)
+
+
+def expire_at_track_end(slack, state, track, now):
+    """slack_sync_worker: PlaybackState decides, Slack clears at the expiration."""
+    if track and track.get('is_playing') is not False:
+        expiration = state.should_write(track['name'], track_ends_at(track), now)
+        if expiration is not None:
+            slack.set(track['name'], expiration)
+            state.written(track['name'], expiration)
+    else:
+        state.should_write(None, None, now)
+
+
+POLICIES = [
+    ("write every 15 s, no expiry", write_every_poll, True),
+    ("write on change, clear on stop", clear_on_pause, False),
+    ("expire at track end", expire_at_track_end, False),
+]
+
+
+def simulate(users, seed=0):
+    rng = random.Random(seed)
+    days = [listening_day(rng) for _ in range(users)]
+    offsets = [rng.randrange(0, SYNC_INTERVAL, STEP) for _ in range(users)]
+    results = {}
+    for label, policy, legacy in POLICIES:
+        writes = stale = missing = 0
+        for segments, offset in zip(days, offsets):
+            listener = Listener(segments)
+            slack = Slack()
+            state = PlaybackState()
+            track = None
+            for step in range(0, DAY, STEP):
+                now = START + step
+                segment = listener.at(now)
+                if step % SYNC_INTERVAL == offset:
+                    legacy_track, current = pulled(segment, now, track)
+                    track = legacy_track if legacy else current
+                    policy(slack, state, track, now)
+                playing = segment[3] if segment is not None and segment[2] else None
+                shown = slack.shown(now)
+                if shown and shown != playing:
+                    stale += STEP
+                elif playing and shown != playing:
+                    missing += STEP
+            writes += slack.writes
+        results[label] = (writes / users, stale / 60 / users, missing / 60 / users)
+    return results
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    results = simulate(users)
+    print(f"{users} users, one day, sync every {SYNC_INTERVAL}s; per user per day:")
+    print(f"  {'policy':<34}{'writes':>10}{'stale min':>12}{'missing min':>14}")
+    for label, (writes, stale, missing) in results.items():
+        print(f"  {label:<34}{writes:>10.0f}{stale:>12.1f}{missing:>14.1f}")
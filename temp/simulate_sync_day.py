@@ -0,0 +1,154 @@
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read when synclog is first imported, which the imports below already do.
+os.environ.setdefault('LOG_LEVEL', "ERROR")
+from bench_cold_start import service_account
+from clock import VirtualClock, sync_clock
+from leases import run_heartbeat
+from providers import MusicProvider
+
+DAY = 86400
+START = 1767600000
+
+
+class ListeningProvider(MusicProvider):
+    """Plays a seeded sequence of sessions and tracks per user, laid out on the virtual timeline."""
+
+    name = "spotify"
+    pollable = True
+
+    def __init__(self):
+        self.timelines = {}
+        self.positions = {}
+        self.calls = 0
+
+    def add_user(self, firebase_uid, rng):
+        timeline = []
+        t = START + rng.uniform(0, 3600)
+        while t < START + DAY:
+            session_end = t + rng.uniform(600, 3 * 3600)
+            while t < session_end:
+                duration = rng.uniform(120, 360)
+                timeline.append((t, t + duration, f"Track {rng.randrange(5000)}", f"Artist {rng.randrange(500)}"))
+                t += duration
+            t += rng.uniform(1800, 6 * 3600)
+        self.timelines[firebase_uid] = timeline
+        self.positions[firebase_uid] = 0
+
+    def credentials(self, user_data):
+        return {}
+
+    def poll(self, firebase_uid, credentials):
+        self.calls += 1
+        now = sync_clock.time()
+        timeline = self.timelines[firebase_uid]
+        position = self.positions[firebase_uid]
+        while position < len(timeline) and timeline[position][1] <= now:
+            position += 1
+        self.positions[firebase_uid] = position
+        if position == len(timeline) or timeline[position][0] > now:
+            return None
+        started, ends, name, artist = timeline[position]
+        return {
+            'name': name,
+            'artist': artist,
+            'duration_ms': int((ends - started) * 1000),
+            'progress_ms': int((now - started) * 1000),
+            'is_playing': True,
+            'updated': sync_clock.now().isoformat()
+        }
+
+
+class MemoryUserStore:
+    """UserStore over a dict; a field path selects its whole top-level field."""
+
+    def __init__(self):
+        self.users = {}
+        self.reads = 0
+        self.writes = 0
+
+    def get(self, firebase_uid, fields=None):
+        self.reads += 1
+        user = self.users.get(firebase_uid, {})
+        if fields is None:
+            return dict(user)
+        tops = {f.split('.')[0] for f in fields}
+        return {k: v for k, v in user.items() if k in tops}
+
+    def update(self, firebase_uid, data):
+        self.writes += 1
+        self.users.setdefault(firebase_uid, {}).update(data)
+
+
+class CountingDispatcher:
+    """Takes the place of the outbox: counts each queued status instead of sending it."""
+
+    def __init__(self):
+        self.writes = 0
+        self.digest = hashlib.sha256()
+
+    def submit(self, firebase_uid, sinks, status):
+        self.writes += 1
+        self.digest.update(f"{firebase_uid}|{sync_clock.time()}|{status['text']}|{status['expiration']}".encode())
+
+    def discard(self, firebase_uid):
+        return 0
+
+
+def simulate(app, users, seed=0):
+    """Runs app.py's own slack_sync_worker and spotify_pull_worker for users over one virtual day."""
+    rng = random.Random(seed)
+    clock = VirtualClock(start=START)
+    previous = sync_clock.install(clock)
+    store = app.user_store = MemoryUserStore()
+    dispatcher = app.outbox_dispatcher = CountingDispatcher()
+    spotify = ListeningProvider()
+    app.providers = {'spotify': spotify}
+    try:
+        clock.spawn(run_heartbeat, app.leases, app.adopt_session, lambda: True)
+        for i in range(users):
+            uid = f"sim-{seed}-{i}"
+            spotify.add_user(uid, rng)
+            store.users[uid] = {
+                'slack': {'access_token': "xoxp-sim", 'user_id': f"U{i}"},
+                'priority': {'list': "spotify"}
+            }
+            app.leases.acquire('spotify', uid)
+            app.launch_pull(uid)
+            app.leases.acquire('slack', uid)
+            app.launch_sync(uid)
+        started = time.perf_counter()
+        clock.run(START + DAY)
+        elapsed = time.perf_counter() - started
+    finally:
+        sync_clock.install(previous)
+    return {
+        'users': users,
+        'polls': spotify.calls,
+        'writes': dispatcher.writes,
+        'firestore reads': store.reads,
+        'firestore writes': store.writes,
+        'wakeups': clock.wakeups,
+        'seconds': round(elapsed, 2),
+        'us per wakeup': round(elapsed / clock.wakeups * 1_000_000, 1),
+        'digest': dispatcher.digest.hexdigest()[:16]
+    }
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update({
+            'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': service_account(directory),
+            'LEASE_DB_PATH': os.path.join(directory, "leases.db"),
+            'OUTBOX_DB_PATH': os.path.join(directory, "outbox.db")
+        })
+        import app
+
+        print(simulate(app, users))
@@ -0,0 +1,82 @@
+import logging
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from analytics import ListeningAnalytics
+from coalesce import UpdateCoalescer
+from reaper import Reaper, rss_bytes
+from sessions import SessionTable
+from snapshots import PlaybackSnapshots
+from synclog import UserRateLimitFilter
+from teamboard import TeamBoards
+
+CYCLES = 100_000
+DISTINCT_USERS = 100_000
+REAP_EVERY = 1_000
+IDLE_SECONDS = 60
+# Allowed RSS growth between the first checkpoint after warm-up and the end.
+MAX_GROWTH_MB = 8
+
+
+def soak(cycles=CYCLES):
+    now = [0.0]
+    clock = lambda: now[0]
+    sessions = SessionTable(clock)
+    coalescer = UpdateCoalescer(clock=clock)
+    snapshots = PlaybackSnapshots(clock=clock)
+    listening = ListeningAnalytics(clock=clock)
+    boards = TeamBoards(clock=clock)
+    rate_limit = UserRateLimitFilter()
+
+    def forget(uid):
+        coalescer.forget(uid, 'spotify')
+        snapshots.forget(uid)
+        boards.clear_user(uid)
+        rate_limit.forget(uid)
+
+    reaper = Reaper(sessions, forget_hooks=[forget, listening.forget],
+                    idle_seconds=IDLE_SECONDS, clock=clock)
+    checkpoints = []
+    for i in range(cycles):
+        uid = f"user-{i % DISTINCT_USERS}"
+        now[0] += 0.1
+
+        # Start: a worker thread that runs one loop iteration and exits, as on stop.
+        sync = sessions.ensure(uid)
+        sync.active = True
+        coalescer.offer(uid, 'spotify', (f"Track {i}", "Artist"), i)
+        snapshots.put(uid, None)
+        listening.record_play(uid, 'spotify', "Artist", f"Track {i}")
+        boards.update(f"team-{i % 50}", uid, uid, {'name': f"Track {i}", 'artist': "Artist"}, f"Track {i}")
+        rate_limit.filter(logging.makeLogRecord({'levelno': logging.WARNING, 'uid': uid}))
+        sync.thread = threading.Thread(target=lambda: None)
+        sync.thread.start()
+        sync.thread.join()
+        sync.last_update = now[0]
+
+        # Stop.
+        sync.active = False
+        boards.clear_user(uid)
+
+        if i % REAP_EVERY == 0:
+            reaper.reap()
+        if i % (cycles // 10) == 0:
+            checkpoints.append((i, rss_bytes() / 1024 / 1024, len(sessions)))
+
+    now[0] += IDLE_SECONDS + 1
+    reaper.reap()
+    checkpoints.append((cycles, rss_bytes() / 1024 / 1024, len(sessions)))
+    return checkpoints, reaper, len(rate_limit.buckets)
+
+
+if __name__ == "__main__":
+    checkpoints, reaper, log_buckets = soak()
+    for cycle, rss_mb, live in checkpoints:
+        print(f"cycle {cycle:>7}: rss {rss_mb:6.1f} MB, {live} sessions")
+    print(f"reaped {reaper.evicted} sessions, {log_buckets} log budgets left")
+    baseline = checkpoints[1][1]
+    growth = checkpoints[-1][1] - baseline
+    print(f"growth after warm-up: {growth:.1f} MB (limit {MAX_GROWTH_MB} MB)")
+    sys.exit(0 if growth <= MAX_GROWTH_MB and not log_buckets else 1)
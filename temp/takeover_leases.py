@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from leases import LeaseStore, run_heartbeat
+
+TTL = 2.0
+WRITE_INTERVAL = 0.1
+REPLICAS = 3
+SESSIONS_PER_REPLICA = 10
+# The worker for this session stops on its own, like a sync with no Slack token.
+SELF_EXIT = "r2-u0"
+
+
+def record(writes_path, uid, owner):
+    conn = sqlite3.connect(writes_path, timeout=10, isolation_level=None)
+    conn.execute('INSERT INTO writes VALUES (?, ?, ?)', (uid, owner, time.time()))
+    conn.close()
+
+
+def worker(store, writes_path, uid):
+    """Stands in for slack_sync_worker: writes while it owns the lease, releases it on the way out."""
+    started = time.time()
+    while store.owns('slack', uid):
+        record(writes_path, uid, store.owner)
+        if uid == SELF_EXIT and time.time() - started > TTL:
+            break
+        time.sleep(WRITE_INTERVAL)
+    store.release('slack', uid, only_own=True)
+
+
+def replica(lease_path, writes_path, owner, uids):
+    store = LeaseStore(lease_path, owner, ttl=TTL)
+
+    def spawn(kind, uid):
+        threading.Thread(target=worker, args=(store, writes_path, uid), daemon=True).start()
+
+    for uid in uids:
+        if store.acquire('slack', uid):
+            spawn('slack', uid)
+    run_heartbeat(store, spawn, lambda: True)
+
+
+def writes_since(writes_path, since):
+    conn = sqlite3.connect(writes_path, timeout=10)
+    rows = conn.execute('SELECT uid, owner, at FROM writes WHERE at >= ? ORDER BY at', (since,)).fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    lease_path = os.path.join(directory, "leases.db")
+    writes_path = os.path.join(directory, "writes.db")
+    sqlite3.connect(writes_path).execute('CREATE TABLE writes (uid TEXT, owner TEXT, at REAL)')
+    LeaseStore(lease_path, "setup", ttl=TTL)
+
+    uids = {f"r{r}": [f"r{r}-u{i}" for i in range(SESSIONS_PER_REPLICA)] for r in range(REPLICAS)}
+    processes = {owner: multiprocessing.Process(target=replica, args=(lease_path, writes_path, owner, owned), daemon=True)
+                 for owner, owned in uids.items()}
+    for process in processes.values():
+        process.start()
+    time.sleep(1.0)
+
+    controller = LeaseStore(lease_path, "controller", ttl=TTL)
+    failures = []
+
+    # 1. A stop request landing on a replica that does not own the session.
+    stopped = uids["r1"][0]
+    controller.release('slack', stopped)
+    released_at = time.time()
+    time.sleep(4 * WRITE_INTERVAL)
+    late = [row for row in writes_since(writes_path, released_at + 2 * WRITE_INTERVAL) if row[0] == stopped]
+    print(f"stop from another replica: {len(late)} writes after release")
+    if late:
+        failures.append("stopped session kept writing")
+
+    # 2. A worker that exits on its own leaves no lease behind.
+    time.sleep(TTL + 0.5)
+    exited = controller.acquire('slack', SELF_EXIT)
+    print(f"worker exited on its own: lease free for another replica: {exited}")
+    if not exited:
+        failures.append("self-exited worker kept its lease (409 everywhere)")
+    controller.release('slack', SELF_EXIT)
+
+    # 3. Kill a replica outright; survivors adopt its sessions.
+    os.kill(processes["r0"].pid, signal.SIGKILL)
+    killed_at = time.time()
+    time.sleep(3 * TTL)
+    takeover = {}
+    for uid, owner, at in writes_since(writes_path, killed_at):
+        if uid.startswith("r0-") and owner != "r0":
+            takeover.setdefault(uid, at - killed_at)
+    adopted = len(takeover)
+    worst = max(takeover.values(), default=float('nan'))
+    print(f"killed replica: {adopted}/{SESSIONS_PER_REPLICA} sessions adopted, "
+          f"worst takeover {worst:.2f}s (TTL {TTL}s, bound {TTL * 4 / 3 + WRITE_INTERVAL:.2f}s)")
+    if adopted != SESSIONS_PER_REPLICA or worst > TTL * 4 / 3 + 2 * WRITE_INTERVAL:
+        failures.append("orphans not adopted in time")
+
+    # No session has two live writers at once: within any write interval a uid has one owner.
+    rows = writes_since(writes_path, killed_at + TTL * 4 / 3 + 2 * WRITE_INTERVAL)
+    owners = {}
+    for uid, owner, _ in rows:
+        owners.setdefault(uid, set()).add(owner)
+    doubled = [uid for uid, seen in owners.items() if len(seen) > 1]
+    print(f"sessions with two writers after takeover: {len(doubled)}")
+    if doubled:
+        failures.append("double ownership")
+
+    for process in processes.values():
+        if process.is_alive():
+            process.kill()
+    print("FAIL: " + "; ".join(failures) if failures else "ok")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
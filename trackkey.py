@@ -0,0 +1,101 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+
+TRACK_KEY_CACHE = int(os.getenv("TRACK_KEY_CACHE", "65536"))
+
+# Bracketed or dash-separated suffixes that describe the upload, not the song.
+# A suffix is dropped only when it is made up entirely of these.
+DECORATION_WORD = (
+    r"(?:official|music video|lyric video|video|audio|lyrics?|visuali[sz]er|mv|hd|hq|4k|"
+    r"remaster(?:ed)?(?: \d{4})?|\d{4} remaster(?:ed)?|radio edit|single version|album version|"
+    r"explicit|clean|color coded|full album)"
+)
+DECORATION = re.compile(rf"{DECORATION_WORD}(?:\s*[,&/+]?\s*{DECORATION_WORD})*")
+# "(from A Star Is Born)": only in brackets, where it cannot be the title itself.
+SOUNDTRACK = re.compile(r"from\s+.+")
+# Tab titles gain a notification count or play marker in front.
+TAB_PREFIX = re.compile(r"^(?:\(\d+\)|[▶►])\s*")
+BRACKETS = re.compile(r"\s*[(\[【]([^)\]】]*)[)\]】]")
+DASH_SUFFIX = re.compile(r"\s+[-–—|]\s+([^-–—|]*)$")
+FEATURING = re.compile(r"(?:\s+(?:feat\.?|ft\.?|featuring)|\s*[(\[](?:feat\.?|ft\.?|featuring|with))\s+([^)\]]+)[)\]]?")
+ARTIST_SPLIT = re.compile(r"\s*(?:,|&|\band\b|\bx\b|\+|/|;|\bvs\.?)\s*")
+CHANNEL_SUFFIX = re.compile(r"(\s*-\s*topic|vevo|\s+official)$")
+TITLE_SEPARATOR = re.compile(r"\s+[-–—]\s+")
+
+
+def fold(text):
+    """Lowercase, strip accents and compatibility forms, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.casefold().replace("’", "'").replace("“", '"').replace("”", '"')
+    return " ".join(text.split())
+
+
+def strip_decorations(title, dashes=True):
+    """Drops bracketed and, with dashes, trailing " - ..." decorations."""
+    def bracket(match):
+        inner = match.group(1).strip()
+        return "" if DECORATION.fullmatch(inner) or SOUNDTRACK.fullmatch(inner) else match.group(0)
+
+    previous = None
+    while previous != title:
+        previous = title
+        title = BRACKETS.sub(bracket, title)
+        suffix = DASH_SUFFIX.search(title) if dashes else None
+        if suffix and DECORATION.fullmatch(suffix.group(1).strip()):
+            title = title[:suffix.start()]
+    return title.strip(" \"'")
+
+
+def split_artists(text):
+    return {a for a in (CHANNEL_SUFFIX.sub("", part).strip() for part in ARTIST_SPLIT.split(text)) if a}
+
+
+@lru_cache(maxsize=TRACK_KEY_CACHE)
+def track_key(artist, name):
+    """Stable identity for an (artist, title) pair across sources.
+
+    "Daft Punk, Pharrell Williams" / "Get Lucky - Radio Edit" and
+    "DaftPunkVEVO" / "Daft Punk - Get Lucky (Official Video) ft. Pharrell Williams"
+    give the same key. Returns a (sorted artists, title) tuple.
+    """
+    artist = fold(artist or "")
+    # Dash suffixes wait until "Artist - Title" is split off, so the title
+    # itself is never mistaken for one.
+    title = strip_decorations(TAB_PREFIX.sub("", fold(name or "")), dashes=False)
+
+    artists = set()
+    featured = FEATURING.search(title)
+    if featured:
+        artists |= split_artists(strip_decorations(featured.group(1)))
+        title = title[:featured.start()].strip()
+
+    # Video titles often carry "Artist - Title" while the artist field holds the channel.
+    parts = TITLE_SEPARATOR.split(title, maxsplit=1)
+    channel = CHANNEL_SUFFIX.sub("", artist).replace(" ", "")
+    if len(parts) == 2:
+        named = split_artists(parts[0])
+        if CHANNEL_SUFFIX.search(artist) or any(a.replace(" ", "") in channel or channel in a.replace(" ", "") for a in named):
+            artists |= named
+            title = parts[1]
+            artist = ""
+
+    if artist:
+        artists |= split_artists(artist)
+    title = strip_decorations(title)
+    return tuple(sorted(artists)), title
+
+
+def same_track(a, b):
+    """True when two track dicts with name/artist describe the same song."""
+    if not a or not b:
+        return False
+    return track_key(a.get('artist'), a.get('name')) == track_key(b.get('artist'), b.get('name'))
+
+
+def cache_stats():
+    info = track_key.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
@@ -0,0 +1,89 @@
+from startup import lazy_import
+
+firestore = lazy_import("firebase_admin.firestore")
+
+
+USERS = 'users'
+PLAYBACK = 'playback'
+# Set on playback/<uid> once no last_<source> field is left in users/<uid>.
+MIGRATED = 'migrated'
+
+
+def is_playback_field(path):
+    return path.startswith('last_')
+
+
+class UserStore:
+    """Reads and writes one user's data across the two Firestore documents.
+
+    users/<uid> holds the rarely changing profile, credentials and settings;
+    playback/<uid> holds the last_<source> tracks that change every poll.
+    fields are Firestore field paths and limit what is read from either side.
+
+    A user whose playback document has no migrated marker yet is moved over
+    on first read; after that a missing field is simply not set.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, firebase_uid, fields=None):
+        cold_fields = hot_fields = None
+        if fields is not None:
+            cold_fields = [f for f in fields if not is_playback_field(f)]
+            hot_fields = [f for f in fields if is_playback_field(f)]
+
+        data = {}
+        if cold_fields is None or cold_fields:
+            doc = self.db.collection(USERS).document(firebase_uid).get(field_paths=cold_fields)
+            if doc.exists:
+                data.update(doc.to_dict() or {})
+        if hot_fields is None or hot_fields:
+            paths = hot_fields + [MIGRATED] if hot_fields else None
+            doc = self.db.collection(PLAYBACK).document(firebase_uid).get(field_paths=paths)
+            hot = (doc.to_dict() or {}) if doc.exists else {}
+            if not hot.pop(MIGRATED, False):
+                hot = self.migrate(firebase_uid)
+                if hot_fields is not None:
+                    hot = {k: v for k, v in hot.items() if k in {f.split('.')[0] for f in hot_fields}}
+            data.update(hot)
+        return data
+
+    def migrate(self, firebase_uid):
+        """Moves the user's last_<source> fields into playback/<uid> and marks it migrated.
+
+        Tracks written to playback since the split are newer and are kept.
+        Returns the playback fields afterwards; {} when the user does not exist.
+        """
+        users_ref = self.db.collection(USERS).document(firebase_uid)
+        playback_ref = self.db.collection(PLAYBACK).document(firebase_uid)
+        user = users_ref.get()
+        if not user.exists:
+            return {}
+        legacy = {k: v for k, v in (user.to_dict() or {}).items() if is_playback_field(k)}
+
+        @firestore.transactional
+        def move(transaction):
+            doc = playback_ref.get(transaction=transaction)
+            current = (doc.to_dict() or {}) if doc.exists else {}
+            fresh = {k: v for k, v in legacy.items() if k not in current}
+            transaction.set(playback_ref, {**fresh, MIGRATED: True}, merge=True)
+            if legacy:
+                transaction.update(users_ref, {k: firestore.DELETE_FIELD for k in legacy})
+            current.pop(MIGRATED, None)
+            return {**current, **fresh}
+
+        return move(self.db.transaction())
+
+    def update(self, firebase_uid, data):
+        hot = {k: v for k, v in data.items() if is_playback_field(k)}
+        cold = {k: v for k, v in data.items() if not is_playback_field(k)}
+        if hot and cold:
+            batch = self.db.batch()
+            batch.set(self.db.collection(USERS).document(firebase_uid), cold, merge=True)
+            batch.set(self.db.collection(PLAYBACK).document(firebase_uid), hot, merge=True)
+            batch.commit()
+        elif hot:
+            self.db.collection(PLAYBACK).document(firebase_uid).set(hot, merge=True)
+        elif cold:
+            self.db.collection(USERS).document(firebase_uid).set(cold, merge=True)